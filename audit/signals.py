@@ -1,5 +1,5 @@
 # audit/signals.py
-from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, pre_migrate, post_migrate
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
@@ -27,6 +27,23 @@ AUDIT_EXCLUDE = set(getattr(settings, "AUDIT_EXCLUDE", {
 FIELDS_INCLUDE = getattr(settings, "AUDIT_FIELDS_INCLUDE", {})
 FIELDS_EXCLUDE = getattr(settings, "AUDIT_FIELDS_EXCLUDE", {})
 
+# Mientras corren migraciones (también al crear la BD de pruebas) no se
+# audita: el registro de migraciones y los RunPython guardan modelos antes
+# de que existan las tablas de contenttypes / auditoría.
+_migrating = False
+
+
+@receiver(pre_migrate, dispatch_uid="audit_pre_migrate", weak=False)
+def audit_pre_migrate(sender, **kwargs):
+    global _migrating
+    _migrating = True
+
+
+@receiver(post_migrate, dispatch_uid="audit_post_migrate", weak=False)
+def audit_post_migrate(sender, **kwargs):
+    global _migrating
+    _migrating = False
+
 # ============================================================
 # Helpers
 # ============================================================
@@ -56,6 +73,8 @@ def _label_for(instance):
 
 
 def _should_track(instance):
+    if _migrating:
+        return False
     label = _label_for(instance)
     if AUDIT_INCLUDE is not None:
     # solo lo que está en include
@@ -83,6 +102,30 @@ def _common_ctx():
         "user_agent": (req.META.get("HTTP_USER_AGENT") if req else "") or "",
     }
 
+def log_batch(instance, *, summary, changes=None, action="create"):
+    """
+    Una sola entrada de bitácora para una operación en lote sobre
+    `instance` (p.ej. los movimientos de una compra): bulk_create /
+    bulk_update no disparan pre/post_save. `instance` también puede ser
+    el modelo (p.ej. una importación de catálogo): sin object_id.
+    """
+    ctx = _common_ctx()
+    is_model = isinstance(instance, type)
+    return AuditLog.objects.create(
+        user=ctx["user"],
+        action=action,
+        summary=summary[:255],
+        content_type=ContentType.objects.get_for_model(instance, for_concrete_model=False),
+        object_id=None if is_model else str(instance.pk),
+        object_repr=str(instance._meta.verbose_name_plural if is_model else instance)[:255],
+        changes=to_jsonable(changes),
+        ip=ctx["ip"],
+        path=ctx["path"],
+        method=ctx["method"],
+        user_agent=ctx["user_agent"],
+        tags={"module": instance._meta.app_label, "batch": True},
+    )
+
 # ============================================================
 # pre_save
 # ============================================================
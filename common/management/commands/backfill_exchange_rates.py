@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from common.services.exchange_rate import (
+    PROVIDER,
+    BanxicoError,
+    fetch_usd_mxn_range,
+    load_usd_mxn_file,
+    save_usd_mxn_history,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga el histórico diario USD→MXN (Banxico SIE SF60653) en una sola consulta por rango. "
+        "Con --file usa una respuesta SIE guardada en disco (sin red)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="Fecha inicial YYYY-MM-DD (default: hace 365 días)")
+        parser.add_argument("--to", dest="date_to", help="Fecha final YYYY-MM-DD (default: hoy)")
+        parser.add_argument("--file", help="JSON con la respuesta de la API SIE (bmx -> series -> datos)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo muestra cuántos días se cargarían")
+
+    def _parse(self, value, default):
+        if not value:
+            return default
+        d = parse_date(value)
+        if not d:
+            raise CommandError(f"Fecha inválida: {value}")
+        return d
+
+    def handle(self, *args, **opts):
+        date_to = self._parse(opts["date_to"], date.today())
+        date_from = self._parse(opts["date_from"], date_to - timedelta(days=365))
+        if date_from > date_to:
+            raise CommandError("--from debe ser menor o igual a --to")
+
+        try:
+            if opts["file"]:
+                rows = load_usd_mxn_file(opts["file"], date_from, date_to)
+                provider = f"{PROVIDER} (archivo)"
+            else:
+                rows = fetch_usd_mxn_range(date_from, date_to)
+                provider = PROVIDER
+        except (BanxicoError, OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if not rows:
+            self.stdout.write(self.style.WARNING("Banxico no regresó datos para el rango."))
+            return
+
+        if opts["dry_run"]:
+            self.stdout.write(f"[dry-run] {len(rows)} días entre {rows[0][0]} y {rows[-1][0]}.")
+            return
+
+        n = save_usd_mxn_history(rows, provider=provider)
+        self.stdout.write(self.style.SUCCESS(f"{n} tipos de cambio guardados ({rows[0][0]} → {rows[-1][0]})."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from common.services.postal_codes import build_cp_lookup
+
+
+class Command(BaseCommand):
+    help = (
+        "Construye la tabla resumen de códigos postales (un renglón por CP) "
+        "a partir de django_postalcodes_mexico. Correr después de actualizar SEPOMEX."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Renglones por INSERT")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        total, deleted = build_cp_lookup(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} CP agregados, {deleted} obsoletos eliminados ({time.monotonic() - t0:.1f}s)."
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.models import SatCatalog
+from common.services.sat_catalogs import load_catalog_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga un catálogo SAT de Carta Porte desde el archivo oficial "
+        "(CSV exportado de la hoja correspondiente, o XLSX con openpyxl). "
+        "Ej: manage.py load_sat_catalog c_Colonia c_Colonia.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("catalog", choices=SatCatalog.values, help="Catálogo a cargar")
+        parser.add_argument("path", help="Ruta del archivo CSV/XLSX")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Renglones por INSERT")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        try:
+            total, deleted = load_catalog_file(opts["catalog"], opts["path"], batch_size=opts["batch_size"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{opts['catalog']}: {total} claves cargadas, {deleted} obsoletas eliminadas "
+            f"({time.monotonic() - t0:.1f}s). Reinicia los workers para refrescar la caché en memoria."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from common.services.exchange_rate import BanxicoError, refresh_usd_mxn
+
+
+class Command(BaseCommand):
+    help = (
+        "Consulta Banxico (SIE SF60653) y guarda el tipo de cambio USD→MXN del día. "
+        "Programar en cron antes del horario laboral, p.ej. `0 6 * * 1-5`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Consultar aunque Banxico ya se haya consultado hoy")
+        parser.add_argument("--timeout", type=int, default=15, help="Timeout HTTP en segundos")
+
+    def handle(self, *args, **opts):
+        try:
+            snap = refresh_usd_mxn(force=opts["force"], timeout=opts["timeout"])
+        except BanxicoError as e:
+            raise CommandError(str(e))
+
+        if snap.usd_mxn is None:
+            raise CommandError("No hay tipo de cambio disponible.")
+
+        msg = f"USD/MXN {snap.usd_mxn} ({snap.date:%Y-%m-%d}, {snap.provider})"
+        if snap.is_fresh:
+            self.stdout.write(self.style.SUCCESS(msg))
+        else:
+            self.stdout.write(self.style.WARNING(f"{msg} — otro proceso está refrescando; se muestra el último conocido."))
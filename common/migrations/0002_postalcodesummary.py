@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostalCodeSummary',
+            fields=[
+                ('cp', models.CharField(max_length=5, primary_key=True, serialize=False)),
+                ('estado_code', models.CharField(blank=True, max_length=2)),
+                ('municipio', models.CharField(blank=True, max_length=150)),
+                ('ciudad', models.CharField(blank=True, max_length=150)),
+                ('colonias', models.JSONField(blank=True, default=list)),
+                ('built_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen de código postal',
+                'verbose_name_plural': 'Resumen de códigos postales',
+            },
+        ),
+    ]
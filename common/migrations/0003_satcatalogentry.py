@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_postalcodesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SatCatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('catalog', models.CharField(choices=[('c_ClaveProdServCP', 'c_ClaveProdServCP (BienesTransp)'), ('c_ClaveUnidad', 'c_ClaveUnidad'), ('c_Estado', 'c_Estado'), ('c_Municipio', 'c_Municipio'), ('c_Localidad', 'c_Localidad'), ('c_Colonia', 'c_Colonia')], max_length=32)),
+                ('scope', models.CharField(blank=True, default='', max_length=10)),
+                ('clave', models.CharField(max_length=20)),
+                ('descripcion', models.CharField(blank=True, max_length=255)),
+                ('extra', models.CharField(blank=True, default='', max_length=50)),
+                ('loaded_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Entrada de catálogo SAT',
+                'verbose_name_plural': 'Catálogos SAT',
+                'constraints': [models.UniqueConstraint(fields=('catalog', 'scope', 'clave'), name='uniq_sat_catalog_scope_clave')],
+            },
+        ),
+    ]
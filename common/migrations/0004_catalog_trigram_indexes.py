@@ -0,0 +1,63 @@
+"""
+Índices de trigramas para la búsqueda de catálogos (common.services.catalog_search).
+
+Django genera UPPER(col::text) LIKE UPPER(...) para istartswith/icontains en
+PostgreSQL; un índice GIN gin_trgm_ops sobre esa misma expresión sirve para
+las dos búsquedas. En otros motores (SQLite en desarrollo) no hace nada.
+"""
+from django.db import migrations
+
+# (tabla, columna)
+TRIGRAM_COLUMNS = [
+    ("customers_client", "nombre"),
+    ("customers_client", "razon_social"),
+    ("customers_client", "rfc"),
+    ("goods_mercancia", "nombre"),
+    ("goods_mercancia", "clave"),
+    ("locations_location", "nombre"),
+    ("locations_route", "nombre"),
+    ("operators_operator", "nombre"),
+    ("operators_operator", "rfc"),
+    ("trucks_truck", "numero_economico"),
+    ("trucks_truck", "placas"),
+    ("trucks_reeferbox", "numero_economico"),
+    ("trucks_reeferbox", "placas"),
+]
+
+
+def _index_name(table, column):
+    return f"{table}_{column}_trgm"[:63]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{_index_name(table, column)}" '
+            f'ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{_index_name(table, column)}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0003_satcatalogentry"),
+        ("customers", "0004_alter_client_pais"),
+        ("goods", "0002_mercancia_moneda_mercancia_pedimento_and_more"),
+        ("locations", "0005_route_pago_transfer_propio_and_more"),
+        ("operators", "0009_operator_user"),
+        ("trucks", "0005_remove_reeferbox_nombre"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
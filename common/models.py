@@ -18,3 +18,61 @@ class ExchangeRate(models.Model):
 
 
 
+
+
+class PostalCodeSummary(models.Model):
+    """
+    Un renglón por CP, pre-agregado desde django_postalcodes_mexico
+    (comando build_cp_lookup). Lo usa lookup_cp: una lectura por PK.
+    """
+    cp = models.CharField(max_length=5, primary_key=True)
+    estado_code = models.CharField(max_length=2, blank=True)
+    municipio = models.CharField(max_length=150, blank=True)
+    ciudad = models.CharField(max_length=150, blank=True)
+    colonias = models.JSONField(default=list, blank=True)
+    built_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Resumen de código postal"
+        verbose_name_plural = "Resumen de códigos postales"
+
+    def __str__(self):
+        return f"{self.cp} {self.municipio}"
+
+
+class SatCatalog(models.TextChoices):
+    CLAVE_PROD_SERV_CP = "c_ClaveProdServCP", "c_ClaveProdServCP (BienesTransp)"
+    CLAVE_UNIDAD = "c_ClaveUnidad", "c_ClaveUnidad"
+    ESTADO = "c_Estado", "c_Estado"
+    MUNICIPIO = "c_Municipio", "c_Municipio"
+    LOCALIDAD = "c_Localidad", "c_Localidad"
+    COLONIA = "c_Colonia", "c_Colonia"
+
+
+class SatCatalogEntry(models.Model):
+    """
+    Catálogos SAT (Carta Porte / CFDI) en una sola tabla.
+    - scope: llave del padre cuando la clave no es única por sí sola
+      (c_Colonia -> CP, c_Municipio/c_Localidad -> estado, c_Estado -> país).
+    - extra: columna adicional útil (p.ej. "Material peligroso" en c_ClaveProdServCP).
+    Se carga con el comando load_sat_catalog.
+    """
+    catalog = models.CharField(max_length=32, choices=SatCatalog.choices)
+    scope = models.CharField(max_length=10, blank=True, default="")
+    clave = models.CharField(max_length=20)
+    descripcion = models.CharField(max_length=255, blank=True)
+    extra = models.CharField(max_length=50, blank=True, default="")
+    loaded_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Entrada de catálogo SAT"
+        verbose_name_plural = "Catálogos SAT"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["catalog", "scope", "clave"],
+                name="uniq_sat_catalog_scope_clave",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.catalog} {self.scope + '/' if self.scope else ''}{self.clave} {self.descripcion}"
@@ -1,55 +1,261 @@
 # common/pdf.py
+import io
+import itertools
+import multiprocessing
 import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
 from django.conf import settings
 from django.http import HttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML, default_url_fetcher
+from weasyprint import CSS, HTML, default_url_fetcher
 
 
-def _local_path_from_url(url: str) -> str | None:
+def _local_path_from_url(url: str, conf: dict | None = None) -> str | None:
+    conf = conf or _fetcher_conf()
+
     # /media/...
-    if url.startswith(settings.MEDIA_URL):
-        return os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+    if url.startswith(conf["media_url"]):
+        return os.path.join(conf["media_root"], url[len(conf["media_url"]):])
 
     # /static/...
-    if url.startswith(settings.STATIC_URL):
-        rel = url[len(settings.STATIC_URL):]
+    if url.startswith(conf["static_url"]):
+        rel = url[len(conf["static_url"]):]
 
-        static_root = getattr(settings, "STATIC_ROOT", None)
+        static_root = conf["static_root"]
         if static_root:
             p = os.path.join(static_root, rel)
             if os.path.exists(p):
                 return p
 
-        for d in getattr(settings, "STATICFILES_DIRS", []):
-            p = os.path.join(str(d), rel)
+        for d in conf["static_dirs"]:
+            p = os.path.join(d, rel)
             if os.path.exists(p):
                 return p
 
     return None
 
 
-def render_pdf(request, template_name: str, context: dict, filename: str = "document.pdf") -> HttpResponse:
-    html_str = render_to_string(template_name, context)
+def _fetcher_conf() -> dict:
+    """
+    Rutas de media/static como dict plano (picklable) para poder
+    resolver URLs también dentro de los procesos del pool.
+    """
+    static_root = getattr(settings, "STATIC_ROOT", None)
+    return {
+        "media_url": settings.MEDIA_URL,
+        "media_root": str(settings.MEDIA_ROOT),
+        "static_url": settings.STATIC_URL,
+        "static_root": str(static_root) if static_root else "",
+        "static_dirs": [str(d) for d in getattr(settings, "STATICFILES_DIRS", [])],
+    }
 
-    base_url = request.build_absolute_uri("/")
+
+def _make_url_fetcher(base_url: str, conf: dict | None = None):
+    conf = conf or _fetcher_conf()
 
     def url_fetcher(url: str):
         # si llega absoluto http://localhost/static/... -> /static/...
         if url.startswith(base_url):
             url = url[len(base_url) - 1:]  # deja "/" inicial
 
-        p = _local_path_from_url(url)
+        p = _local_path_from_url(url, conf)
         if p and os.path.exists(p):
             # IMPORTANTE: delegar al default fetcher usando file://
             return default_url_fetcher(Path(p).resolve().as_uri())
 
         return default_url_fetcher(url)
 
-    pdf_bytes = HTML(string=html_str, base_url=base_url, url_fetcher=url_fetcher).write_pdf()
+    return url_fetcher
+
+
+def render_pdf(
+    request,
+    template_name: str,
+    context: dict,
+    filename: str = "document.pdf",
+    stylesheets: list[str] | None = None,
+) -> HttpResponse:
+    html_str = render_to_string(template_name, context)
+
+    base_url = request.build_absolute_uri("/")
+    url_fetcher = _make_url_fetcher(base_url)
+
+    css = [CSS(filename=p, url_fetcher=url_fetcher) for p in (stylesheets or [])]
+    pdf_bytes = HTML(string=html_str, base_url=base_url, url_fetcher=url_fetcher).write_pdf(stylesheets=css)
 
     resp = HttpResponse(pdf_bytes, content_type="application/pdf")
     resp["Content-Disposition"] = f'inline; filename="{filename}"'
     return resp
+
+
+# ============================================================
+# Render en lote (pool de procesos)
+# ============================================================
+
+# Estado por proceso del pool: se llena una sola vez en el initializer
+_worker_state: dict = {}
+
+
+def _batch_worker_init(base_url: str, conf: dict, stylesheets: list[str]):
+    url_fetcher = _make_url_fetcher(base_url, conf)
+    _worker_state["base_url"] = base_url
+    _worker_state["url_fetcher"] = url_fetcher
+    # Hoja de estilos compartida: se parsea una vez por worker, no por documento
+    _worker_state["stylesheets"] = [CSS(filename=p, url_fetcher=url_fetcher) for p in stylesheets]
+
+
+def _batch_worker_render(job: tuple[str, str]) -> tuple[str, bytes]:
+    filename, html_str = job
+    pdf_bytes = HTML(
+        string=html_str,
+        base_url=_worker_state["base_url"],
+        url_fetcher=_worker_state["url_fetcher"],
+    ).write_pdf(stylesheets=_worker_state["stylesheets"])
+    return filename, pdf_bytes
+
+
+def _render_in_process(jobs, base_url: str, conf: dict, stylesheets: list[str]):
+    """Lotes chicos: mismo render que los workers, sin levantar el pool."""
+    url_fetcher = _make_url_fetcher(base_url, conf)
+    css = [CSS(filename=p, url_fetcher=url_fetcher) for p in stylesheets]
+    for filename, html_str in jobs:
+        yield filename, HTML(string=html_str, base_url=base_url, url_fetcher=url_fetcher).write_pdf(stylesheets=css)
+
+
+def _batch_pool_threshold() -> int:
+    return int(getattr(settings, "PDF_BATCH_POOL_MIN_JOBS", 20) or 0)
+
+
+def _batch_max_workers(n_jobs: int | None, max_workers: int | None) -> int:
+    limit = max_workers or int(getattr(settings, "PDF_BATCH_MAX_WORKERS", 0) or 0) or (os.cpu_count() or 1)
+    if n_jobs is None:
+        return max(1, limit)
+    return max(1, min(limit, n_jobs))
+
+
+def iter_pdf_batch(
+    jobs,
+    *,
+    base_url: str,
+    stylesheets: list[str] | None = None,
+    max_workers: int | None = None,
+):
+    """
+    Renderiza en paralelo (filename, html) y va devolviendo
+    (filename, pdf_bytes) conforme terminan (el orden NO está garantizado).
+
+    `jobs` puede ser lista o generador: se consume de forma perezosa con a lo
+    más 2×workers documentos en vuelo, así que el HTML no se arma todo de golpe.
+
+    El HTML se arma en el proceso principal (necesita ORM/templates);
+    en los workers solo corre WeasyPrint.
+
+    Hasta settings.PDF_BATCH_POOL_MIN_JOBS documentos se renderizan en el
+    mismo proceso: arrancar workers spawn (importar Django y WeasyPrint,
+    parsear el CSS) cuesta más que lo que ahorra el paralelismo.
+    """
+    n_jobs = len(jobs) if hasattr(jobs, "__len__") else None
+    if n_jobs == 0:
+        return
+
+    conf = _fetcher_conf()
+    stylesheets = [str(p) for p in (stylesheets or [])]
+
+    jobs_iter = iter(jobs)
+    threshold = _batch_pool_threshold()
+    head = list(itertools.islice(jobs_iter, threshold + 1))
+    if not head:
+        return
+    if len(head) <= threshold:
+        yield from _render_in_process(head, base_url, conf, stylesheets)
+        return
+
+    jobs_iter = itertools.chain(head, jobs_iter)
+    first = next(jobs_iter)
+    workers = _batch_max_workers(n_jobs, max_workers)
+    window = workers * 2
+
+    # spawn: no heredamos conexiones a BD ni hilos del worker web
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_batch_worker_init,
+        initargs=(base_url, conf, stylesheets),
+    ) as pool:
+        pending = {pool.submit(_batch_worker_render, first)}
+        exhausted = False
+        while pending:
+            while not exhausted and len(pending) < window:
+                job = next(jobs_iter, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_batch_worker_render, job))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+
+
+def render_pdf_batch(
+    jobs: list[tuple[str, str]],
+    *,
+    base_url: str,
+    stylesheets: list[str] | None = None,
+    max_workers: int | None = None,
+) -> list[tuple[str, bytes]]:
+    """Igual que iter_pdf_batch, pero respeta el orden de `jobs`."""
+    results = dict(iter_pdf_batch(jobs, base_url=base_url, stylesheets=stylesheets, max_workers=max_workers))
+    return [(filename, results[filename]) for filename, _ in jobs]
+
+
+def merge_pdfs(pdfs: list[bytes]) -> bytes:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for pdf_bytes in pdfs:
+        writer.append(io.BytesIO(pdf_bytes))
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Buffer no-seekable: zipfile escribe aquí y nosotros vaciamos en cada yield."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries):
+    """
+    Genera un ZIP al vuelo a partir de un iterable de (filename, bytes).
+    Pensado para StreamingHttpResponse: nunca se arma el ZIP completo en memoria.
+    """
+    buf = _ZipStreamBuffer()
+    with zipfile.ZipFile(buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for filename, data in entries:
+            zf.writestr(filename, data)
+            chunk = buf.pop()
+            if chunk:
+                yield chunk
+    chunk = buf.pop()
+    if chunk:
+        yield chunk
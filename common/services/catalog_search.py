@@ -0,0 +1,204 @@
+# common/services/catalog_search.py
+"""
+Búsqueda paginada de catálogos para los selects tipo typeahead
+(clientes, mercancías, rutas, operadores, unidades y cajas).
+
+- Cada catálogo declara sus columnas de búsqueda, las columnas que se leen
+  (.values(): no se instancian modelos) y los filtros por parámetro.
+- Coincidencia: cada palabra de la búsqueda debe aparecer en alguna de las
+  columnas (icontains); las que empiezan con la primera palabra van primero.
+- En PostgreSQL esas columnas tienen índices GIN de trigramas sobre UPPER()
+  (migración common 0004), que es justo la expresión que genera Django
+  para istartswith/icontains, así que ninguna búsqueda recorre la tabla.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.apps import apps
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, QuerySet, Value, When
+
+from operators.models import CrossBorderCapability
+
+PAGE_SIZE = 20
+MAX_PAGE = 50
+MAX_QUERY_LEN = 60
+
+# Estados de OT que ya no bloquean asignar la unidad/caja a un viaje
+OT_NON_BLOCKING = ("TERMINADA", "CANCELADA")
+
+
+def without_blocking_orders(qs: QuerySet, field_name: str) -> QuerySet:
+    """Excluye camiones/cajas con una orden de taller abierta."""
+    WorkshopOrder = apps.get_model("workshop", "WorkshopOrder")
+    blocking = (
+        WorkshopOrder.objects
+        .filter(deleted=False, **{field_name: OuterRef("pk")})
+        .exclude(estado__in=OT_NON_BLOCKING)
+    )
+    return qs.annotate(has_blocking_ot=Exists(blocking)).filter(has_blocking_ot=False)
+
+
+def _flag(params, name: str) -> bool:
+    return (params.get(name) or "").strip().lower() in ("1", "true", "si", "sí")
+
+
+# ======================================================
+# Definición de catálogos
+# ======================================================
+@dataclass(frozen=True)
+class Catalog:
+    model: str
+    search_fields: tuple
+    values: tuple
+    ordering: tuple
+    label: Callable[[dict], str]
+    sub: Optional[Callable[[dict], str]] = None
+    data: Optional[Callable[[dict], dict]] = None
+    scope: Optional[Callable[[QuerySet, dict], QuerySet]] = None
+    base_filter: dict = field(default_factory=lambda: {"deleted": False})
+
+    def queryset(self, params) -> QuerySet:
+        qs = apps.get_model(self.model)._default_manager.filter(**self.base_filter)
+        if self.scope:
+            qs = self.scope(qs, params)
+        return qs
+
+
+def _routes_scope(qs, params):
+    client = (params.get("client") or "").strip()
+    if client.isdigit():
+        return qs.filter(client_id=int(client))
+    if "client" in params:
+        return qs.none()  # la ruta depende del cliente: sin cliente, sin rutas
+    return qs
+
+
+def _operators_scope(qs, params):
+    if _flag(params, "cruce"):
+        # mismos operadores que TripForm permite como transfer
+        qs = qs.filter(
+            status="ALTA",
+            cross_border__in=[CrossBorderCapability.PUEDE, CrossBorderCapability.SOLO_CRUCE],
+        )
+    return qs
+
+
+def _units_scope(field_name):
+    def scope(qs, params):
+        if _flag(params, "libres"):
+            qs = without_blocking_orders(qs, field_name)
+        return qs
+    return scope
+
+
+CATALOGS: dict[str, Catalog] = {
+    "clients": Catalog(
+        model="customers.Client",
+        search_fields=("nombre", "razon_social", "rfc"),
+        values=("id", "nombre", "rfc"),
+        ordering=("nombre", "id"),
+        label=lambda r: r["nombre"],
+        sub=lambda r: r["rfc"] or "",
+    ),
+    "mercancias": Catalog(
+        model="goods.Mercancia",
+        search_fields=("nombre", "clave"),
+        values=("id", "nombre", "clave", "fraccion_arancelaria", "comercio_exterior_uuid"),
+        ordering=("nombre", "id"),
+        label=lambda r: r["nombre"],
+        sub=lambda r: r["clave"] or "",
+        data=lambda r: {
+            "clave": r["clave"] or "",
+            "fraccion": r["fraccion_arancelaria"] or "",
+            "uuidce": str(r["comercio_exterior_uuid"]) if r["comercio_exterior_uuid"] else "",
+        },
+    ),
+    "routes": Catalog(
+        model="locations.Route",
+        search_fields=("origen__nombre", "destino__nombre", "nombre"),
+        values=("id", "origen__nombre", "destino__nombre", "client_id"),
+        ordering=("origen__nombre", "destino__nombre", "id"),
+        label=lambda r: f"{r['origen__nombre']} → {r['destino__nombre']}",
+        data=lambda r: {"client": r["client_id"]},
+        scope=_routes_scope,
+    ),
+    "operators": Catalog(
+        model="operators.Operator",
+        search_fields=("nombre", "rfc"),
+        values=("id", "nombre", "rfc"),
+        ordering=("nombre", "id"),
+        label=lambda r: r["nombre"],
+        sub=lambda r: r["rfc"] or "",
+        scope=_operators_scope,
+    ),
+    "units": Catalog(
+        model="trucks.Truck",
+        search_fields=("numero_economico", "placas"),
+        values=("id", "numero_economico", "placas"),
+        ordering=("numero_economico", "id"),
+        label=lambda r: f"{r['numero_economico']} ({r['placas']})",
+        scope=_units_scope("truck"),
+    ),
+    "boxes": Catalog(
+        model="trucks.ReeferBox",
+        search_fields=("numero_economico", "placas"),
+        values=("id", "numero_economico", "placas"),
+        ordering=("numero_economico", "id"),
+        label=lambda r: f"{r['numero_economico']} ({r['placas'] or 'sin placas'})",
+        scope=_units_scope("reefer_box"),
+    ),
+}
+
+
+# ======================================================
+# Búsqueda
+# ======================================================
+def _terms(q: str) -> list[str]:
+    return (q or "").strip()[:MAX_QUERY_LEN].split()
+
+
+def search(name: str, q: str = "", page: int = 1, params=None) -> dict:
+    """
+    Una página de resultados: {"results": [...], "page": n, "more": bool}.
+    Cada resultado trae id, label y, si aplica, sub (texto secundario) y
+    data (atributos data-* que el widget copia a la <option>).
+    Lanza KeyError si el catálogo no existe.
+    """
+    catalog = CATALOGS[name]
+    params = params or {}
+    page = max(1, min(int(page or 1), MAX_PAGE))
+
+    qs = catalog.queryset(params)
+    terms = _terms(q)
+    ordering = catalog.ordering
+    if terms:
+        for term in terms:
+            match = Q()
+            for f in catalog.search_fields:
+                match |= Q(**{f"{f}__icontains": term})
+            qs = qs.filter(match)
+
+        prefix = Q()
+        for f in catalog.search_fields:
+            prefix |= Q(**{f"{f}__istartswith": terms[0]})
+        qs = qs.annotate(
+            match_rank=Case(When(prefix, then=Value(0)), default=Value(1), output_field=IntegerField())
+        )
+        ordering = ("match_rank",) + ordering
+
+    offset = (page - 1) * PAGE_SIZE
+    rows = list(qs.order_by(*ordering).values(*catalog.values)[offset:offset + PAGE_SIZE + 1])
+    more = len(rows) > PAGE_SIZE
+
+    results = []
+    for r in rows[:PAGE_SIZE]:
+        item = {"id": r["id"], "label": catalog.label(r)}
+        if catalog.sub:
+            item["sub"] = catalog.sub(r)
+        if catalog.data:
+            item["data"] = catalog.data(r)
+        results.append(item)
+
+    return {"results": results, "page": page, "more": more}
@@ -0,0 +1,393 @@
+# common/services/exchange_rate.py
+"""
+Tipo de cambio USD→MXN (Banxico SIE, serie SF60653).
+
+- get_usd_mxn(): lectura para requests. NUNCA sale a la red: usa la caché del
+  proceso y, si no hay, la BD. Si hoy todavía no se consultó Banxico regresa
+  el último conocido (stale) y dispara un refresh en segundo plano.
+- refresh_usd_mxn(): consulta Banxico y guarda el valor del día. Es lo que
+  corre el comando `refresh_exchange_rate` (cron antes del horario laboral).
+- fetch_usd_mxn_range() / save_usd_mxn_history(): histórico diario en una
+  sola consulta por rango (comando `backfill_exchange_rates`).
+- usd_mxn_subquery() / rates_for_dates() / convert_rows_to_mxn(): conversión
+  en lote para reportes usando el día hábil previo más cercano.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+import json
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Optional
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from common.models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = "banxico.org.mx (SIE SF60653)"
+BANXICO_SERIES = "SF60653"
+BANXICO_BASE_URL = "https://www.banxico.org.mx/SieAPIRest/service/v1"
+
+# Lock compartido (si hay caché compartida) para que solo un proceso refresque
+REFRESH_LOCK_KEY = "exchange_rate:usd_mxn:refresh"
+
+
+class BanxicoError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    usd_mxn: Optional[Decimal]
+    date: Optional[date]
+    provider: str
+    checked_on: Optional[date] = None   # día en que se consultó Banxico
+
+    @property
+    def is_fresh(self) -> bool:
+        # fresco = el último dato publicado ya se trajo hoy; en fin de semana o
+        # feriado `date` es el día hábil previo y no se compara contra hoy
+        return self.checked_on is not None and self.checked_on >= timezone.localdate()
+
+
+# ============================================================
+# Caché por proceso
+# ============================================================
+
+_cache_lock = threading.Lock()      # protege _cached
+_refresh_lock = threading.Lock()    # single-flight dentro del proceso
+_cached: dict = {"snapshot": None, "loaded_at": 0.0, "last_attempt": None}
+
+# Si Banxico falla, no reintentar en cada request
+RETRY_AFTER_SECONDS = 300
+
+
+def _ttl_seconds() -> int:
+    return int(getattr(settings, "EXCHANGE_RATE_CACHE_SECONDS", 600))
+
+
+def _set_cached(snapshot: RateSnapshot) -> None:
+    with _cache_lock:
+        _cached["snapshot"] = snapshot
+        _cached["loaded_at"] = time.monotonic()
+
+
+def _get_cached() -> Optional[RateSnapshot]:
+    with _cache_lock:
+        snap = _cached["snapshot"]
+        if snap is None:
+            return None
+        if time.monotonic() - _cached["loaded_at"] > _ttl_seconds():
+            return None
+        return snap
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cached["snapshot"] = None
+        _cached["loaded_at"] = 0.0
+
+
+def _snapshot_from_db() -> RateSnapshot:
+    row = ExchangeRate.objects.order_by("-date").only("date", "usd_mxn", "provider", "fetched_at").first()
+    if not row:
+        return RateSnapshot(usd_mxn=None, date=None, provider=PROVIDER)
+    return RateSnapshot(
+        usd_mxn=row.usd_mxn,
+        date=row.date,
+        provider=row.provider,
+        checked_on=timezone.localdate(row.fetched_at) if row.fetched_at else None,
+    )
+
+
+# ============================================================
+# Banxico
+# ============================================================
+
+def _banxico_token() -> str:
+    token = getattr(settings, "BANXICO_SIE_TOKEN", None)
+    if not token:
+        raise BanxicoError("BANXICO_SIE_TOKEN not configured")
+    return token
+
+
+def _banxico_get(path: str, *, session: Optional[requests.Session] = None, timeout: int = 8) -> list[dict]:
+    """GET a la API SIE; regresa la lista `datos` de la primera serie."""
+    http = session or requests
+    url = f"{getattr(settings, 'BANXICO_SIE_BASE_URL', BANXICO_BASE_URL).rstrip('/')}/{path.lstrip('/')}"
+    headers = {"Bmx-Token": _banxico_token(), "Accept": "application/json"}
+
+    try:
+        r = http.get(url, headers=headers, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+    except (requests.RequestException, ValueError) as e:
+        raise BanxicoError(f"Banxico request failed: {e}") from e
+
+    # Navegar estructura: bmx -> series[0] -> datos[]
+    series = (data.get("bmx") or {}).get("series") or []
+    if not series:
+        raise BanxicoError("No 'series' in Banxico response")
+    return series[0].get("datos") or []
+
+
+def _parse_dato(item: dict) -> tuple[Optional[date], Optional[Decimal]]:
+    """Banxico manda fecha dd/mm/yyyy y el dato como string (o 'N/E')."""
+    try:
+        d = datetime.strptime((item.get("fecha") or "").strip(), "%d/%m/%Y").date()
+    except ValueError:
+        d = None
+    try:
+        v = Decimal((item.get("dato") or "").replace(",", "").strip())
+    except InvalidOperation:
+        v = None
+    return d, v
+
+
+def fetch_latest_usd_mxn(*, timeout: int = 8) -> tuple[date, Decimal]:
+    """Último dato publicado y SU fecha (fines de semana / feriados: el día hábil previo)."""
+    datos = _banxico_get(f"series/{BANXICO_SERIES}/datos/oportuno", timeout=timeout)
+    if not datos:
+        raise BanxicoError("No 'datos' in Banxico response")
+    day, value = _parse_dato(datos[0])
+    if value is None:
+        raise BanxicoError("No 'dato' in Banxico response")
+    if day is None:
+        raise BanxicoError("No 'fecha' in Banxico response")
+    return day, value
+
+
+def _rows_from_datos(datos: list[dict]) -> list[tuple[date, Decimal]]:
+    rows = []
+    for item in datos:
+        d, v = _parse_dato(item)
+        if d is not None and v is not None:  # 'N/E' (sin dato) se omite
+            rows.append((d, v))
+    rows.sort()
+    return rows
+
+
+def fetch_usd_mxn_range(start: date, end: date, *, timeout: int = 30) -> list[tuple[date, Decimal]]:
+    """Histórico diario [start, end] en UNA consulta a la API SIE."""
+    datos = _banxico_get(
+        f"series/{BANXICO_SERIES}/datos/{start:%Y-%m-%d}/{end:%Y-%m-%d}",
+        timeout=timeout,
+    )
+    return _rows_from_datos(datos)
+
+
+def load_usd_mxn_file(path: str, start: Optional[date] = None, end: Optional[date] = None) -> list[tuple[date, Decimal]]:
+    """
+    Stand-in local de fetch_usd_mxn_range: lee una respuesta SIE guardada
+    (mismo JSON bmx -> series -> datos). Útil para pruebas y ambientes sin red.
+    """
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    series = (data.get("bmx") or {}).get("series") or []
+    rows = _rows_from_datos(series[0].get("datos") or []) if series else []
+    return [(d, v) for d, v in rows if (start is None or d >= start) and (end is None or d <= end)]
+
+
+# ============================================================
+# Refresh (single-flight)
+# ============================================================
+
+def _save_rate(day: date, value: Decimal, provider: str = PROVIDER) -> None:
+    # fetched_at marca la consulta (aunque Banxico repita el dato del viernes)
+    now = timezone.now()
+    # unique=True en date: si otro proceso ganó la carrera, actualizamos
+    try:
+        with transaction.atomic():
+            ExchangeRate.objects.update_or_create(
+                date=day, defaults={"usd_mxn": value, "provider": provider, "fetched_at": now}
+            )
+    except IntegrityError:
+        ExchangeRate.objects.filter(date=day).update(usd_mxn=value, provider=provider, fetched_at=now)
+
+
+def save_usd_mxn_history(rows: Iterable[tuple[date, Decimal]], provider: str = PROVIDER, batch_size: int = 500) -> int:
+    """Upsert masivo por fecha (un INSERT ... ON CONFLICT por lote)."""
+    objs = [ExchangeRate(date=d, usd_mxn=v, provider=provider) for d, v in rows]
+    if not objs:
+        return 0
+    ExchangeRate.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["date"],
+        update_fields=["usd_mxn", "provider"],
+    )
+    return len(objs)
+
+
+def refresh_usd_mxn(*, force: bool = False, timeout: int = 8) -> RateSnapshot:
+    """
+    Trae el último tipo de cambio publicado y lo guarda bajo su fecha de
+    publicación (en fin de semana sigue siendo el del viernes); queda fresco
+    el resto del día porque se consultó hoy. Solo un refresh a la vez:
+    si ya hay uno en curso (en este proceso o, con caché compartida, en otro),
+    regresa lo que haya en BD sin salir a la red.
+    """
+    if not force:
+        current = _snapshot_from_db()
+        if current.is_fresh:
+            _set_cached(current)
+            return current
+
+    if not _refresh_lock.acquire(blocking=False):
+        return _get_cached() or _snapshot_from_db()
+
+    lock_ttl = timeout * 2 + 5
+    try:
+        if not cache.add(REFRESH_LOCK_KEY, "1", timeout=lock_ttl):
+            return _get_cached() or _snapshot_from_db()
+        try:
+            # se guarda con la fecha de Banxico, igual que el histórico
+            day, value = fetch_latest_usd_mxn(timeout=timeout)
+            _save_rate(day, value)
+        finally:
+            cache.delete(REFRESH_LOCK_KEY)
+    finally:
+        _refresh_lock.release()
+
+    snapshot = _snapshot_from_db()
+    _set_cached(snapshot)
+    return snapshot
+
+
+def _background_refresh() -> None:
+    try:
+        refresh_usd_mxn()
+    except Exception:
+        logger.warning("No se pudo refrescar el tipo de cambio", exc_info=True)
+    finally:
+        # el hilo abrió su propia conexión; no dejarla colgada
+        connections.close_all()
+
+
+def _refresh_in_background() -> None:
+    with _cache_lock:
+        now = time.monotonic()
+        last = _cached["last_attempt"]
+        if _refresh_lock.locked() or (last is not None and now - last < RETRY_AFTER_SECONDS):
+            return
+        _cached["last_attempt"] = now
+    threading.Thread(target=_background_refresh, name="usd-mxn-refresh", daemon=True).start()
+
+
+# ============================================================
+# Lectura para requests (no bloquea en red)
+# ============================================================
+
+def get_usd_mxn() -> RateSnapshot:
+    snapshot = _get_cached()
+    if snapshot is None:
+        snapshot = _snapshot_from_db()
+        _set_cached(snapshot)
+
+    # stale-while-revalidate: se sirve el último valor y se refresca aparte
+    if not snapshot.is_fresh:
+        _refresh_in_background()
+
+    return snapshot
+
+
+# ============================================================
+# Conversión en lote (reportes)
+# ============================================================
+
+# Fines de semana / feriados: cuántos días hacia atrás buscar como máximo
+MAX_RATE_LOOKBACK_DAYS = 10
+
+
+def usd_mxn_subquery(date_ref: str):
+    """
+    Subquery con el tipo de cambio del día (o el día hábil previo más cercano)
+    para `date_ref`, p.ej.:
+
+        CartaPorteCFDI.objects.annotate(usd_mxn=usd_mxn_subquery("fecha_salida__date"))
+    """
+    return Subquery(
+        ExchangeRate.objects
+        .filter(date__lte=OuterRef(date_ref))
+        .order_by("-date")
+        .values("usd_mxn")[:1]
+    )
+
+
+def rates_for_dates(dates: Iterable[date]) -> dict[date, Optional[Decimal]]:
+    """
+    {fecha: tipo de cambio del día hábil previo más cercano} con UNA query
+    para todo el rango, en lugar de una búsqueda por renglón.
+    """
+    wanted = sorted({d.date() if isinstance(d, datetime) else d for d in dates if d})
+    if not wanted:
+        return {}
+
+    history = list(
+        ExchangeRate.objects
+        .filter(date__gte=wanted[0] - timedelta(days=MAX_RATE_LOOKBACK_DAYS), date__lte=wanted[-1])
+        .order_by("date")
+        .values_list("date", "usd_mxn")
+    )
+    days = [d for d, _ in history]
+
+    out: dict[date, Optional[Decimal]] = {}
+    for d in wanted:
+        i = bisect_right(days, d)
+        if i and (d - days[i - 1]).days <= MAX_RATE_LOOKBACK_DAYS:
+            out[d] = history[i - 1][1]
+        else:
+            out[d] = None
+    return out
+
+
+def convert_rows_to_mxn(
+    rows: list[dict],
+    *,
+    date_key: str,
+    amount_key: str,
+    currency_key: str = "currency",
+    rate_key: Optional[str] = None,
+    out_key: str = "amount_mxn",
+) -> list[dict]:
+    """
+    Agrega `out_key` (importe en MXN) y `usd_mxn` a cada renglón.
+
+    Si el renglón trae su propio tipo de cambio (`rate_key`, p.ej. el
+    exchange_rate capturado en la carta porte) se respeta; si no, se usa el
+    del día hábil previo. Sin tipo de cambio disponible -> `out_key` = None.
+    """
+    usd_dates = [
+        r.get(date_key) for r in rows
+        if (r.get(currency_key) or "MXN").upper() == "USD" and not (rate_key and r.get(rate_key))
+    ]
+    rates = rates_for_dates(usd_dates)
+
+    for r in rows:
+        amount = r.get(amount_key)
+        currency = (r.get(currency_key) or "MXN").upper()
+        if amount is None or currency == "MXN":
+            r["usd_mxn"] = None
+            r[out_key] = amount
+            continue
+
+        rate = r.get(rate_key) if rate_key else None
+        if not rate and currency == "USD":
+            d = r.get(date_key)
+            rate = rates.get(d.date() if isinstance(d, datetime) else d)
+
+        r["usd_mxn"] = rate
+        r[out_key] = (Decimal(amount) * rate).quantize(Decimal("0.01")) if rate else None
+    return rows
@@ -0,0 +1,159 @@
+# common/services/postal_codes.py
+"""
+Consulta de CP (SEPOMEX) para los formularios de clientes, operadores,
+proveedores y ubicaciones.
+
+La tabla de django_postalcodes_mexico tiene un renglón por asentamiento;
+aquí se pre-agrega a un renglón por CP en common.PostalCodeSummary
+(comando build_cp_lookup) para que lookup_cp sea una lectura por PK.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from django.utils import timezone
+
+from django_postalcodes_mexico.models import PostalCode as PC  # type: ignore
+
+from common.models import PostalCodeSummary
+
+SEPOMEX_STATES = {
+    "01":"Aguascalientes","02":"Baja California","03":"Baja California Sur","04":"Campeche",
+    "05":"Coahuila de Zaragoza","06":"Colima","07":"Chiapas","08":"Chihuahua","09":"Ciudad de México",
+    "10":"Durango","11":"Guanajuato","12":"Guerrero","13":"Hidalgo","14":"Jalisco","15":"México",
+    "16":"Michoacán de Ocampo","17":"Morelos","18":"Nayarit","19":"Nuevo León","20":"Oaxaca",
+    "21":"Puebla","22":"Querétaro","23":"Quintana Roo","24":"San Luis Potosí","25":"Sinaloa",
+    "26":"Sonora","27":"Tabasco","28":"Tamaulipas","29":"Tlaxcala","30":"Veracruz de Ignacio de la Llave",
+    "31":"Yucatán","32":"Zacatecas",
+}
+
+
+def _as_payload(s: PostalCodeSummary) -> dict:
+    return {
+        "estado": SEPOMEX_STATES.get(s.estado_code, ""),
+        "estado_code": s.estado_code,
+        "municipio": s.municipio,
+        "ciudad": s.ciudad,
+        "colonias": list(s.colonias or []),
+    }
+
+
+# ============================================================
+# Agregación (un CP -> un renglón)
+# ============================================================
+
+class _Acc:
+    __slots__ = ("estado_code", "municipios", "ciudades", "colonias")
+
+    def __init__(self, estado_code: str):
+        self.estado_code = estado_code
+        self.municipios: set[str] = set()
+        self.ciudades: set[str] = set()
+        self.colonias: set[str] = set()
+
+    def add(self, mun, ciu, col):
+        mun, ciu, col = (mun or "").strip(), (ciu or "").strip(), (col or "").strip()
+        if mun:
+            self.municipios.add(mun)
+        if ciu:
+            self.ciudades.add(ciu)
+        if col:
+            self.colonias.add(col)
+
+    def to_summary(self, cp: str, built_at) -> PostalCodeSummary:
+        municipio = min(self.municipios) if self.municipios else ""
+        ciudad = min(self.ciudades) if self.ciudades else ""
+        return PostalCodeSummary(
+            cp=cp,
+            estado_code=self.estado_code,
+            # fallback si SEPOMEX trae D_mnpio vacío
+            municipio=municipio or ciudad,
+            ciudad=ciudad,
+            colonias=sorted(self.colonias),
+            built_at=built_at,
+        )
+
+
+def iter_cp_summaries(cp: Optional[str] = None, *, chunk_size: int = 5000):
+    """Recorre SEPOMEX ordenado por CP (un solo query en streaming) y agrega por CP."""
+    built_at = timezone.now()
+    qs = PC.objects.all()
+    if cp:
+        qs = qs.filter(d_codigo=cp)
+    rows = (
+        qs.order_by("d_codigo")
+          .values_list("d_codigo", "c_estado", "D_mnpio", "d_ciudad", "d_asenta")
+          .iterator(chunk_size=chunk_size)
+    )
+
+    current_cp, acc = None, None
+    for d_codigo, c_estado, mun, ciu, col in rows:
+        d_codigo = (d_codigo or "").strip()
+        if not d_codigo:
+            continue
+        if d_codigo != current_cp:
+            if acc is not None:
+                yield acc.to_summary(current_cp, built_at)
+            current_cp, acc = d_codigo, _Acc((c_estado or "").strip().zfill(2))
+        acc.add(mun, ciu, col)
+
+    if acc is not None:
+        yield acc.to_summary(current_cp, built_at)
+
+
+def build_cp_lookup(*, batch_size: int = 2000) -> tuple[int, int]:
+    """
+    (Re)construye PostalCodeSummary. Upsert por lotes y al final se
+    borran los CP que ya no existen en SEPOMEX. Regresa (upserts, borrados).
+    """
+    started = timezone.now()
+    batch: list[PostalCodeSummary] = []
+    total = 0
+
+    def flush():
+        PostalCodeSummary.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["cp"],
+            update_fields=["estado_code", "municipio", "ciudad", "colonias", "built_at"],
+        )
+
+    for summary in iter_cp_summaries():
+        batch.append(summary)
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    if batch:
+        flush()
+        total += len(batch)
+
+    deleted, _ = PostalCodeSummary.objects.filter(built_at__lt=started).delete()
+    return total, deleted
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _lookup_cp_live(cp: str) -> Optional[dict]:
+    """Cálculo directo contra SEPOMEX (tabla resumen aún no construida)."""
+    summary = next(iter_cp_summaries(cp), None)
+    if summary is None:
+        return None
+    # se guarda para que la siguiente consulta ya sea por PK
+    PostalCodeSummary.objects.bulk_create(
+        [summary],
+        update_conflicts=True,
+        unique_fields=["cp"],
+        update_fields=["estado_code", "municipio", "ciudad", "colonias", "built_at"],
+    )
+    return _as_payload(summary)
+
+
+def lookup_cp(cp: str) -> Optional[dict]:
+    """dict con estado/municipio/ciudad/colonias, o None si el CP no existe."""
+    summary = PostalCodeSummary.objects.filter(pk=cp).first()
+    if summary is not None:
+        return _as_payload(summary)
+    return _lookup_cp_live(cp)
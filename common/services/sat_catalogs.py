@@ -0,0 +1,278 @@
+# common/services/sat_catalogs.py
+"""
+Catálogos SAT para Carta Porte (c_ClaveProdServCP, c_ClaveUnidad, c_Estado,
+c_Municipio, c_Localidad, c_Colonia).
+
+- load_catalog_file(): carga el archivo oficial (CSV exportado de la hoja
+  del SAT, o XLSX si openpyxl está instalado) con bulk_create por lotes.
+- get_catalog(): vista en memoria, compacta y de solo lectura, que se carga
+  de forma perezosa una vez por proceso. Claves ordenadas + bisect (sin
+  dicts de 100k+ entradas) y strings internadas (muchas colonias/municipios
+  repiten nombre).
+
+Si un catálogo no se ha cargado, las consultas regresan vacío / None y los
+llamadores usan su comportamiento anterior.
+"""
+from __future__ import annotations
+
+import csv
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional
+
+from django.utils import timezone
+
+from common.models import SatCatalog, SatCatalogEntry
+
+# separador scope|clave (menor que cualquier caracter imprimible)
+_SEP = "\x1f"
+
+
+def _norm(text: str) -> str:
+    """minúsculas, sin acentos ni espacios extra (para comparar nombres)."""
+    t = unicodedata.normalize("NFKD", (text or "").strip().lower())
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return " ".join(t.split())
+
+
+# ============================================================
+# Especificación de columnas por catálogo (encabezados del SAT)
+# ============================================================
+
+# catalog -> (col clave, col scope | None, col descripción, col extra | None)
+CATALOG_COLUMNS = {
+    SatCatalog.CLAVE_PROD_SERV_CP: ("c_ClaveProdServCP", None, "Descripción", "Material peligroso"),
+    SatCatalog.CLAVE_UNIDAD: ("c_ClaveUnidad", None, "Nombre", None),
+    SatCatalog.ESTADO: ("c_Estado", "c_Pais", "Nombre del estado", None),
+    SatCatalog.MUNICIPIO: ("c_Municipio", "c_Estado", "Descripción", None),
+    SatCatalog.LOCALIDAD: ("c_Localidad", "c_Estado", "Descripción", None),
+    SatCatalog.COLONIA: ("c_Colonia", "c_CodigoPostal", "Nombre del asentamiento", None),
+}
+
+
+# ============================================================
+# Carga (archivo -> BD)
+# ============================================================
+
+def _read_rows(path: str) -> Iterator[list[str]]:
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as e:
+            raise ValueError("Para leer XLSX instala openpyxl o exporta la hoja a CSV.") from e
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield ["" if v is None else str(v) for v in row]
+        finally:
+            wb.close()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as fh:
+        yield from csv.reader(fh)
+
+
+def iter_catalog_file(catalog: str, path: str) -> Iterator[tuple[str, str, str, str]]:
+    """
+    (scope, clave, descripcion, extra) por renglón. Los archivos del SAT traen
+    renglones de título antes del encabezado: se busca la fila que contiene
+    la columna de la clave.
+    """
+    clave_col, scope_col, desc_col, extra_col = CATALOG_COLUMNS[catalog]
+    rows = _read_rows(path)
+
+    idx = None
+    for row in rows:
+        header = [_norm(c) for c in row]
+        if _norm(clave_col) in header:
+            def col(name):
+                n = _norm(name) if name else None
+                return header.index(n) if n in header else None
+            idx = (col(clave_col), col(scope_col), col(desc_col), col(extra_col))
+            break
+    if idx is None:
+        raise ValueError(f"No se encontró la columna '{clave_col}' en {path}")
+
+    i_clave, i_scope, i_desc, i_extra = idx
+
+    def cell(row, i):
+        return (row[i] if i is not None and i < len(row) else "").strip()
+
+    for row in rows:
+        clave = cell(row, i_clave)
+        if not clave:
+            continue
+        yield cell(row, i_scope), clave, cell(row, i_desc), cell(row, i_extra)
+
+
+def load_catalog_rows(catalog: str, rows: Iterable[tuple[str, str, str, str]], *, batch_size: int = 5000) -> tuple[int, int]:
+    """
+    Upsert por lotes (INSERT ... ON CONFLICT) y al final se eliminan las
+    claves que ya no vienen en el archivo. Regresa (cargados, eliminados).
+    """
+    started = timezone.now()
+    batch: list[SatCatalogEntry] = []
+    total = 0
+
+    def flush():
+        SatCatalogEntry.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["catalog", "scope", "clave"],
+            update_fields=["descripcion", "extra", "loaded_at"],
+        )
+
+    for scope, clave, desc, extra in rows:
+        batch.append(SatCatalogEntry(
+            catalog=catalog,
+            scope=scope[:10],
+            clave=clave[:20],
+            descripcion=desc[:255],
+            extra=extra[:50],
+            loaded_at=started,
+        ))
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    if batch:
+        flush()
+        total += len(batch)
+
+    deleted, _ = SatCatalogEntry.objects.filter(catalog=catalog, loaded_at__lt=started).delete()
+    clear_cache(catalog)
+    return total, deleted
+
+
+def load_catalog_file(catalog: str, path: str, *, batch_size: int = 5000) -> tuple[int, int]:
+    return load_catalog_rows(catalog, iter_catalog_file(catalog, path), batch_size=batch_size)
+
+
+# ============================================================
+# Vista en memoria
+# ============================================================
+
+class CompactCatalog:
+    """Arreglos paralelos ordenados por 'scope<SEP>clave'; búsqueda con bisect."""
+
+    __slots__ = ("name", "_keys", "_descs", "_extras", "_by_name")
+
+    def __init__(self, name: str, rows: Iterable[tuple[str, str, str, str]]):
+        data = sorted(
+            (f"{scope}{_SEP}{clave}", sys.intern(desc), sys.intern(extra))
+            for scope, clave, desc, extra in rows
+        )
+        self.name = name
+        self._keys = [k for k, _, _ in data]
+        self._descs = [d for _, d, _ in data]
+        self._extras = [e for _, _, e in data]
+        self._by_name: Optional[dict] = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _index(self, clave: str, scope: str = "") -> Optional[int]:
+        key = f"{(scope or '').strip()}{_SEP}{(clave or '').strip()}"
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+
+    def __contains__(self, clave) -> bool:
+        return self._index(clave) is not None
+
+    def exists(self, clave: str, scope: str = "") -> bool:
+        return self._index(clave, scope) is not None
+
+    def description(self, clave: str, scope: str = "") -> str:
+        i = self._index(clave, scope)
+        return self._descs[i] if i is not None else ""
+
+    def extra(self, clave: str, scope: str = "") -> str:
+        i = self._index(clave, scope)
+        return self._extras[i] if i is not None else ""
+
+    def in_scope(self, scope: str) -> list[tuple[str, str]]:
+        """[(clave, descripcion)] de un scope (p.ej. colonias de un CP)."""
+        prefix = f"{(scope or '').strip()}{_SEP}"
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix[:-1] + chr(ord(_SEP) + 1))
+        cut = len(prefix)
+        return [(self._keys[i][cut:], self._descs[i]) for i in range(lo, hi)]
+
+    def clave_by_description(self, text: str, scope: str = "") -> str:
+        """Clave cuyo nombre coincide (sin acentos/mayúsculas) dentro del scope."""
+        n = _norm(text)
+        if not n:
+            return ""
+        if scope:
+            for clave, desc in self.in_scope(scope):
+                if _norm(desc) == n:
+                    return clave
+            return ""
+        if self._by_name is None:
+            by_name = {}
+            for k, d in zip(self._keys, self._descs):
+                by_name.setdefault(_norm(d), k.split(_SEP, 1)[1])
+            self._by_name = by_name
+        return self._by_name.get(n, "")
+
+
+_lock = threading.Lock()
+_catalogs: dict[str, CompactCatalog] = {}
+
+
+def get_catalog(catalog: str) -> CompactCatalog:
+    cat = _catalogs.get(catalog)
+    if cat is not None:
+        return cat
+    with _lock:
+        cat = _catalogs.get(catalog)
+        if cat is None:
+            rows = (
+                SatCatalogEntry.objects
+                .filter(catalog=catalog)
+                .values_list("scope", "clave", "descripcion", "extra")
+                .iterator(chunk_size=10000)
+            )
+            cat = CompactCatalog(catalog, rows)
+            _catalogs[catalog] = cat
+    return cat
+
+
+def clear_cache(catalog: Optional[str] = None) -> None:
+    with _lock:
+        if catalog:
+            _catalogs.pop(catalog, None)
+        else:
+            _catalogs.clear()
+
+
+def is_loaded(catalog: str) -> bool:
+    return len(get_catalog(catalog)) > 0
+
+
+# ============================================================
+# Helpers para payloads / formularios
+# ============================================================
+
+def estado_clave(value: str, *, pais: str = "MEX") -> str:
+    """Clave c_Estado a partir de la clave o del nombre ('Jalisco' -> 'JAL')."""
+    v = (value or "").strip()
+    if not v:
+        return ""
+    cat = get_catalog(SatCatalog.ESTADO)
+    if cat.exists(v.upper(), pais):
+        return v.upper()
+    return cat.clave_by_description(v, pais)
+
+
+def colonias_for_cp(cp: str) -> list[tuple[str, str]]:
+    return get_catalog(SatCatalog.COLONIA).in_scope(cp)
+
+
+def material_peligroso(clave_prod_serv: str) -> str:
+    """'0', '1' o '0,1' según c_ClaveProdServCP ('' si no está en catálogo)."""
+    return get_catalog(SatCatalog.CLAVE_PROD_SERV_CP).extra(clave_prod_serv)
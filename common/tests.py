@@ -1,3 +1,33 @@
+import datetime as dt
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from common.models import ExchangeRate
+from common.services import exchange_rate
+
+
+# ======================================================
+# Tipo de cambio USD→MXN
+# ======================================================
+class ExchangeRateFreshnessTests(TestCase):
+    def setUp(self):
+        exchange_rate.clear_cache()
+        self.friday = timezone.localdate() - dt.timedelta(days=2)
+
+    def test_previous_business_day_rate_is_fresh_once_checked_today(self):
+        latest = (self.friday, Decimal("18.2500"))
+        with mock.patch.object(exchange_rate, "fetch_latest_usd_mxn", return_value=latest) as fetch:
+            snapshot = exchange_rate.refresh_usd_mxn()
+            self.assertEqual(snapshot.date, self.friday)
+            self.assertTrue(snapshot.is_fresh)
+
+            exchange_rate.refresh_usd_mxn()
+            self.assertEqual(fetch.call_count, 1)
 
-# Create your tests here.
+    def test_rate_checked_on_an_earlier_day_is_stale(self):
+        ExchangeRate.objects.create(date=self.friday, usd_mxn=Decimal("18.2500"))
+        ExchangeRate.objects.update(fetched_at=timezone.now() - dt.timedelta(days=2))
+        self.assertFalse(exchange_rate._snapshot_from_db().is_fresh)
@@ -0,0 +1,83 @@
+# common/widgets.py
+from urllib.parse import urlencode
+
+from django import forms
+from django.forms.models import ModelChoiceIterator, ModelChoiceIteratorValue
+from django.urls import reverse
+
+
+class TypeaheadSelect(forms.Select):
+    """
+    <select> que solo renderiza la opción vacía y la(s) seleccionada(s); las
+    demás se buscan con static/js/typeahead.js contra /api/catalogs/<catalog>/.
+    El campo sigue siendo un ModelChoiceField normal (valida contra su
+    queryset), así que el HTML no crece con el catálogo.
+
+    - params: filtros fijos para el endpoint (p.ej. {"libres": 1}).
+    - depends: {"param": "id del input"}; el valor de ese input se manda en
+      cada búsqueda y, si cambia, se limpia la selección (ruta <- cliente).
+    - instances: {pk: obj} ya cargados (select_related) para no consultar
+      la opción seleccionada.
+    """
+
+    def __init__(self, catalog, attrs=None, *, params=None, depends=None):
+        super().__init__(attrs)
+        self.catalog = catalog
+        self.params = dict(params or {})
+        self.depends = dict(depends or {})
+        self.instances = {}
+
+    def __deepcopy__(self, memo):
+        obj = super().__deepcopy__(memo)
+        obj.params = self.params.copy()
+        obj.depends = self.depends.copy()
+        obj.instances = {}
+        return obj
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        widget_attrs = context["widget"]["attrs"]
+        widget_attrs["data-typeahead-url"] = reverse("catalog_lookup", args=[self.catalog])
+        if self.params:
+            widget_attrs["data-typeahead-params"] = urlencode(self.params)
+        if self.depends:
+            widget_attrs["data-typeahead-depends"] = urlencode(self.depends)
+        return context
+
+    def _selected_choices(self, values):
+        choices = self.choices
+        if not isinstance(choices, ModelChoiceIterator):
+            return [(v, label) for v, label in choices if str(v) in values]
+
+        field = choices.field
+        out = []
+        if field.empty_label is not None:
+            out.append(("", field.empty_label))
+
+        pks = [v for v in values if v]
+        found = {str(pk): obj for pk, obj in self.instances.items() if str(pk) in pks}
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            try:
+                for obj in choices.queryset.filter(pk__in=missing):
+                    found[str(obj.pk)] = obj
+            except (ValueError, TypeError):
+                pass  # valor basura en un POST inválido: no hay nada que mostrar
+
+        for pk in pks:
+            obj = found.get(pk)
+            if obj is not None:
+                out.append((ModelChoiceIteratorValue(field.prepare_value(obj), obj), field.label_from_instance(obj)))
+        return out
+
+    def optgroups(self, name, value, attrs=None):
+        values = {str(v) for v in value if v is not None}
+        groups = []
+        for index, (option_value, option_label) in enumerate(self._selected_choices(values)):
+            if option_value is None:
+                option_value = ""
+            selected = str(option_value) in values
+            groups.append((None, [self.create_option(
+                name, option_value, option_label, selected, index, attrs=attrs,
+            )], index))
+        return groups
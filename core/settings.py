@@ -34,6 +34,8 @@ BANXICO_SIE_TOKEN = os.getenv(
     "BANXICO_SIE_TOKEN",
     "ac2bdbef4b2aaa29af891d4619537a50f2dd88b107587ba8bcd221e33eac3b7b",
 )
+# Caché por proceso del tipo de cambio (segundos)
+EXCHANGE_RATE_CACHE_SECONDS = int(os.getenv("EXCHANGE_RATE_CACHE_SECONDS", "600"))
 # ==== Apps ====
 INSTALLED_APPS = [
     # Django
@@ -133,7 +135,7 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 # Audit (Bitacora)
-AUDIT_EXCLUDE = {"audit.AuditLog", "contenttypes.ContentType", "sessions.Session", "common.ExchangeRate"}
+AUDIT_EXCLUDE = {"audit.AuditLog", "contenttypes.ContentType", "sessions.Session", "common.ExchangeRate", "common.PostalCodeSummary", "common.SatCatalogEntry", "trips.FacturapiWebhookEvent", "trips.CartaPorteRouteTemplate", "trips.CartaPorteSnapshot", "warehouse.SparePartCostLayer", "warehouse.InventoryCheckpoint"}
 AUDIT_FIELDS_EXCLUDE = {
     "auth.User": ["password"],
 }
@@ -220,13 +222,34 @@ LOGGING = {
     },
 }
 
+# PDFs por lote (liquidaciones): 0 = usar os.cpu_count()
+PDF_BATCH_MAX_WORKERS = int(os.getenv("PDF_BATCH_MAX_WORKERS", "0"))
+# Lotes de hasta N PDFs se renderizan en el mismo proceso (sin pool)
+PDF_BATCH_POOL_MIN_JOBS = int(os.getenv("PDF_BATCH_POOL_MIN_JOBS", "20"))
+
 FACTURAPI_API_KEY = os.getenv("FACTURAPI_API_KEY", "")
 FACTURAPI_BASE_URL = os.getenv("FACTURAPI_BASE_URL", "https://www.facturapi.io/v2")
 FACTURAPI_TIMEOUT_SECONDS = int(os.getenv("FACTURAPI_TIMEOUT_SECONDS", "30"))
 
+# Webhooks de Facturapi: secreto para validar la firma (Facturapi-Signature)
+FACTURAPI_WEBHOOK_SECRET = os.getenv("FACTURAPI_WEBHOOK_SECRET", "")
+FACTURAPI_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("FACTURAPI_WEBHOOK_MAX_ATTEMPTS", "5"))
+FACTURAPI_WEBHOOK_RETRY_SECONDS = int(os.getenv("FACTURAPI_WEBHOOK_RETRY_SECONDS", "30"))  # carta aún sin confirmar
+
 # Defaults para “producto/servicio” si aún no guardas claves SAT en tu modelo Item
 FACTURAPI_DEFAULT_PRODUCT_KEY = os.getenv("FACTURAPI_DEFAULT_PRODUCT_KEY", "78101800")  # transporte/flete (ajústalo)
 FACTURAPI_DEFAULT_UNIT_KEY = os.getenv("FACTURAPI_DEFAULT_UNIT_KEY", "E48")             # servicio :contentReference[oaicite:1]{index=1}
 
+# Export masivo de CFDI: descargas simultáneas de XML y caché local
+CFDI_EXPORT_MAX_WORKERS = int(os.getenv("CFDI_EXPORT_MAX_WORKERS", "4"))
+# XML timbrados (datos fiscales de clientes): directorio privado, nunca dentro de MEDIA_ROOT
+CFDI_XML_CACHE_DIR = os.getenv("CFDI_XML_CACHE_DIR", "")  # default: BASE_DIR/var/cfdi_xml
+
+# Sugerencias de reorden de refacciones (warehouse/services/reorder.py)
+REORDER_LEAD_TIME_DAYS = int(os.getenv("REORDER_LEAD_TIME_DAYS", "7"))     # días que tarda en llegar un pedido
+REORDER_TARGET_DAYS = int(os.getenv("REORDER_TARGET_DAYS", "30"))          # cobertura a comprar después de llegar
+REORDER_CACHE_SECONDS = int(os.getenv("REORDER_CACHE_SECONDS", "86400"))
+REORDER_WATERMARK_MARGIN_SECONDS = int(os.getenv("REORDER_WATERMARK_MARGIN_SECONDS", "300"))  # transacción más larga esperada
+
 # Recomendación: crear como draft para evitar timbrar “por accidente”
 FACTURAPI_CREATE_AS_DRAFT = os.getenv("FACTURAPI_CREATE_AS_DRAFT", "true").lower() == "true"
\ No newline at end of file
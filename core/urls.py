@@ -19,7 +19,7 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from core import views
 from core import views as core_views
-from common.views import header_info, lookup_cp, healthz, trigger_error
+from common.views import catalog_lookup, header_info, lookup_cp, healthz, trigger_error
 from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls import handler404
@@ -48,6 +48,7 @@ urlpatterns = [
     path("settlement/", include("settlement.urls", namespace="settlement")),
     path("api/utils/header-info/", header_info, name="header_info"),
     path("api/utils/lookup-cp/", lookup_cp, name="lookup_cp"),
+    path("api/catalogs/<slug:catalog>/", catalog_lookup, name="catalog_lookup"),
     path("healthz", healthz, name="healthz"),
     path("trigger_error", trigger_error, name="trigger_error"),
 ]
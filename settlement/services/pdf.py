@@ -0,0 +1,109 @@
+# settlement/services/pdf.py
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.template.loader import render_to_string
+
+from settlement.models import (
+    OperatorSettlement,
+    OperatorSettlementTrip,
+    SettlementLineCategory,
+    SettlementStatus,
+    SettlementTripRole,
+)
+
+TEMPLATE_NAME = "settlement/settlement_pdf.html"
+
+# Hoja de estilos compartida (se carga una vez por proceso en el render por lote)
+STYLESHEET = settings.BASE_DIR / "static" / "css" / "settlement_pdf.css"
+
+
+# ============================================================
+# Queryset (todo precargado: 3 queries sin importar cuántas liquidaciones)
+# ============================================================
+
+def settlements_for_pdf(
+    *,
+    ids: Optional[Iterable[int]] = None,
+    period_from: Optional[date] = None,
+    period_to: Optional[date] = None,
+):
+    """
+    Liquidaciones por lista de IDs o por periodo (traslape con [period_from, period_to]).
+    Por periodo se excluyen las canceladas.
+    """
+    trips_qs = OperatorSettlementTrip.objects.select_related(
+        "trip", "trip__route", "trip__route__origen", "trip__route__destino",
+        "trip__client", "trip__truck", "trip__reefer_box",
+    )
+
+    qs = (
+        OperatorSettlement.objects
+        .select_related("operator", "created_by")
+        .prefetch_related(Prefetch("trips", queryset=trips_qs), "lines")
+    )
+
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    else:
+        if not (period_from and period_to):
+            return qs.none()
+        qs = qs.filter(
+            Q(period_from__lte=period_to) & Q(period_to__gte=period_from)
+        ).exclude(status=SettlementStatus.CANCELED)
+
+    return qs.order_by("operator__nombre", "period_from", "id")
+
+
+# ============================================================
+# Contexto (usa lo precargado; no dispara _sum_lines por categoría)
+# ============================================================
+
+def build_settlement_pdf_context(s: OperatorSettlement) -> dict:
+    rels = list(s.trips.all())
+    load_rel = next((r for r in rels if r.role == SettlementTripRole.LOAD), None)
+    return_rel = next((r for r in rels if r.role == SettlementTripRole.RETURN), None)
+
+    by_cat = {c: [] for c in SettlementLineCategory.values}
+    for line in s.lines.all():
+        by_cat.setdefault(line.category, []).append(line)
+
+    def total(cat: str) -> Decimal:
+        return sum((l.amount or Decimal("0.00") for l in by_cat.get(cat, [])), Decimal("0.00"))
+
+    ingresos = total(SettlementLineCategory.INGRESO)
+    anticipos = total(SettlementLineCategory.ANTICIPO)
+    gastos = total(SettlementLineCategory.GASTO)
+    casetas = total(SettlementLineCategory.CASETA)
+
+    return {
+        "settlement": s,
+        "load_trip": load_rel.trip if load_rel else None,
+        "return_trip": return_rel.trip if return_rel else None,
+        "lines_ingreso": by_cat[SettlementLineCategory.INGRESO],
+        "lines_anticipo": by_cat[SettlementLineCategory.ANTICIPO],
+        "lines_gasto": by_cat[SettlementLineCategory.GASTO],
+        "lines_caseta": by_cat[SettlementLineCategory.CASETA],
+        "ingresos_total": ingresos,
+        "anticipos_total": anticipos,
+        "gastos_total": gastos,
+        "casetas_total": casetas,
+        "total_a_liquidar": ingresos - anticipos - gastos - casetas,
+    }
+
+
+def settlement_pdf_filename(s: OperatorSettlement) -> str:
+    return f"liquidacion-{s.id}-{s.period_from:%Y%m%d}-{s.period_to:%Y%m%d}.pdf"
+
+
+def build_settlement_pdf_jobs(settlements) -> List[tuple[str, str]]:
+    """(filename, html) por liquidación, listo para common.pdf.iter_pdf_batch."""
+    return [
+        (settlement_pdf_filename(s), render_to_string(TEMPLATE_NAME, build_settlement_pdf_context(s)))
+        for s in settlements
+    ]
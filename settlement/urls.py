@@ -40,6 +40,16 @@ urlpatterns = [
         views.SettlementMarkReadyView.as_view(),
         name="mark_ready",
     ),
+    path(
+        "<int:pk>/pdf/",
+        views.SettlementPDFView.as_view(),
+        name="pdf",
+    ),
+    path(
+        "pdf-lote/",
+        views.SettlementBatchPDFView.as_view(),
+        name="batch_pdf",
+    ),
     path("ajax/trip-evidences/<int:trip_id>/",views.AjaxTripEvidencesView.as_view(), name="ajax_trip_evidences"),
     path("ajax/trip-approval/<int:trip_id>/", views.AjaxTripApprovalDecisionView.as_view(), name="ajax_trip_approval"),
     path("ajax/trip-pricing/<int:trip_load_id>/<int:trip_baja_id>/",views.AjaxTripPricingForSettlementView.as_view(), name="ajax_trip_pricing"),
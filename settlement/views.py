@@ -33,8 +33,10 @@ from django.views import View
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 from .forms import OperatorSettlementForm, SettlementLineFormSet
 
@@ -639,4 +641,77 @@ class AjaxTripPricingForSettlementView(OperacionRequiredMixin, View):
             "baja_en": baja_en,
             "pay_load": str(pay_load),
             "pay_baja": str(pay_baja),
-        })
\ No newline at end of file
+        })
+
+# ============================================================
+# PDF: individual y por lote (nómina)
+# ============================================================
+
+class SettlementPDFView(OperacionRequiredMixin, View):
+    def get(self, request, pk):
+        from common.pdf import render_pdf
+        from .services.pdf import (
+            STYLESHEET, TEMPLATE_NAME, build_settlement_pdf_context,
+            settlement_pdf_filename, settlements_for_pdf,
+        )
+
+        s = settlements_for_pdf(ids=[pk]).first()
+        if s is None:
+            raise Http404("Liquidación no encontrada")
+
+        return render_pdf(
+            request,
+            TEMPLATE_NAME,
+            build_settlement_pdf_context(s),
+            filename=settlement_pdf_filename(s),
+            stylesheets=[str(STYLESHEET)],
+        )
+
+
+class SettlementBatchPDFView(OperacionRequiredMixin, View):
+    """
+    GET ?ids=1,2,3            -> liquidaciones específicas
+    GET ?from=YYYY-MM-DD&to=  -> liquidaciones del periodo (sin canceladas)
+    &format=pdf (un solo PDF combinado) | zip (un PDF por liquidación, en streaming)
+    """
+
+    def get(self, request):
+        from common.pdf import iter_pdf_batch, iter_zip, merge_pdfs, render_pdf_batch
+        from .services.pdf import STYLESHEET, build_settlement_pdf_jobs, settlements_for_pdf
+
+        raw_ids = (request.GET.get("ids") or "").strip()
+        period_from = parse_date((request.GET.get("from") or "").strip())
+        period_to = parse_date((request.GET.get("to") or "").strip())
+        fmt = (request.GET.get("format") or "pdf").strip().lower()
+
+        if raw_ids:
+            ids = [int(x) for x in raw_ids.split(",") if x.strip().isdigit()]
+            qs = settlements_for_pdf(ids=ids)
+        elif period_from and period_to:
+            qs = settlements_for_pdf(period_from=period_from, period_to=period_to)
+        else:
+            messages.error(request, "Indica liquidaciones (ids) o un periodo (from/to) para imprimir.")
+            return redirect("settlement:list")
+
+        # El HTML se arma aquí (ORM/templates); WeasyPrint corre en el pool
+        jobs = build_settlement_pdf_jobs(qs)
+        if not jobs:
+            messages.warning(request, "No hay liquidaciones para imprimir con esos filtros.")
+            return redirect("settlement:list")
+
+        base_url = request.build_absolute_uri("/")
+        stylesheets = [str(STYLESHEET)]
+        stamp = timezone.localdate().strftime("%Y%m%d")
+
+        if fmt == "zip":
+            resp = StreamingHttpResponse(
+                iter_zip(iter_pdf_batch(jobs, base_url=base_url, stylesheets=stylesheets)),
+                content_type="application/zip",
+            )
+            resp["Content-Disposition"] = f'attachment; filename="liquidaciones-{stamp}.zip"'
+            return resp
+
+        pdfs = render_pdf_batch(jobs, base_url=base_url, stylesheets=stylesheets)
+        resp = HttpResponse(merge_pdfs([pdf for _, pdf in pdfs]), content_type="application/pdf")
+        resp["Content-Disposition"] = f'inline; filename="liquidaciones-{stamp}.pdf"'
+        return resp
@@ -0,0 +1,239 @@
+/*
+ * static/js/typeahead.js
+ * Typeahead para <select data-typeahead-url> (ver common.widgets.TypeaheadSelect).
+ *
+ * - El <select> sigue siendo la fuente de verdad (se postea igual); se oculta
+ *   y se muestra un input de búsqueda con un dropdown de Bootstrap.
+ * - Al elegir un resultado se crea/selecciona la <option> (con sus data-*)
+ *   y se dispara "change", así el JS existente de cada forma sigue igual.
+ * - Búsquedas con debounce, paginadas ("Ver más") y memorizadas por página;
+ *   el navegador revalida con ETag.
+ *
+ * Uso: BassTypeahead.bind(root) para filas agregadas dinámicamente.
+ */
+(function () {
+  "use strict";
+
+  const DEBOUNCE_MS = 200;
+  const memo = new Map();
+
+  function paramsFrom(str) {
+    return new URLSearchParams(str || "");
+  }
+
+  function buildUrl(sel, q, page) {
+    const params = paramsFrom(sel.dataset.typeaheadParams);
+    paramsFrom(sel.dataset.typeaheadDepends).forEach((inputId, param) => {
+      const dep = document.getElementById(inputId);
+      params.set(param, dep ? dep.value : "");
+    });
+    params.set("q", q);
+    params.set("page", String(page));
+    return sel.dataset.typeaheadUrl + "?" + params.toString();
+  }
+
+  async function fetchPage(url) {
+    if (memo.has(url)) return memo.get(url);
+    const resp = await fetch(url, {
+      credentials: "same-origin",
+      headers: { "X-Requested-With": "XMLHttpRequest" },
+    });
+    if (!resp.ok) return { results: [], more: false };
+    const data = await resp.json();
+    memo.set(url, data);
+    return data;
+  }
+
+  function selectedLabel(sel) {
+    const opt = sel.options[sel.selectedIndex];
+    return opt && opt.value ? opt.textContent.trim() : "";
+  }
+
+  function placeholderOf(sel) {
+    const empty = Array.from(sel.options).find(o => !o.value);
+    return empty ? empty.textContent.trim() : "Buscar…";
+  }
+
+  function setValue(sel, item) {
+    if (!item) {
+      sel.value = "";
+    } else {
+      const value = String(item.id);
+      let opt = Array.from(sel.options).find(o => o.value === value);
+      if (!opt) {
+        opt = document.createElement("option");
+        opt.value = value;
+        sel.appendChild(opt);
+      }
+      opt.textContent = item.label;
+      Object.entries(item.data || {}).forEach(([k, v]) => {
+        opt.setAttribute("data-" + k, v == null ? "" : String(v));
+      });
+      sel.value = value;
+    }
+    sel.dispatchEvent(new Event("change", { bubbles: true }));
+  }
+
+  function bindOne(sel) {
+    if (sel.dataset.typeaheadBound === "1") return;
+    sel.dataset.typeaheadBound = "1";
+
+    const wrap = document.createElement("div");
+    wrap.className = "position-relative";
+
+    const input = document.createElement("input");
+    input.type = "text";
+    input.autocomplete = "off";
+    input.className = sel.className.replace(/\bjs-[\w-]+/g, "").trim() || "form-control form-control-sm";
+    input.placeholder = placeholderOf(sel);
+    input.value = selectedLabel(sel);
+    input.disabled = sel.disabled;
+
+    const menu = document.createElement("div");
+    menu.className = "dropdown-menu w-100 shadow-sm";
+    menu.style.maxHeight = "280px";
+    menu.style.overflowY = "auto";
+
+    sel.parentNode.insertBefore(wrap, sel);
+    wrap.appendChild(input);
+    wrap.appendChild(menu);
+    wrap.appendChild(sel);
+    sel.classList.add("d-none");
+
+    let timer = null;
+    let seq = 0;
+    let items = [];
+    let active = -1;
+    let page = 1;
+
+    function close() {
+      menu.classList.remove("show");
+      active = -1;
+    }
+
+    function highlight(i) {
+      const links = menu.querySelectorAll(".js-ta-item");
+      links.forEach((a, j) => a.classList.toggle("active", j === i));
+      active = i;
+      if (links[i]) links[i].scrollIntoView({ block: "nearest" });
+    }
+
+    function choose(item) {
+      setValue(sel, item);
+      input.value = item ? item.label : "";
+      close();
+    }
+
+    function render(more) {
+      menu.innerHTML = "";
+      if (!items.length) {
+        const empty = document.createElement("span");
+        empty.className = "dropdown-item-text text-muted small";
+        empty.textContent = "Sin resultados";
+        menu.appendChild(empty);
+      }
+      items.forEach((item, i) => {
+        const a = document.createElement("a");
+        a.href = "#";
+        a.className = "dropdown-item small js-ta-item";
+        a.textContent = item.label;
+        if (item.sub) {
+          const sub = document.createElement("span");
+          sub.className = "text-muted ml-2";
+          sub.textContent = item.sub;
+          a.appendChild(sub);
+        }
+        a.addEventListener("mousedown", e => { e.preventDefault(); choose(item); });
+        a.addEventListener("mouseenter", () => highlight(i));
+        menu.appendChild(a);
+      });
+      if (more) {
+        const next = document.createElement("a");
+        next.href = "#";
+        next.className = "dropdown-item small text-primary";
+        next.textContent = "Ver más…";
+        next.addEventListener("mousedown", e => { e.preventDefault(); load(page + 1); });
+        menu.appendChild(next);
+      }
+      menu.classList.add("show");
+    }
+
+    async function load(p) {
+      const mine = ++seq;
+      const data = await fetchPage(buildUrl(sel, input.value.trim(), p));
+      if (mine !== seq) return; // llegó una búsqueda más nueva
+      page = p;
+      items = p === 1 ? (data.results || []) : items.concat(data.results || []);
+      render(!!data.more);
+      highlight(p === 1 && items.length ? 0 : active);
+    }
+
+    input.addEventListener("input", () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => load(1), DEBOUNCE_MS);
+    });
+
+    input.addEventListener("focus", () => {
+      if (!sel.disabled) {
+        input.select();
+        load(1);
+      }
+    });
+
+    input.addEventListener("keydown", e => {
+      if (!menu.classList.contains("show")) return;
+      if (e.key === "ArrowDown") {
+        e.preventDefault();
+        highlight(Math.min(active + 1, items.length - 1));
+      } else if (e.key === "ArrowUp") {
+        e.preventDefault();
+        highlight(Math.max(active - 1, 0));
+      } else if (e.key === "Enter") {
+        if (active >= 0 && items[active]) {
+          e.preventDefault();
+          choose(items[active]);
+        }
+      } else if (e.key === "Escape") {
+        input.value = selectedLabel(sel);
+        close();
+      }
+    });
+
+    input.addEventListener("blur", () => {
+      clearTimeout(timer);
+      seq++;
+      if (!input.value.trim() && sel.value) {
+        choose(null);
+      } else {
+        input.value = selectedLabel(sel);
+      }
+      close();
+    });
+
+    // cambios hechos por otro JS sobre el <select> (valor o disabled)
+    sel.addEventListener("change", () => {
+      if (document.activeElement !== input) input.value = selectedLabel(sel);
+    });
+    new MutationObserver(() => { input.disabled = sel.disabled; })
+      .observe(sel, { attributes: true, attributeFilter: ["disabled"] });
+
+    // ruta <- cliente: si cambia el padre, la selección ya no aplica
+    paramsFrom(sel.dataset.typeaheadDepends).forEach(inputId => {
+      const dep = document.getElementById(inputId);
+      if (!dep) return;
+      dep.addEventListener("change", () => {
+        if (sel.value) choose(null);
+        else input.value = "";
+      });
+    });
+  }
+
+  function bind(root) {
+    (root || document).querySelectorAll("select[data-typeahead-url]").forEach(bindOne);
+  }
+
+  window.BassTypeahead = { bind: bind };
+
+  if (document.readyState !== "loading") bind(document);
+  else document.addEventListener("DOMContentLoaded", () => bind(document));
+})();
@@ -1,9 +1,10 @@
 # admin.py
 from django.contrib import admin
-from .models import Trip, CartaPorteCFDI, CartaPorteGoods, CartaPorteItem, CartaPorteLocation
+from .models import Trip, CartaPorteCFDI, CartaPorteGoods, CartaPorteItem, CartaPorteLocation, FacturapiWebhookEvent
 
 admin.site.register(Trip)
 admin.site.register(CartaPorteCFDI)
 admin.site.register(CartaPorteGoods)
 admin.site.register(CartaPorteItem)
-admin.site.register(CartaPorteLocation)
\ No newline at end of file
+admin.site.register(CartaPorteLocation)
+admin.site.register(FacturapiWebhookEvent)
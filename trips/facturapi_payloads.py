@@ -7,9 +7,11 @@ from datetime import date, datetime
 from decimal import Decimal
 from typing import Any, Dict, List, Optional
 from django.utils import timezone
+from common.models import SatCatalog
+from common.services import sat_catalogs
 from customers.models import Client
 from operators.models import Operator, CrossBorderCapability
-from trips.models import CartaPorteCFDI
+from trips.models import CartaPorteCFDI, TripClassification
 
 # ============================================================
 # Regex/Validaciones
@@ -123,6 +125,21 @@ def _operator_country_code(op: Operator) -> str:
     return "MX"
 
 
+def _related(carta: CartaPorteCFDI, name: str) -> List[Any]:
+    """
+    Renglones relacionados (items/locations/goods) ordenados por (orden, id).
+    Usa lo precargado con prefetch_related si existe (validación en lote).
+    """
+    prefetched = getattr(carta, "_prefetched_objects_cache", {}).get(name)
+    if prefetched is not None:
+        rows = list(prefetched)
+    elif name == "goods":
+        rows = list(carta.goods.select_related("mercancia").all())
+    else:
+        rows = list(getattr(carta, name).all())
+    return sorted(rows, key=lambda r: (getattr(r, "orden", 0) or 0, r.id or 0))
+
+
 def _strip_nones(d: Dict[str, Any]) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     for k, v in d.items():
@@ -221,7 +238,7 @@ def _is_international_shipment(carta: CartaPorteCFDI) -> bool:
         return True
 
     try:
-        locs = list(carta.locations.all())
+        locs = _related(carta, "locations")
     except Exception:
         locs = []
 
@@ -243,6 +260,34 @@ def _pais_origen_destino(carta: CartaPorteCFDI) -> str:
     return "MEX"
 
 
+def _entrada_salida_merc(carta: CartaPorteCFDI) -> str:
+    """
+    Sentido de la mercancía cuando TranspInternac='Sí':
+    - origen fuera de MEX -> Entrada
+    - destino fuera de MEX -> Salida
+    - si las ubicaciones no lo dicen, el viaje de exportación es Salida
+    """
+    try:
+        locs = _related(carta, "locations")
+    except Exception:
+        locs = []
+
+    for l in locs:
+        lp = _country_2_to_3(_s(getattr(l, "pais", "")))
+        if not lp or lp == "MEX":
+            continue
+        tipo = _s(getattr(l, "tipo_ubicacion", ""))
+        if tipo == "Origen":
+            return "Entrada"
+        if tipo == "Destino":
+            return "Salida"
+
+    trip = getattr(carta, "trip", None)
+    if trip is not None and getattr(trip, "clasificacion", None) == TripClassification.EXPORTACION:
+        return "Salida"
+    return "Entrada"
+
+
 # ============================================================
 # Facturapi: Customer.address
 # ============================================================
@@ -312,7 +357,7 @@ def build_customer_payload(client: Client) -> Dict[str, Any]:
 # ============================================================
 
 def build_items_payload(carta: CartaPorteCFDI) -> List[Dict[str, Any]]:
-    items = list(carta.items.order_by("orden", "id").all())
+    items = _related(carta, "items")
     out: List[Dict[str, Any]] = []
     is_intl = _is_international_shipment(carta)
     for it in items:
@@ -351,11 +396,42 @@ def build_items_payload(carta: CartaPorteCFDI) -> List[Dict[str, Any]]:
 # Carta Porte - Ubicaciones
 # ============================================================
 
+def _domicilio_claves_sat(loc: Any) -> Dict[str, str]:
+    """
+    Para domicilios en México, SAT pide claves de catálogo (c_Colonia,
+    c_Municipio, c_Localidad). Si lo capturado es el nombre y está en el
+    catálogo cargado, se sustituye por la clave; si no, se manda tal cual.
+    """
+    colonia = _s(getattr(loc, "colonia", None))
+    localidad = _s(getattr(loc, "localidad", None))
+    municipio = _s(getattr(loc, "municipio", None))
+
+    if _country_2_to_3(_s(getattr(loc, "pais", None))) == "MEX":
+        cp = _s(getattr(loc, "codigo_postal", None))
+        estado = _s(getattr(loc, "estado", None))
+
+        colonias = sat_catalogs.get_catalog(SatCatalog.COLONIA)
+        if colonia and cp and not colonias.exists(colonia, cp):
+            colonia = colonias.clave_by_description(colonia, cp) or colonia
+
+        if estado:
+            municipios = sat_catalogs.get_catalog(SatCatalog.MUNICIPIO)
+            if municipio and not municipios.exists(municipio, estado):
+                municipio = municipios.clave_by_description(municipio, estado) or municipio
+
+            localidades = sat_catalogs.get_catalog(SatCatalog.LOCALIDAD)
+            if localidad and not localidades.exists(localidad, estado):
+                localidad = localidades.clave_by_description(localidad, estado) or localidad
+
+    return {"Colonia": colonia, "Localidad": localidad, "Municipio": municipio}
+
+
 def build_ubicaciones_payload(carta: CartaPorteCFDI) -> List[Dict[str, Any]]:
-    locs = list(carta.locations.order_by("orden", "id").all())
+    locs = _related(carta, "locations")
     out: List[Dict[str, Any]] = []
 
     for l in locs:
+        domicilio = _domicilio_claves_sat(l)
         out.append(_strip_nones({
             "TipoUbicacion": _s(getattr(l, "tipo_ubicacion", None)),
             "RFCRemitenteDestinatario": _normalize_rfc_or_generic(getattr(l, "rfc", None), country2="MX"),
@@ -368,9 +444,9 @@ def build_ubicaciones_payload(carta: CartaPorteCFDI) -> List[Dict[str, Any]]:
                 "Calle": _s(getattr(l, "calle", None)) or None,
                 "NumeroExterior": _s(getattr(l, "numero_exterior", None)) or None,
                 "NumeroInterior": _s(getattr(l, "numero_interior", None)) or None,
-                "Colonia": _s(getattr(l, "colonia", None)) or None,
-                "Localidad": _s(getattr(l, "localidad", None)) or None,
-                "Municipio": _s(getattr(l, "municipio", None)) or None,
+                "Colonia": domicilio["Colonia"] or None,
+                "Localidad": domicilio["Localidad"] or None,
+                "Municipio": domicilio["Municipio"] or None,
                 "Estado": _s(getattr(l, "estado", None)) or None,
                 "Pais": _country_2_to_3(_s(getattr(l, "pais", None))),  # MEX/USA
                 "CodigoPostal": _s(getattr(l, "codigo_postal", None)),
@@ -388,7 +464,7 @@ def build_ubicaciones_payload(carta: CartaPorteCFDI) -> List[Dict[str, Any]]:
 # ============================================================
 
 def build_mercancias_payload(carta: CartaPorteCFDI) -> Dict[str, Any]:
-    goods = list(carta.goods.select_related("mercancia").all())
+    goods = _related(carta, "goods")
 
     mercancia_rows: List[Dict[str, Any]] = []
     peso_total = Decimal("0.00")
@@ -428,6 +504,10 @@ def build_mercancias_payload(carta: CartaPorteCFDI) -> Dict[str, Any]:
             "Unidad": unidad,
         }
 
+        # c_ClaveProdServCP: "0,1" -> el atributo es obligatorio aunque no sea peligroso
+        if sat_catalogs.material_peligroso(bienes_transp) == "0,1":
+            row["MaterialPeligroso"] = "No"
+
         if peso is not None:
             row["PesoEnKg"] = float(_q3(peso))
         if mon:
@@ -502,7 +582,7 @@ def build_cfdi_payload(*, carta: CartaPorteCFDI, trip_operator: Operator) -> Dic
 
     # Defaults “mínimos” cuando es internacional
     pais_origen_destino = _pais_origen_destino(carta)  # MEX/USA
-    entrada_salida = "Entrada"  # default; ajusta si quieres lógica
+    entrada_salida = _entrada_salida_merc(carta)
     via_entrada_salida = "04"   # "04" = Carretera (default razonable)
 
     print(f"[FACTURAPI][CARTA_PORTE][IdCCP] carta_id={getattr(carta,'id',None)} IdCCP={idccp}")
@@ -3,12 +3,12 @@ from decimal import Decimal
 
 from django import forms
 from django.apps import apps
-from django.db.models import Exists, OuterRef
 from django.forms import inlineformset_factory
-from django.forms.widgets import Select
 
+from common.services import sat_catalogs
+from common.services.catalog_search import without_blocking_orders
+from common.widgets import TypeaheadSelect
 from operators.models import Operator, CrossBorderCapability
-from workshop.models import WorkshopOrder
 
 from .models import (
     Trip,
@@ -45,6 +45,13 @@ class TripForm(forms.ModelForm):
         widgets = {
             "observations": forms.Textarea(attrs={"rows": 3}),
             "producto": forms.TextInput(attrs={"placeholder": "Ej. Hortaliza, Carne, Congelados..."}),
+            # Catálogos con typeahead (no se renderiza el catálogo completo)
+            "client": TypeaheadSelect("clients"),
+            "route": TypeaheadSelect("routes"),
+            "operator": TypeaheadSelect("operators"),
+            "truck": TypeaheadSelect("units"),
+            "reefer_box": TypeaheadSelect("boxes"),
+            "transfer_operator": TypeaheadSelect("operators", params={"cruce": 1}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -89,6 +96,8 @@ class TripForm(forms.ModelForm):
 
         if "route" in self.fields:
             qs_route = self.fields["route"].queryset.select_related("origen", "destino", "client")
+            if "client" in self.fields:
+                self.fields["route"].widget.depends = {"client": self["client"].auto_id}
 
             client_id = None
             if self.is_bound:
@@ -110,35 +119,18 @@ class TripForm(forms.ModelForm):
             self.fields["route"].empty_label = "Selecciona ruta…"
 
         if not self.instance.pk:
-            allowed_estados = ["TERMINADA", "CANCELADA"]
-
+            # Unidades/cajas con OT abierta no se pueden asignar (mismo filtro en el typeahead)
             if "truck" in self.fields:
-                qs_trucks = self.fields["truck"].queryset
-                blocking_ot_truck = WorkshopOrder.objects.filter(
-                    deleted=False,
-                    truck=OuterRef("pk"),
-                ).exclude(estado__in=allowed_estados)
-
-                self.fields["truck"].queryset = (
-                    qs_trucks
-                    .annotate(has_blocking_ot=Exists(blocking_ot_truck))
-                    .filter(has_blocking_ot=False)
-                    .order_by("numero_economico")
-                )
+                self.fields["truck"].queryset = without_blocking_orders(
+                    self.fields["truck"].queryset, "truck"
+                ).order_by("numero_economico")
+                self.fields["truck"].widget.params["libres"] = 1
 
             if "reefer_box" in self.fields:
-                qs_boxes = self.fields["reefer_box"].queryset
-                blocking_ot_box = WorkshopOrder.objects.filter(
-                    deleted=False,
-                    reefer_box=OuterRef("pk"),
-                ).exclude(estado__in=allowed_estados)
-
-                self.fields["reefer_box"].queryset = (
-                    qs_boxes
-                    .annotate(has_blocking_ot=Exists(blocking_ot_box))
-                    .filter(has_blocking_ot=False)
-                    .order_by("numero_economico")
-                )
+                self.fields["reefer_box"].queryset = without_blocking_orders(
+                    self.fields["reefer_box"].queryset, "reefer_box"
+                ).order_by("numero_economico")
+                self.fields["reefer_box"].widget.params["libres"] = 1
 
     def clean_observations(self):
         return (self.cleaned_data.get("observations") or "").strip()
@@ -301,7 +293,10 @@ UNIDAD_CHOICES = (
 # Goods Select with data-*
 # =========================
 
-class MercanciaSelectWithData(Select):
+class MercanciaSelectWithData(TypeaheadSelect):
+    def __init__(self, attrs=None):
+        super().__init__("mercancias", attrs)
+
     def create_option(self, name, value, label, selected, index, subindex=None, attrs=None):
         option = super().create_option(name, value, label, selected, index, subindex=subindex, attrs=attrs)
 
@@ -322,7 +317,7 @@ class CartaPorteCFDIForm(forms.ModelForm):
     customer = forms.ModelChoiceField(
         queryset=None,
         required=False,
-        widget=forms.Select(attrs={"class": "form-control form-control-sm"}),
+        widget=TypeaheadSelect("clients", attrs={"class": "form-control form-control-sm"}),
         label="Cliente (Receptor)",
     )
 
@@ -335,8 +330,9 @@ class CartaPorteCFDIForm(forms.ModelForm):
             "xml_url",
             "status",
             "last_error",
-            "payload_snapshot",
-            "response_snapshot",
+            "facturapi_id",
+            "verification_url",
+            "cancellation_status",
             "created_at",
             "updated_at",
             "customer",
@@ -394,6 +390,7 @@ class CartaPorteCFDIForm(forms.ModelForm):
 
         if self.instance and self.instance.pk and getattr(self.instance, "customer_id", None):
             self.fields["customer"].initial = self.instance.customer
+            self.fields["customer"].widget.instances = {self.instance.customer_id: self.instance.customer}
 
         # subtotal y total readonly (en UI se postean hidden, pero estos campos quedan disabled)
         if "subtotal" in self.fields:
@@ -454,7 +451,8 @@ class CartaPorteLocationForm(forms.ModelForm):
 
     def clean_estado(self):
         estado = self.cleaned_data.get("estado", "")
-        return self.ESTADO_SAT_MAP.get(estado, "")[:3]
+        # Catálogo SAT c_Estado (acepta clave o nombre); si no está cargado, el mapa local
+        return sat_catalogs.estado_clave(estado, pais="MEX") or self.ESTADO_SAT_MAP.get(estado, "")[:3]
 
     def clean_pais(self):
         return "MX"
@@ -498,6 +496,9 @@ class CartaPorteGoodsForm(forms.ModelForm):
 
         if self.instance and getattr(self.instance, "mercancia_id", None):
             self.fields["mercancia"].initial = self.instance.mercancia_id
+            # si el formset trae select_related("mercancia") no hay consulta por fila
+            if CartaPorteGoods.mercancia.is_cached(self.instance):
+                self.fields["mercancia"].widget.instances = {self.instance.mercancia_id: self.instance.mercancia}
 
     def save(self, commit=True):
         instance = super().save(commit=False)
@@ -0,0 +1,145 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import override_settings
+
+from trips.models import CartaPorteCFDI
+from trips.services.facturapi import (
+    FacturapiError,
+    _facturapi_request,
+    create_invoice_in_facturapi,
+    download_invoice_xml,
+    extract_cert_data_from_xml,
+)
+from trips.services.fake_facturapi import FakeFacturapi, start_fake_server_in_thread
+
+# Payload mínimo cuando no se indica --carta (solo mide el camino HTTP + XML)
+SYNTHETIC_PAYLOAD = {
+    "type": "I",
+    "customer": {"legal_name": "PUBLICO EN GENERAL", "tax_id": "XAXX010101000", "tax_system": "616",
+                 "address": {"country": "MEX", "zip": "06000"}},
+    "items": [{"quantity": 1, "product": {"description": "Servicio de transporte", "product_key": "78101800",
+                                          "unit_key": "E48", "price": 1000.0}}],
+}
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de timbrado: N requests con C concurrentes contra Facturapi (por default un "
+        "stand-in local en proceso). Reporta throughput, latencias p50/p95/p99 y tiempo de lock en BD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Total de timbrados")
+        parser.add_argument("--concurrency", type=int, default=8, help="Timbrados simultáneos")
+        parser.add_argument("--carta", type=int, help="ID de carta para construir el payload real (no se modifica)")
+        parser.add_argument("--latency-ms", type=int, default=150, help="Latencia del stand-in")
+        parser.add_argument("--jitter-ms", type=int, default=50, help="Variación de latencia del stand-in")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de errores del stand-in")
+        parser.add_argument("--base-url", help="Usar un Facturapi externo (p.ej. fake_facturapi) en vez del interno")
+        parser.add_argument("--api-key", default="bench", help="API key a usar")
+
+    def handle(self, *args, **opts):
+        n, conc = max(1, opts["requests"]), max(1, opts["concurrency"])
+
+        server = None
+        base_url = opts["base_url"]
+        if not base_url:
+            app = FakeFacturapi(latency_ms=opts["latency_ms"], jitter_ms=opts["jitter_ms"], error_rate=opts["error_rate"])
+            server, base_url = start_fake_server_in_thread(app)
+
+        carta = None
+        if opts["carta"]:
+            carta = (
+                CartaPorteCFDI.objects
+                .select_related("customer", "trip", "trip__operator")
+                .filter(pk=opts["carta"]).first()
+            )
+            if carta is None:
+                raise CommandError(f"No existe la carta #{opts['carta']}.")
+
+        latencies, lock_waits, lock_holds, errors = [], [], [], []
+        mu = threading.Lock()
+
+        def one(_i):
+            t0 = time.perf_counter()
+            try:
+                if carta is not None:
+                    # copia en memoria: el estatus real de la carta no se toca
+                    c = CartaPorteCFDI.objects.select_related("customer", "trip", "trip__operator").get(pk=carta.pk)
+                    c.status, c.uuid = "ready", None
+                    result = create_invoice_in_facturapi(carta=c, trip=c.trip)
+                    resp = result["response"]
+
+                    # fase de BD: mismo lock de fila que el guardado real, con rollback
+                    with transaction.atomic():
+                        tl = time.perf_counter()
+                        locked = CartaPorteCFDI.objects.select_for_update().get(pk=carta.pk)
+                        acquired = time.perf_counter()
+                        locked.response_snapshot = resp
+                        locked.save(update_fields=["response_snapshot", "updated_at"])
+                        transaction.set_rollback(True)
+                    released = time.perf_counter()
+                    with mu:
+                        lock_waits.append(acquired - tl)
+                        lock_holds.append(released - acquired)
+                else:
+                    resp = _facturapi_request(
+                        method="POST", url=f"{base_url.rstrip('/')}/invoices",
+                        api_key=opts["api_key"], payload=SYNTHETIC_PAYLOAD, timeout=30,
+                    )
+                    xml_bytes = download_invoice_xml(invoice_id=resp["id"])
+                    extract_cert_data_from_xml(xml_bytes)
+            except FacturapiError as e:
+                with mu:
+                    errors.append(str(e).splitlines()[0])
+                return
+            finally:
+                connections.close_all()
+
+            with mu:
+                latencies.append(time.perf_counter() - t0)
+
+        with override_settings(FACTURAPI_BASE_URL=base_url, FACTURAPI_API_KEY=opts["api_key"]):
+            t_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=conc, thread_name_prefix="bench-stamp") as pool:
+                list(pool.map(one, range(n)))
+            elapsed = time.perf_counter() - t_start
+
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+        ms = lambda v: f"{v * 1000:.1f} ms"
+        ok = len(latencies)
+        self.stdout.write(f"Endpoint: {base_url}  ·  {n} requests, concurrencia {conc}")
+        self.stdout.write(f"OK: {ok}  ·  errores: {len(errors)}  ·  total {elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"Throughput: {ok / elapsed:.1f} timbrados/s" if elapsed else "Throughput: n/a"))
+        if latencies:
+            self.stdout.write(
+                "Latencia: "
+                f"p50 {ms(statistics.median(latencies))} · p95 {ms(_pct(latencies, 95))} · "
+                f"p99 {ms(_pct(latencies, 99))} · max {ms(max(latencies))}"
+            )
+        if lock_waits:
+            self.stdout.write(
+                "Lock BD (select_for_update): "
+                f"espera p50 {ms(statistics.median(lock_waits))} · p95 {ms(_pct(lock_waits, 95))} · "
+                f"max {ms(max(lock_waits))}  ·  retenido p50 {ms(statistics.median(lock_holds))} · "
+                f"max {ms(max(lock_holds))}"
+            )
+        if errors:
+            sample = sorted(set(errors))[:5]
+            self.stdout.write(self.style.WARNING("Errores (muestra): " + " | ".join(sample)))
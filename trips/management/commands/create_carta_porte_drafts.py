@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from trips.services.carta_porte_drafts import create_draft_cartas, trips_for_drafts
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea borradores de Carta Porte (ubicaciones + concepto) para los viajes "
+        "programados sin Carta Porte en un rango de fechas de salida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD (default: hoy)")
+        parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD (default: igual a --from)")
+        parser.add_argument("--ids", nargs="+", type=int, help="Solo estos viajes (ignora fechas)")
+        parser.add_argument("--include-undated", action="store_true",
+                            help="Incluir viajes programados sin hora de salida")
+        parser.add_argument("--dry-run", action="store_true", help="Solo lista, no crea nada")
+
+    def handle(self, *args, **opts):
+        if opts["ids"]:
+            trips = trips_for_drafts(trip_ids=opts["ids"])
+        else:
+            date_from = parse_date(opts["date_from"] or "") if opts["date_from"] else timezone.localdate()
+            date_to = parse_date(opts["date_to"] or "") if opts["date_to"] else date_from
+            if not (date_from and date_to) or date_from > date_to:
+                raise CommandError("Rango de fechas inválido (usa YYYY-MM-DD).")
+            trips = trips_for_drafts(
+                date_from=date_from, date_to=date_to, include_undated=opts["include_undated"]
+            )
+
+        report = create_draft_cartas(trips, dry_run=opts["dry_run"])
+
+        for trip_id, reason in report.skipped:
+            self.stdout.write(self.style.WARNING(f"  Viaje #{trip_id}: omitido ({reason})"))
+
+        if opts["dry_run"]:
+            ids = ", ".join(str(i) for i in report.trip_ids[:50]) or "-"
+            self.stdout.write(f"[dry-run] {len(report.trip_ids)} viajes recibirían borrador: {ids}")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{report.created} borradores de Carta Porte creados."))
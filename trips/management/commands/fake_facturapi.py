@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from trips.services.fake_facturapi import FakeFacturapi, make_fake_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Levanta un stand-in local de Facturapi (/v2/invoices, /xml, estatus y cancelación). "
+        "Apunta FACTURAPI_BASE_URL a http://<host>:<port>/v2."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=int, default=0, help="Latencia simulada por request")
+        parser.add_argument("--jitter-ms", type=int, default=0, help="Variación +/- de la latencia")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de requests que regresan 500 (0-1)")
+        parser.add_argument("--seed", type=int, help="Semilla para latencia/errores reproducibles")
+        parser.add_argument("--verbose-log", action="store_true", help="Log de cada request")
+
+    def handle(self, *args, **opts):
+        app = FakeFacturapi(
+            latency_ms=opts["latency_ms"],
+            jitter_ms=opts["jitter_ms"],
+            error_rate=opts["error_rate"],
+            seed=opts["seed"],
+        )
+        server = make_fake_server(app, opts["host"], opts["port"], quiet=not opts["verbose_log"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake Facturapi en http://{opts['host']}:{server.server_port}/v2 (Ctrl+C para salir)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"{app.requests} requests atendidos, {len(app.invoices)} facturas creadas.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from trips.services.facturapi_webhooks import process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa eventos de webhook de Facturapi pendientes o con error "
+        "(p.ej. tras un reinicio). Es idempotente: se puede correr por cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500, help="Máximo de eventos por corrida")
+
+    def handle(self, *args, **opts):
+        counts = process_pending(limit=max(1, opts["limit"]))
+        if not counts:
+            self.stdout.write("Sin eventos pendientes.")
+            return
+        detail = ", ".join(f"{k}: {v}" for k, v in sorted(counts.items()))
+        style = self.style.WARNING if counts.get("error") else self.style.SUCCESS
+        self.stdout.write(style(f"Eventos procesados ({detail})."))
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.services.cfdi_reconcile import reconcile
+from trips.services.facturapi import FacturapiError
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia el estatus de las Cartas Porte no finales contra Facturapi "
+        "(cancelaciones / cambios hechos del lado del proveedor) y reporta diferencias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8, help="Consultas simultáneas")
+        parser.add_argument("--rate", type=float, default=10.0, help="Máximo de consultas por segundo")
+        parser.add_argument("--page-size", type=int, default=200, help="Cartas por página")
+        parser.add_argument("--status", action="append", help="Solo estos estatus locales (repetible)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reporta, no guarda cambios")
+        parser.add_argument("--base-url", help="URL base alterna (p.ej. stand-in local: http://127.0.0.1:8765/v2)")
+        parser.add_argument("--api-key", help="API key alterna (default: FACTURAPI_API_KEY)")
+
+    def handle(self, *args, **opts):
+        # sin llave cada carta fallaría por separado; mejor cortar antes de paginar
+        if not (opts["api_key"] or getattr(settings, "FACTURAPI_API_KEY", None)):
+            raise CommandError("FACTURAPI_API_KEY no está configurado (o usa --api-key).")
+
+        t0 = time.monotonic()
+        try:
+            report = reconcile(
+                concurrency=max(1, opts["concurrency"]),
+                rate_per_sec=opts["rate"],
+                page_size=opts["page_size"],
+                dry_run=opts["dry_run"],
+                statuses=opts["status"],
+                api_key=opts["api_key"],
+                base_url=opts["base_url"],
+            )
+        except FacturapiError as e:
+            raise CommandError(str(e))
+
+        for d in report.drifts:
+            extra = f" (cancelación: {d.cancellation_status})" if d.cancellation_status else ""
+            self.stdout.write(
+                f"  Carta #{d.carta_id} {d.uuid or d.invoice_id}: {d.local_status} → {d.remote_status}{extra}"
+            )
+        for err in report.errors:
+            self.stdout.write(self.style.ERROR(f"  {err}"))
+
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        summary = (
+            f"{prefix}{report.checked} consultadas, {len(report.drifts)} con diferencia de estatus, "
+            f"{report.cancellation_changed} con cambio de cancelación, {report.unchanged} sin cambio, {len(report.errors)} errores, {report.updated} actualizadas "
+            f"({time.monotonic() - t0:.1f}s)."
+        )
+        style = self.style.WARNING if (report.drifts or report.cancellation_changed or report.errors) else self.style.SUCCESS
+        self.stdout.write(style(summary))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from trips.models import CartaPorteCFDI, CartaPorteGoods
+from trips.services.carta_porte_validation import format_issues, validate_carta
+
+
+class Command(BaseCommand):
+    help = (
+        "Valida localmente (sin Facturapi) las Cartas Porte en estatus 'ready' "
+        "contra reglas SAT y catálogos cargados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", default="ready", help="Estatus a validar (default: ready)")
+        parser.add_argument("--ids", help="IDs de carta separados por coma (ignora --status)")
+        parser.add_argument("--warnings", action="store_true", help="Mostrar también advertencias")
+        parser.add_argument(
+            "--mark-error",
+            action="store_true",
+            help="Pasar a 'error' (con last_error) las cartas que no pasen la validación",
+        )
+
+    def handle(self, *args, **opts):
+        qs = (
+            CartaPorteCFDI.objects
+            .select_related("customer", "trip", "trip__operator")
+            .prefetch_related(
+                "items",
+                "locations",
+                Prefetch("goods", queryset=CartaPorteGoods.objects.select_related("mercancia")),
+            )
+            .order_by("id")
+        )
+        if opts["ids"]:
+            qs = qs.filter(pk__in=[int(x) for x in opts["ids"].split(",") if x.strip().isdigit()])
+        else:
+            qs = qs.filter(status=opts["status"])
+
+        ok, failed = 0, []
+        for carta in qs:
+            issues = validate_carta(carta)
+            errors = [i for i in issues if i.is_error]
+            shown = issues if opts["warnings"] else errors
+
+            if errors:
+                failed.append((carta, issues))
+                self.stdout.write(self.style.ERROR(f"Carta #{carta.id} (viaje #{carta.trip_id}): {len(errors)} error(es)"))
+            else:
+                ok += 1
+                if shown:
+                    self.stdout.write(self.style.WARNING(f"Carta #{carta.id} (viaje #{carta.trip_id}): OK con advertencias"))
+            for issue in shown:
+                self.stdout.write(f"  [{issue.level}] {issue}")
+
+        if opts["mark_error"] and failed:
+            now = timezone.now()
+            cartas = []
+            for carta, issues in failed:
+                carta.status = "error"
+                carta.last_error = f"Validación local: {format_issues(issues)}"
+                carta.updated_at = now
+                cartas.append(carta)
+            CartaPorteCFDI.objects.bulk_update(cartas, ["status", "last_error", "updated_at"], batch_size=200)
+
+        summary = f"{ok} válidas, {len(failed)} con errores."
+        if failed and opts["mark_error"]:
+            summary += " Marcadas como 'error'."
+        self.stdout.write(self.style.SUCCESS(summary) if not failed else self.style.WARNING(summary))
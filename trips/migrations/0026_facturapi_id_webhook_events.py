@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_facturapi_id(apps, schema_editor):
+    CartaPorteCFDI = apps.get_model("trips", "CartaPorteCFDI")
+    batch = []
+    qs = CartaPorteCFDI.objects.filter(response_snapshot__isnull=False).only("id", "response_snapshot")
+    for carta in qs.iterator(chunk_size=500):
+        snap = carta.response_snapshot if isinstance(carta.response_snapshot, dict) else {}
+        raw = snap.get("raw") if isinstance(snap.get("raw"), dict) else {}
+        invoice_id = raw.get("id") or snap.get("id") or ""
+        if invoice_id:
+            carta.facturapi_id = str(invoice_id)[:40]
+            batch.append(carta)
+        if len(batch) >= 500:
+            CartaPorteCFDI.objects.bulk_update(batch, ["facturapi_id"])
+            batch = []
+    if batch:
+        CartaPorteCFDI.objects.bulk_update(batch, ["facturapi_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0025_cartaportecfdi_emitter_no_cert_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartaportecfdi',
+            name='facturapi_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='cartaportecfdi',
+            name='uuid',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='FacturapiWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64, unique=True)),
+                ('event_type', models.CharField(blank=True, default='', max_length=80)),
+                ('invoice_id', models.CharField(blank=True, db_index=True, default='', max_length=40)),
+                ('uuid', models.CharField(blank=True, default='', max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processed', 'Procesado'), ('ignored', 'Ignorado'), ('error', 'Error')], db_index=True, default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('carta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='webhook_events', to='trips.cartaportecfdi')),
+            ],
+            options={
+                'verbose_name': 'Evento webhook Facturapi',
+                'verbose_name_plural': 'Eventos webhook Facturapi',
+                'ordering': ['received_at', 'id'],
+            },
+        ),
+        migrations.RunPython(backfill_facturapi_id, migrations.RunPython.noop),
+    ]
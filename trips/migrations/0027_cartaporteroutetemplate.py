@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0005_route_pago_transfer_propio_and_more'),
+        ('trips', '0026_facturapi_id_webhook_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartaPorteRouteTemplate',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='carta_porte_template', serialize=False, to='locations.route')),
+                ('locations', models.JSONField(default=list)),
+                ('goods', models.JSONField(default=list)),
+                ('distancia_km', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('item_description', models.CharField(blank=True, default='', max_length=255)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Plantilla de Carta Porte por ruta',
+                'verbose_name_plural': 'Plantillas de Carta Porte por ruta',
+            },
+        ),
+    ]
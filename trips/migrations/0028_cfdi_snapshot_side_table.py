@@ -0,0 +1,116 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:26
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+def _encode(data):
+    if data is None:
+        return None
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"), cls=DjangoJSONEncoder)
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def _decode(blob):
+    if not blob:
+        return None
+    return json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+
+
+def move_snapshots(apps, schema_editor):
+    CartaPorteCFDI = apps.get_model("trips", "CartaPorteCFDI")
+    CartaPorteSnapshot = apps.get_model("trips", "CartaPorteSnapshot")
+
+    qs = (
+        CartaPorteCFDI.objects
+        .filter(models.Q(payload_snapshot__isnull=False) | models.Q(response_snapshot__isnull=False))
+        .only("id", "payload_snapshot", "response_snapshot")
+    )
+    snapshots, cartas = [], []
+
+    def flush():
+        CartaPorteSnapshot.objects.bulk_create(snapshots, batch_size=200)
+        CartaPorteCFDI.objects.bulk_update(cartas, ["verification_url", "cancellation_status"], batch_size=200)
+        snapshots.clear()
+        cartas.clear()
+
+    for carta in qs.iterator(chunk_size=200):
+        snapshots.append(CartaPorteSnapshot(
+            carta_id=carta.id,
+            payload_z=_encode(carta.payload_snapshot),
+            response_z=_encode(carta.response_snapshot),
+        ))
+        resp = carta.response_snapshot if isinstance(carta.response_snapshot, dict) else {}
+        raw = resp.get("raw") if isinstance(resp.get("raw"), dict) else {}
+        carta.verification_url = (raw.get("verification_url") or resp.get("verification_url") or "")[:500]
+        carta.cancellation_status = (
+            resp.get("cancellation_status") or raw.get("cancellation_status") or ""
+        )[:20]
+        cartas.append(carta)
+        if len(snapshots) >= 200:
+            flush()
+    if snapshots:
+        flush()
+
+
+def restore_snapshots(apps, schema_editor):
+    CartaPorteCFDI = apps.get_model("trips", "CartaPorteCFDI")
+    CartaPorteSnapshot = apps.get_model("trips", "CartaPorteSnapshot")
+    batch = []
+    for snap in CartaPorteSnapshot.objects.iterator(chunk_size=200):
+        batch.append(CartaPorteCFDI(
+            id=snap.carta_id,
+            payload_snapshot=_decode(snap.payload_z),
+            response_snapshot=_decode(snap.response_z),
+        ))
+        if len(batch) >= 200:
+            CartaPorteCFDI.objects.bulk_update(batch, ["payload_snapshot", "response_snapshot"])
+            batch = []
+    if batch:
+        CartaPorteCFDI.objects.bulk_update(batch, ["payload_snapshot", "response_snapshot"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0027_cartaporteroutetemplate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartaPorteSnapshot',
+            fields=[
+                ('carta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='trips.cartaportecfdi')),
+                ('payload_z', models.BinaryField(blank=True, null=True)),
+                ('response_z', models.BinaryField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Snapshot CFDI',
+                'verbose_name_plural': 'Snapshots CFDI',
+            },
+        ),
+        migrations.AddField(
+            model_name='cartaportecfdi',
+            name='cancellation_status',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='cartaportecfdi',
+            name='verification_url',
+            field=models.URLField(blank=True, db_index=True, default='', max_length=500),
+        ),
+        migrations.RunPython(move_snapshots, restore_snapshots),
+        migrations.RemoveField(
+            model_name='cartaportecfdi',
+            name='payload_snapshot',
+        ),
+        migrations.RemoveField(
+            model_name='cartaportecfdi',
+            name='response_snapshot',
+        ),
+    ]
@@ -1,4 +1,8 @@
 # trips/models.py
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from customers.models import Client
 from trucks.models import Truck, ReeferBox
@@ -255,7 +259,9 @@ class CartaPorteCFDI(models.Model):
     )
 
     # --- Datos del timbrado ---
-    uuid = models.CharField(max_length=100, blank=True, null=True)
+    uuid = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # ID de la factura en Facturapi (antes solo vivía dentro de response_snapshot)
+    facturapi_id = models.CharField(max_length=40, blank=True, default="", db_index=True)
     pdf_url = models.URLField(blank=True, null=True)
     xml_url = models.URLField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="draft")
@@ -263,9 +269,10 @@ class CartaPorteCFDI(models.Model):
     emitter_no_cert = models.CharField(max_length=32, blank=True, default="")
     sat_no_cert = models.CharField(max_length=32, blank=True, default="")
 
-    # Snapshots JSON
-    payload_snapshot = models.JSONField(blank=True, null=True)   # lo que enviaste a FacturAPI
-    response_snapshot = models.JSONField(blank=True, null=True)  # lo que regresó FacturAPI
+    # Datos de la respuesta de Facturapi que sí se consultan (el JSON completo
+    # vive comprimido en CartaPorteSnapshot y se carga solo cuando se pide)
+    verification_url = models.URLField(max_length=500, blank=True, default="", db_index=True)
+    cancellation_status = models.CharField(max_length=20, blank=True, default="")
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -290,15 +297,120 @@ class CartaPorteCFDI(models.Model):
         """
         self.total = (self.subtotal or 0) + (self.iva or 0) - (self.retencion or 0)
 
+    # ======================================================
+    # Snapshots JSON (tabla aparte, bajo demanda)
+    # ======================================================
+    def _snapshot_value(self, name: str):
+        pending = self.__dict__.get("_pending_snapshots") or {}
+        if name in pending:
+            return pending[name]
+        if not self.pk:
+            return None
+        # decodificado una sola vez por instancia (el PDF lee response_snapshot muchas veces)
+        decoded = self.__dict__.setdefault("_decoded_snapshots", {})
+        if name not in decoded:
+            try:
+                row = self.snapshot
+            except CartaPorteSnapshot.DoesNotExist:
+                return None
+            decoded[name] = row.payload if name == "payload_snapshot" else row.response
+        return decoded[name]
+
+    def _set_snapshot_value(self, name: str, value):
+        self.__dict__.setdefault("_pending_snapshots", {})[name] = value
+        self.__dict__.get("_decoded_snapshots", {}).pop(name, None)
+
+    @property
+    def payload_snapshot(self):
+        """Lo que se envió a Facturapi."""
+        return self._snapshot_value("payload_snapshot")
+
+    @payload_snapshot.setter
+    def payload_snapshot(self, value):
+        self._set_snapshot_value("payload_snapshot", value)
+
+    @property
+    def response_snapshot(self):
+        """Lo que regresó Facturapi."""
+        return self._snapshot_value("response_snapshot")
+
+    @response_snapshot.setter
+    def response_snapshot(self, value):
+        self._set_snapshot_value("response_snapshot", value)
+
     def save(self, *args, **kwargs):
         # fuerza subtotal (snapshot)
         self.sync_subtotal_from_trip()
         # recalcula total (si quieres que sea siempre consistente)
         self.compute_total()
+
+        pending = self.__dict__.pop("_pending_snapshots", None)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = [f for f in update_fields if f not in CartaPorteSnapshot.CARTA_ATTRS]
+
         super().save(*args, **kwargs)
+        if pending:
+            CartaPorteSnapshot.store(self, **pending)
 
 
 
+class CartaPorteSnapshot(models.Model):
+    """
+    JSON de request/response de Facturapi, comprimido (zlib), fuera de la
+    fila de CartaPorteCFDI que leen listas, detalle y candados.
+    """
+    CARTA_ATTRS = ("payload_snapshot", "response_snapshot")
+
+    carta = models.OneToOneField(
+        CartaPorteCFDI,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="snapshot",
+    )
+    payload_z = models.BinaryField(blank=True, null=True)
+    response_z = models.BinaryField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Snapshot CFDI"
+        verbose_name_plural = "Snapshots CFDI"
+
+    @staticmethod
+    def encode(data) -> bytes | None:
+        if data is None:
+            return None
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"), cls=DjangoJSONEncoder)
+        return zlib.compress(raw.encode("utf-8"), 6)
+
+    @staticmethod
+    def decode(blob):
+        if not blob:
+            return None
+        return json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+
+    @property
+    def payload(self):
+        return self.decode(self.payload_z)
+
+    @property
+    def response(self):
+        return self.decode(self.response_z)
+
+    @classmethod
+    def store(cls, carta: CartaPorteCFDI, **values) -> "CartaPorteSnapshot":
+        """Guarda payload_snapshot / response_snapshot (solo los que vengan)."""
+        row = cls.objects.filter(carta=carta).first() or cls(carta=carta)
+        if "payload_snapshot" in values:
+            row.payload_z = cls.encode(values["payload_snapshot"])
+        if "response_snapshot" in values:
+            row.response_z = cls.encode(values["response_snapshot"])
+        row.save()
+        carta.snapshot = row
+        carta.__dict__.pop("_decoded_snapshots", None)
+        return row
+
+
 class CartaPorteGoods(models.Model):
     carta_porte = models.ForeignKey(
         CartaPorteCFDI,
@@ -415,4 +527,71 @@ class CartaPorteItem(models.Model):
 
     def save(self, *args, **kwargs):
         self.compute()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class FacturapiWebhookEvent(models.Model):
+    """
+    Evento recibido por webhook de Facturapi. El event_id único deduplica
+    reintentos del proveedor; el procesamiento es asíncrono e idempotente.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pendiente"),
+        ("processed", "Procesado"),
+        ("ignored", "Ignorado"),
+        ("error", "Error"),
+    ]
+
+    event_id = models.CharField(max_length=64, unique=True)
+    event_type = models.CharField(max_length=80, blank=True, default="")
+    invoice_id = models.CharField(max_length=40, blank=True, default="", db_index=True)
+    uuid = models.CharField(max_length=100, blank=True, default="")
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    carta = models.ForeignKey(
+        CartaPorteCFDI,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="webhook_events",
+    )
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Evento webhook Facturapi"
+        verbose_name_plural = "Eventos webhook Facturapi"
+        ordering = ["received_at", "id"]
+
+    def __str__(self):
+        return f"{self.event_type or 'evento'} {self.event_id} ({self.status})"
+
+
+class CartaPorteRouteTemplate(models.Model):
+    """
+    Plantilla materializada de Carta Porte por ruta: ubicaciones ya
+    normalizadas (SAT), mercancías típicas, distancia y descripción del
+    concepto. Se invalida cuando cambian la ruta, sus ubicaciones o el
+    cliente; las cartas nuevas la clonan con bulk_create.
+    """
+    route = models.OneToOneField(
+        "locations.Route",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="carta_porte_template",
+    )
+    locations = models.JSONField(default=list)   # valores de CartaPorteLocation (Origen, Destino)
+    goods = models.JSONField(default=list)       # valores de CartaPorteGoods de la última carta de la ruta
+    distancia_km = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    item_description = models.CharField(max_length=255, blank=True, default="")
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Plantilla de Carta Porte por ruta"
+        verbose_name_plural = "Plantillas de Carta Porte por ruta"
+
+    def __str__(self):
+        return f"Plantilla CP ruta {self.route_id}"
@@ -0,0 +1,409 @@
+# trips/services/carta_porte_drafts.py
+"""
+Defaults de Carta Porte (ubicaciones desde la ruta, concepto único, claves
+SAT de estado/país), plantilla materializada por ruta y creación de
+borradores en lote para viajes programados.
+
+El editor (CartaPorteEditView) y el lote usan las mismas funciones, así un
+borrador creado aquí se ve igual que uno abierto a mano.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from common.services import sat_catalogs
+from trips.models import (
+    CartaPorteCFDI,
+    CartaPorteGoods,
+    CartaPorteItem,
+    CartaPorteLocation,
+    CartaPorteRouteTemplate,
+    Trip,
+    TripStatus,
+)
+
+
+# ======================================================
+# SAT helpers
+# ======================================================
+ESTADO_SAT_MAP = {
+    "Aguascalientes": "AGS",
+    "Baja California": "BCN",
+    "Baja California Sur": "BCS",
+    "Campeche": "CAM",
+    "Chiapas": "CHP",
+    "Chihuahua": "CHH",
+    "Ciudad de México": "CMX",
+    "Coahuila": "COA",
+    "Colima": "COL",
+    "Durango": "DUR",
+    "Guanajuato": "GUA",
+    "Guerrero": "GRO",
+    "Hidalgo": "HID",
+    "Jalisco": "JAL",
+    "México": "MEX",
+    "Michoacán": "MIC",
+    "Morelos": "MOR",
+    "Nayarit": "NAY",
+    "Nuevo León": "NLE",
+    "Oaxaca": "OAX",
+    "Puebla": "PUE",
+    "Querétaro": "QUE",
+    "Quintana Roo": "ROO",
+    "San Luis Potosí": "SLP",
+    "Sinaloa": "SIN",
+    "Sonora": "SON",
+    "Tabasco": "TAB",
+    "Tamaulipas": "TAM",
+    "Tlaxcala": "TLA",
+    "Veracruz": "VER",
+    "Yucatán": "YUC",
+    "Zacatecas": "ZAC",
+}
+
+
+# Full US state map (name -> abbrev)
+US_STATE_MAP = {
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR",
+    "California": "CA", "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE",
+    "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID",
+    "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
+    "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
+    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
+    "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
+    "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
+    "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
+    "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC",
+    "South Dakota": "SD", "Tennessee": "TN", "TEXAS": "TX", "Utah": "UT",
+    "Vermont": "VT", "Virginia": "VA", "Washington": "WA", "West Virginia": "WV",
+    "Wisconsin": "WI", "Wyoming": "WY",
+    "District of Columbia": "DC",
+}
+
+
+def _s(v) -> str:
+    return (v or "").strip()
+
+
+def pais_sat(loc_model) -> str:
+    """
+    Devuelve country2: MX / US (lo que guardas en CartaPorteLocation.pais)
+    Intenta leer varios nombres de campo del modelo Location.
+    """
+    raw = (
+        _s(getattr(loc_model, "pais", None))
+        or _s(getattr(loc_model, "country", None))
+        or _s(getattr(loc_model, "country_code", None))
+    ).upper()
+
+    if raw in ("US", "USA", "UNITED STATES", "ESTADOS UNIDOS"):
+        return "US"
+    if raw in ("MX", "MEX", "MEXICO", "MÉXICO"):
+        return "MX"
+
+    # Heurística: si el "estado" parece abreviación US (TX, CA, etc.)
+    st = _s(getattr(loc_model, "estado", None)).upper()
+    if len(st) == 2 and st.isalpha():
+        return "US"
+
+    return "MX"
+
+
+def estado_sat(nombre_estado: str, *, country2: str = "MX") -> str:
+    n = _s(nombre_estado)
+    if not n:
+        return ""
+
+    c2 = _s(country2).upper() or "MX"
+
+    # Catálogo SAT c_Estado (si está cargado); si no, los mapas de abajo
+    clave = sat_catalogs.estado_clave(n, pais="USA" if c2 == "US" else "MEX")
+    if clave:
+        return clave
+
+    if c2 == "US":
+        raw = n.strip().upper()
+
+        # si viene "TX" (o "T X") lo normaliza
+        raw2 = re.sub(r"[^A-Z]", "", raw)
+        if len(raw2) == 2:
+            return raw2
+
+        # si viene "Texas" / "TEXAS" / "Texas, USA"
+        raw_name = re.sub(r"[^A-Z ]", " ", raw)
+        raw_name = re.sub(r"\s+", " ", raw_name).strip()
+        # intenta match exacto
+        if raw_name in US_STATE_MAP:
+            return US_STATE_MAP[raw_name]
+        # intenta si viene "TEXAS USA"
+        if raw_name.endswith(" USA"):
+            k = raw_name.replace(" USA", "").strip()
+            if k in US_STATE_MAP:
+                return US_STATE_MAP[k]
+
+        return ""  # si no se reconoce
+
+    # MX (tu mapa actual)
+    return (ESTADO_SAT_MAP.get(n) or "")[:3]
+
+
+# ======================================================
+# Builders (en memoria, sin guardar)
+# ======================================================
+def client_rfc(loc_model) -> str:
+    rfc = getattr(getattr(loc_model, "client", None), "rfc", "")
+    return rfc or "XAXX010101000"
+
+
+def location_sat_codes(loc_model) -> tuple[str, str]:
+    """(país, estado) SAT de una ubicación del catálogo."""
+    country2 = pais_sat(loc_model)
+    return country2, estado_sat(getattr(loc_model, "estado", None), country2=country2)
+
+
+def location_from_stop(
+    carta: CartaPorteCFDI,
+    loc_model,
+    tipo: str,
+    orden: int,
+    *,
+    sat_codes: Optional[tuple[str, str]] = None,
+) -> CartaPorteLocation:
+    country2, estado = sat_codes or location_sat_codes(loc_model)
+    return CartaPorteLocation(
+        carta_porte=carta,
+        tipo_ubicacion=tipo,
+        orden=orden,
+        rfc=client_rfc(loc_model),
+        nombre=loc_model.nombre or "",
+        localidad=getattr(loc_model, "poblacion", None) or getattr(loc_model, "localidad", None) or "",
+        codigo_postal=getattr(loc_model, "cp", None) or getattr(loc_model, "codigo_postal", None) or "",
+        calle=getattr(loc_model, "calle", None) or "",
+        numero_exterior=getattr(loc_model, "no_ext", None) or getattr(loc_model, "numero_exterior", None) or "",
+        numero_interior=getattr(loc_model, "no_int", None) or getattr(loc_model, "numero_interior", None) or "",
+        colonia=getattr(loc_model, "colonia_sat", None) or getattr(loc_model, "colonia", None) or "",
+        municipio=getattr(loc_model, "municipio", None) or "",
+        estado=estado,
+        pais=country2,  # ✅ NO forzar "MX"
+        referencia=getattr(loc_model, "referencias", None) or getattr(loc_model, "referencia", None) or "",
+    )
+
+
+def default_subtotal(trip: Trip) -> Decimal:
+    subtotal = trip.tarifa_cliente_snapshot or Decimal("0.00")
+    if subtotal == Decimal("0.00") and trip.route:
+        subtotal = getattr(trip.route, "tarifa_cliente", None) or Decimal("0.00")
+    return subtotal
+
+
+def default_item_description(trip: Trip) -> str:
+    route_str = str(trip.route) if trip.route_id else "Servicio de transporte"
+    return f"Flete {route_str}"[:255]
+
+
+def default_item(carta: CartaPorteCFDI, trip: Trip, *, description: str = "") -> CartaPorteItem:
+    subtotal = (carta.subtotal or Decimal("0.00")).quantize(Decimal("0.01"))
+    it = CartaPorteItem(
+        carta_porte=carta,
+        orden=0,
+        cantidad=Decimal("1.000"),
+        unidad="E48",
+        producto="FLETE",
+        descripcion=description or default_item_description(trip),
+        precio=subtotal,
+        descuento=Decimal("0.00"),
+        iva_pct=Decimal("16.00"),
+        ret_iva_pct=Decimal("0.00"),
+    )
+    it.compute()
+    return it
+
+
+# ======================================================
+# Plantilla por ruta (materializada)
+# ======================================================
+LOCATION_TEMPLATE_FIELDS = tuple(
+    f.attname for f in CartaPorteLocation._meta.concrete_fields if f.name not in ("id", "carta_porte")
+)
+# pedimento / UUID de comercio exterior son de cada embarque: no se copian
+GOODS_TEMPLATE_FIELDS = ("mercancia_id", "cantidad", "unidad", "embalaje", "peso_en_kg", "valor_mercancia", "moneda")
+
+
+def _row_values(obj, fields) -> dict:
+    out = {}
+    for name in fields:
+        v = getattr(obj, name)
+        out[name] = str(v) if isinstance(v, Decimal) else v
+    return out
+
+
+def build_route_template(route) -> CartaPorteRouteTemplate:
+    """Calcula (sin guardar) la plantilla de la ruta."""
+    origin = location_from_stop(None, route.origen, "Origen", 0)
+    destination = location_from_stop(None, route.destino, "Destino", 99)
+
+    route_locations = CartaPorteLocation.objects.filter(carta_porte__trip__route=route)
+    distance = (
+        route_locations
+        .filter(tipo_ubicacion="Destino", distancia_recorrida_km__isnull=False)
+        .order_by("-carta_porte_id")
+        .values_list("distancia_recorrida_km", flat=True)
+        .first()
+    )
+    destination.distancia_recorrida_km = distance
+
+    route_goods = CartaPorteGoods.objects.filter(carta_porte__trip__route=route, mercancia__isnull=False)
+    last_carta_id = route_goods.order_by("-carta_porte_id").values_list("carta_porte_id", flat=True).first()
+    goods = list(route_goods.filter(carta_porte_id=last_carta_id).order_by("id")) if last_carta_id else []
+
+    route_str = str(route)
+    return CartaPorteRouteTemplate(
+        route=route,
+        locations=[_row_values(l, LOCATION_TEMPLATE_FIELDS) for l in (origin, destination)],
+        goods=[_row_values(g, GOODS_TEMPLATE_FIELDS) for g in goods],
+        distancia_km=distance,
+        item_description=f"Flete {route_str}"[:255],
+    )
+
+
+def get_route_templates(routes: Iterable, *, save: bool = True) -> dict:
+    """
+    {route_id: plantilla}. Las que faltan se calculan y, con save=True, se
+    materializan en un solo upsert (el GET del editor usa save=False).
+    """
+    routes = {r.pk: r for r in routes if r is not None}
+    if not routes:
+        return {}
+
+    templates = {t.route_id: t for t in CartaPorteRouteTemplate.objects.filter(route_id__in=list(routes))}
+    missing = [build_route_template(r) for pk, r in routes.items() if pk not in templates]
+    if missing and save:
+        CartaPorteRouteTemplate.objects.bulk_create(
+            missing,
+            update_conflicts=True,
+            unique_fields=["route"],
+            update_fields=["locations", "goods", "distancia_km", "item_description", "built_at"],
+        )
+    templates.update({t.route_id: t for t in missing})
+    return templates
+
+
+def invalidate_route_templates(*, route_ids=(), location_ids=(), client_ids=()) -> None:
+    q = Q()
+    if route_ids:
+        q |= Q(route_id__in=list(route_ids))
+    if location_ids:
+        q |= Q(route__origen_id__in=list(location_ids)) | Q(route__destino_id__in=list(location_ids))
+    if client_ids:
+        q |= Q(route__origen__client_id__in=list(client_ids)) | Q(route__destino__client_id__in=list(client_ids))
+    if q:
+        CartaPorteRouteTemplate.objects.filter(q).delete()
+
+
+def locations_from_template(template: CartaPorteRouteTemplate, carta: CartaPorteCFDI) -> list:
+    return [CartaPorteLocation(carta_porte=carta, **values) for values in template.locations]
+
+
+def goods_from_template(template: CartaPorteRouteTemplate, carta: CartaPorteCFDI) -> list:
+    return [CartaPorteGoods(carta_porte=carta, **values) for values in template.goods]
+
+
+# ======================================================
+# Borradores en lote
+# ======================================================
+@dataclass
+class DraftReport:
+    created: int = 0
+    trip_ids: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)  # (trip_id, motivo)
+
+
+def trips_for_drafts(
+    *,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    trip_ids: Optional[Iterable[int]] = None,
+    include_undated: bool = False,
+):
+    """
+    Viajes programados, vivos y sin Carta Porte. El rango de fechas se
+    aplica sobre la salida del origen (departure_origin_at); con
+    include_undated también entran los que aún no la tienen capturada.
+    """
+    qs = (
+        Trip.objects
+        .filter(deleted=False, status=TripStatus.PROGRAMADO, carta_porte_cfdi__isnull=True)
+        .select_related("route__client", "route__origen__client", "route__destino__client")
+        .order_by("id")
+    )
+    if trip_ids:
+        qs = qs.filter(pk__in=list(trip_ids))
+    if date_from or date_to:
+        in_range = Q()
+        if date_from:
+            in_range &= Q(departure_origin_at__date__gte=date_from)
+        if date_to:
+            in_range &= Q(departure_origin_at__date__lte=date_to)
+        if include_undated:
+            in_range |= Q(departure_origin_at__isnull=True)
+        qs = qs.filter(in_range)
+    return qs
+
+
+def create_draft_cartas(trips, *, dry_run: bool = False) -> DraftReport:
+    """
+    Crea CartaPorteCFDI (draft) + ubicaciones + mercancías típicas + 1
+    concepto por viaje clonando la plantilla de su ruta (bulk_create por
+    tabla; la plantilla se materializa una vez por ruta).
+    """
+    report = DraftReport()
+    now = timezone.now()
+
+    plans = []
+    for trip in trips:
+        r = trip.route
+        if not r:
+            report.skipped.append((trip.id, "sin ruta"))
+            continue
+
+        carta = CartaPorteCFDI(
+            trip=trip,
+            status="draft",
+            customer_id=r.origen.client_id or trip.client_id,
+            fecha_salida=trip.departure_origin_at or now,
+            fecha_llegada=trip.arrival_destination_at or now,
+        )
+        # mismo resultado que CartaPorteCFDI.save(), que bulk_create no llama
+        carta.subtotal = default_subtotal(trip)
+        carta.compute_total()
+        plans.append((trip, carta))
+
+    report.trip_ids = [t.id for t, _ in plans]
+    if dry_run or not plans:
+        return report
+
+    with transaction.atomic():
+        templates = get_route_templates({trip.route for trip, _ in plans})
+        CartaPorteCFDI.objects.bulk_create([carta for _, carta in plans], batch_size=500)
+
+        locations, goods, items = [], [], []
+        for trip, carta in plans:
+            tpl = templates[trip.route_id]
+            locations.extend(locations_from_template(tpl, carta))
+            goods.extend(goods_from_template(tpl, carta))
+            items.append(default_item(carta, trip, description=tpl.item_description))
+
+        CartaPorteLocation.objects.bulk_create(locations, batch_size=1000)
+        CartaPorteGoods.objects.bulk_create(goods, batch_size=1000)
+        CartaPorteItem.objects.bulk_create(items, batch_size=1000)
+
+    report.created = len(plans)
+    return report
@@ -0,0 +1,312 @@
+# trips/services/carta_porte_validation.py
+"""
+Validación local (sin red) del payload CFDI + Carta Porte antes de
+mandarlo a Facturapi.
+
+Reglas SAT más comunes que hoy solo se descubren con el rechazo remoto:
+RFCs, CP/estado, catálogos (BienesTransp, ClaveUnidad, colonias),
+pesos y campos de transporte internacional.
+
+Los catálogos que no estén cargados (SatCatalogEntry / PostalCodeSummary)
+simplemente no se validan.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from common.models import PostalCodeSummary, SatCatalog
+from common.services import sat_catalogs
+from trips.facturapi_payloads import (
+    _d,
+    _is_valid_rfc_with_real_date,
+    _s,
+    build_cfdi_payload,
+)
+from trips.models import CartaPorteCFDI
+
+GENERIC_RFCS = {"XAXX010101000", "XEXX010101000"}
+CP_MX_RE = re.compile(r"^\d{5}$")
+PRODUCT_KEY_RE = re.compile(r"^\d{8}$")
+FRACCION_RE = re.compile(r"^\d{8,10}$")
+
+# Tolerancia para PesoBrutoTotal vs suma de PesoEnKg
+PESO_TOLERANCIA = Decimal("0.01")
+
+# Clave SEPOMEX (c_estado) -> c_Estado SAT
+SEPOMEX_TO_SAT_ESTADO = {
+    "01": "AGU", "02": "BCN", "03": "BCS", "04": "CAM", "05": "COA", "06": "COL",
+    "07": "CHP", "08": "CHH", "09": "CMX", "10": "DUR", "11": "GUA", "12": "GRO",
+    "13": "HID", "14": "JAL", "15": "MEX", "16": "MIC", "17": "MOR", "18": "NAY",
+    "19": "NLE", "20": "OAX", "21": "PUE", "22": "QUE", "23": "ROO", "24": "SLP",
+    "25": "SIN", "26": "SON", "27": "TAB", "28": "TAM", "29": "TLA", "30": "VER",
+    "31": "YUC", "32": "ZAC",
+}
+
+
+@dataclass(frozen=True)
+class ValidationIssue:
+    path: str
+    message: str
+    level: str = "error"  # error | warning
+
+    @property
+    def is_error(self) -> bool:
+        return self.level == "error"
+
+    def __str__(self):
+        return f"{self.path}: {self.message}"
+
+
+class _Collector:
+    def __init__(self):
+        self.issues: List[ValidationIssue] = []
+
+    def error(self, path: str, message: str):
+        self.issues.append(ValidationIssue(path, message, "error"))
+
+    def warning(self, path: str, message: str):
+        self.issues.append(ValidationIssue(path, message, "warning"))
+
+
+# ============================================================
+# Reglas
+# ============================================================
+
+def _check_rfc(c: _Collector, path: str, rfc: str):
+    r = _s(rfc).upper()
+    if not r:
+        c.error(path, "RFC requerido.")
+    elif r not in GENERIC_RFCS and not _is_valid_rfc_with_real_date(r):
+        c.error(path, f"RFC inválido ({r}).")
+
+
+def _cp_estado_sat(cp: str, cache: Dict[str, Optional[str]]) -> Optional[str]:
+    """c_Estado SAT del CP según la tabla resumen (None si no se conoce)."""
+    if cp not in cache:
+        row = PostalCodeSummary.objects.filter(pk=cp).values_list("estado_code", flat=True).first()
+        cache[cp] = SEPOMEX_TO_SAT_ESTADO.get(row) if row else None
+    return cache[cp]
+
+
+def _check_domicilio_mx(c: _Collector, path: str, dom: Dict[str, Any], cp_cache: dict, *, cps_loaded: bool):
+    cp = _s(dom.get("CodigoPostal"))
+    estado = _s(dom.get("Estado")).upper()
+
+    if not CP_MX_RE.match(cp):
+        c.error(f"{path}.CodigoPostal", f"CP inválido ({cp or 'vacío'}); deben ser 5 dígitos.")
+        return
+
+    estados = sat_catalogs.get_catalog(SatCatalog.ESTADO)
+    if not estado:
+        c.error(f"{path}.Estado", "Estado requerido.")
+    elif len(estados) and not estados.exists(estado, "MEX"):
+        c.error(f"{path}.Estado", f"Estado '{estado}' no existe en c_Estado.")
+
+    if cps_loaded:
+        cp_estado = _cp_estado_sat(cp, cp_cache)
+        if cp_estado is None:
+            c.error(f"{path}.CodigoPostal", f"CP {cp} no existe en SEPOMEX.")
+        elif estado and cp_estado != estado:
+            c.error(f"{path}.Estado", f"El CP {cp} pertenece a {cp_estado}, no a {estado}.")
+
+    colonia = _s(dom.get("Colonia"))
+    colonias = sat_catalogs.get_catalog(SatCatalog.COLONIA)
+    if colonia and len(colonias) and colonia.isdigit() and not colonias.exists(colonia, cp):
+        c.error(f"{path}.Colonia", f"Colonia {colonia} no corresponde al CP {cp} (c_Colonia).")
+
+
+def _check_customer(c: _Collector, customer: Dict[str, Any]):
+    _check_rfc(c, "customer.tax_id", customer.get("tax_id"))
+    if not _s(customer.get("legal_name")):
+        c.error("customer.legal_name", "Razón social requerida.")
+
+    addr = customer.get("address") or {}
+    country = _s(addr.get("country")).upper() or "MEX"
+    tax_id = _s(customer.get("tax_id")).upper()
+    if country == "MEX":
+        if tax_id == "XEXX010101000":
+            c.error("customer.tax_id", "RFC genérico extranjero con domicilio en México.")
+        if not CP_MX_RE.match(_s(addr.get("zip"))):
+            c.error("customer.address.zip", "CP del receptor inválido; deben ser 5 dígitos.")
+    elif tax_id == "XEXX010101000" and not _s(customer.get("foreign_tax_id")):
+        c.warning("customer.foreign_tax_id", "Receptor extranjero sin NumRegIdTrib.")
+
+
+def _check_items(c: _Collector, items: List[Dict[str, Any]]):
+    if not items:
+        c.error("items", "El CFDI no tiene conceptos.")
+        return
+    unidades = sat_catalogs.get_catalog(SatCatalog.CLAVE_UNIDAD)
+    for i, it in enumerate(items):
+        path = f"items[{i}]"
+        prod = it.get("product") or {}
+        if _d(it.get("quantity")) <= 0:
+            c.error(f"{path}.quantity", "Cantidad debe ser mayor a 0.")
+        if _d(prod.get("price")) < 0:
+            c.error(f"{path}.product.price", "Precio no puede ser negativo.")
+        if not PRODUCT_KEY_RE.match(_s(prod.get("product_key"))):
+            c.error(f"{path}.product.product_key", "ClaveProdServ debe ser de 8 dígitos.")
+        unit_key = _s(prod.get("unit_key"))
+        if not unit_key:
+            c.error(f"{path}.product.unit_key", "ClaveUnidad requerida.")
+        elif len(unidades) and not unidades.exists(unit_key):
+            c.error(f"{path}.product.unit_key", f"ClaveUnidad '{unit_key}' no existe en c_ClaveUnidad.")
+
+
+def _check_ubicaciones(c: _Collector, ubicaciones: List[Dict[str, Any]], cp_cache: dict):
+    if len(ubicaciones) < 2:
+        c.error("Ubicaciones", "Se requieren al menos un Origen y un Destino.")
+        return
+
+    tipos = [_s(u.get("TipoUbicacion")) for u in ubicaciones]
+    if tipos[0] != "Origen":
+        c.error("Ubicaciones[0].TipoUbicacion", "La primera ubicación debe ser Origen.")
+    if tipos[-1] != "Destino":
+        c.error(f"Ubicaciones[{len(tipos) - 1}].TipoUbicacion", "La última ubicación debe ser Destino.")
+
+    cps_loaded = PostalCodeSummary.objects.exists()
+    prev_dt = ""
+    for i, u in enumerate(ubicaciones):
+        path = f"Ubicaciones[{i}]"
+        _check_rfc(c, f"{path}.RFCRemitenteDestinatario", u.get("RFCRemitenteDestinatario"))
+
+        dt = _s(u.get("FechaHoraSalidaLlegada"))
+        if not dt:
+            c.error(f"{path}.FechaHoraSalidaLlegada", "Fecha/hora requerida.")
+        elif prev_dt and dt < prev_dt:  # ISO sin zona: comparación lexicográfica
+            c.error(f"{path}.FechaHoraSalidaLlegada", "Fecha anterior a la ubicación previa.")
+        prev_dt = dt or prev_dt
+
+        if tipos[i] == "Destino" and _d(u.get("DistanciaRecorrida")) <= 0:
+            c.error(f"{path}.DistanciaRecorrida", "Distancia recorrida requerida en el Destino.")
+
+        dom = u.get("Domicilio") or {}
+        if _s(dom.get("Pais")).upper() == "MEX":
+            _check_domicilio_mx(c, f"{path}.Domicilio", dom, cp_cache, cps_loaded=cps_loaded)
+        elif not _s(dom.get("CodigoPostal")):
+            c.error(f"{path}.Domicilio.CodigoPostal", "Código postal requerido.")
+
+
+def _check_mercancias(c: _Collector, mercancias: Dict[str, Any], *, internacional: bool, entrada: bool):
+    rows = mercancias.get("Mercancia") or []
+    if not rows:
+        c.error("Mercancias", "No hay mercancías (o ninguna tiene clave BienesTransp).")
+        return
+
+    if int(mercancias.get("NumTotalMercancias") or 0) != len(rows):
+        c.error("Mercancias.NumTotalMercancias", "No coincide con el número de mercancías.")
+
+    productos = sat_catalogs.get_catalog(SatCatalog.CLAVE_PROD_SERV_CP)
+    unidades = sat_catalogs.get_catalog(SatCatalog.CLAVE_UNIDAD)
+
+    peso_total = Decimal("0")
+    for i, m in enumerate(rows):
+        path = f"Mercancias.Mercancia[{i}]"
+        clave = _s(m.get("BienesTransp"))
+        if len(productos) and not productos.exists(clave):
+            c.error(f"{path}.BienesTransp", f"'{clave}' no existe en c_ClaveProdServCP.")
+        elif productos.extra(clave) == "1" and not m.get("MaterialPeligroso"):
+            c.error(f"{path}.MaterialPeligroso", f"'{clave}' es material peligroso; faltan sus datos.")
+
+        unidad = _s(m.get("ClaveUnidad"))
+        if len(unidades) and not unidades.exists(unidad):
+            c.error(f"{path}.ClaveUnidad", f"'{unidad}' no existe en c_ClaveUnidad.")
+
+        if _d(m.get("Cantidad")) <= 0:
+            c.error(f"{path}.Cantidad", "Cantidad debe ser mayor a 0.")
+
+        peso = _d(m.get("PesoEnKg"))
+        if peso <= 0:
+            c.error(f"{path}.PesoEnKg", "Peso en kg requerido.")
+        peso_total += peso
+
+        if internacional:
+            if not FRACCION_RE.match(_s(m.get("FraccionArancelaria"))):
+                c.error(f"{path}.FraccionArancelaria", "Fracción arancelaria requerida en transporte internacional.")
+            if entrada and not m.get("DocumentacionAduanera"):
+                c.error(f"{path}.DocumentacionAduanera", "Pedimento requerido para entrada de mercancía.")
+
+    declarado = _d(mercancias.get("PesoBrutoTotal"))
+    if abs(declarado - peso_total) > PESO_TOLERANCIA:
+        c.error("Mercancias.PesoBrutoTotal", f"{declarado} no coincide con la suma de PesoEnKg ({peso_total}).")
+
+
+def _check_figuras(c: _Collector, figuras: List[Dict[str, Any]]):
+    if not figuras:
+        c.error("FiguraTransporte", "Se requiere al menos un operador.")
+        return
+    for i, f in enumerate(figuras):
+        path = f"FiguraTransporte[{i}]"
+        _check_rfc(c, f"{path}.RFCFigura", f.get("RFCFigura"))
+        if _s(f.get("TipoFigura")) == "01" and not _s(f.get("NumLicencia")):
+            c.error(f"{path}.NumLicencia", "El operador no tiene licencia federal.")
+
+
+# ============================================================
+# API
+# ============================================================
+
+def validate_cfdi_payload(payload: Dict[str, Any]) -> List[ValidationIssue]:
+    """Valida un payload ya construido (build_cfdi_payload). No hace red."""
+    c = _Collector()
+    cp_cache: Dict[str, Optional[str]] = {}
+
+    _check_customer(c, payload.get("customer") or {})
+    _check_items(c, payload.get("items") or [])
+
+    complements = payload.get("complements") or []
+    carta_porte = next((x.get("data") or {} for x in complements if x.get("type") == "carta_porte"), None)
+    if carta_porte is None:
+        c.error("complements", "Falta el complemento Carta Porte.")
+        return c.issues
+
+    internacional = _s(carta_porte.get("TranspInternac")) == "Sí"
+    entrada = _s(carta_porte.get("EntradaSalidaMerc")) == "Entrada"
+    if internacional:
+        if _s(carta_porte.get("EntradaSalidaMerc")) not in ("Entrada", "Salida"):
+            c.error("EntradaSalidaMerc", "Debe ser Entrada o Salida en transporte internacional.")
+        if len(_s(carta_porte.get("PaisOrigenDestino"))) != 3:
+            c.error("PaisOrigenDestino", "País origen/destino requerido (ISO-3).")
+        if not _s(carta_porte.get("ViaEntradaSalida")):
+            c.error("ViaEntradaSalida", "Vía de entrada/salida requerida.")
+
+    _check_ubicaciones(c, carta_porte.get("Ubicaciones") or [], cp_cache)
+    _check_mercancias(c, carta_porte.get("Mercancias") or {}, internacional=internacional, entrada=entrada)
+    _check_figuras(c, carta_porte.get("FiguraTransporte") or [])
+    return c.issues
+
+
+def validate_carta(carta: CartaPorteCFDI) -> List[ValidationIssue]:
+    """
+    Construye el payload de la carta y lo valida. Además avisa de RFCs
+    capturados mal que el builder sustituye en silencio por el genérico.
+    """
+    c = _Collector()
+    operator = getattr(carta.trip, "operator", None)
+    if not carta.customer_id:
+        c.error("customer", "La Carta Porte no tiene cliente.")
+    if operator is None:
+        c.error("trip.operator", "El viaje no tiene operador.")
+    if carta.total <= 0:
+        c.error("total", "El total del CFDI debe ser mayor a 0.")
+    if c.issues:
+        return c.issues
+
+    client = carta.customer
+    raw_rfc = _s(getattr(client, "rfc", None)).upper()
+    if _s(getattr(client, "pais", "MX")).upper() in ("", "MX") and raw_rfc and not _is_valid_rfc_with_real_date(raw_rfc):
+        c.warning("customer.rfc", f"RFC capturado '{raw_rfc}' inválido; se enviará como público en general.")
+
+    payload = build_cfdi_payload(carta=carta, trip_operator=operator)
+    return c.issues + validate_cfdi_payload(payload)
+
+
+def format_issues(issues: List[ValidationIssue], limit: int = 10) -> str:
+    errors = [i for i in issues if i.is_error]
+    text = "; ".join(str(i) for i in errors[:limit])
+    if len(errors) > limit:
+        text += f"; (+{len(errors) - limit} más)"
+    return text
@@ -0,0 +1,232 @@
+# trips/services/cfdi_export.py
+"""
+Exportación masiva de CFDI timbrados (XML + PDF) para cierre contable.
+
+- XML: caché local en MEDIA_ROOT/cfdi_xml/<uuid>.xml; lo que no está en
+  caché se descarga de Facturapi en paralelo (pool de hilos acotado).
+- PDF: el HTML se arma aquí; WeasyPrint corre en el pool de procesos de
+  common.pdf.
+- Todo se consume de forma perezosa para alimentar common.pdf.iter_zip
+  (StreamingHttpResponse): nunca se tiene el ZIP completo en memoria.
+"""
+from __future__ import annotations
+
+import base64
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import qrcode
+from django.conf import settings
+from django.db import connections
+from django.template.loader import render_to_string
+
+from common.pdf import iter_pdf_batch
+from trips.models import CartaPorteCFDI
+from trips.services.facturapi import FacturapiError, download_carta_porte_xml
+
+PDF_TEMPLATE = "trips/carta_porte_pdf.html"
+
+
+# ======================================================
+# QR / contexto del PDF
+# ======================================================
+def build_qr_data_uri(url: str) -> str | None:
+    if not url:
+        return None
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=6,
+        border=2,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+
+    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+    return f"data:image/png;base64,{b64}"
+
+
+def carta_porte_pdf_context(carta: CartaPorteCFDI) -> dict:
+    verification_url = carta.verification_url
+    if not verification_url:
+        # registros previos a la columna: se lee el snapshot (tabla aparte)
+        raw = (carta.response_snapshot or {}).get("raw", {}) or {}
+        verification_url = raw.get("verification_url")
+    return {
+        "carta": carta,
+        "qr_data_uri": build_qr_data_uri(verification_url),
+        "verification_url": verification_url,
+    }
+
+
+# ======================================================
+# Caché local de XML
+# ======================================================
+def _xml_cache_dir() -> Path:
+    # privado: fuera de MEDIA_ROOT para que el servidor web nunca lo publique
+    return Path(getattr(settings, "CFDI_XML_CACHE_DIR", "") or (Path(settings.BASE_DIR) / "var" / "cfdi_xml"))
+
+
+def _xml_cache_path(carta: CartaPorteCFDI) -> Optional[Path]:
+    key = (carta.uuid or "").strip()
+    if not key:
+        return None
+    return _xml_cache_dir() / f"{key}.xml"
+
+
+def read_cached_xml(carta: CartaPorteCFDI) -> Optional[bytes]:
+    path = _xml_cache_path(carta)
+    if path and path.exists():
+        return path.read_bytes()
+    return None
+
+
+def _write_cached_xml(carta: CartaPorteCFDI, xml_bytes: bytes) -> None:
+    path = _xml_cache_path(carta)
+    if not path:
+        return
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # escritura atómica: otro hilo/proceso nunca ve un XML a medias
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(xml_bytes)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def get_carta_xml(carta: CartaPorteCFDI) -> bytes:
+    """XML timbrado: de la caché local o de Facturapi (y se guarda en caché)."""
+    cached = read_cached_xml(carta)
+    if cached is not None:
+        return cached
+    xml_bytes = download_carta_porte_xml(carta=carta)
+    _write_cached_xml(carta, xml_bytes)
+    return xml_bytes
+
+
+# ======================================================
+# Paralelismo acotado (orden preservado)
+# ======================================================
+def _bounded_map(fn: Callable, items: Iterable, max_workers: int) -> Iterator[tuple]:
+    """
+    (item, resultado, error) en el mismo orden que `items`, con a lo más
+    2×max_workers tareas en vuelo: no se encola todo el mes en memoria.
+    """
+    window = max(1, max_workers) * 2
+    inflight: deque = deque()
+    it = iter(items)
+
+    def call(item):
+        try:
+            return fn(item), None
+        except Exception as e:  # se reporta en el ZIP, no se aborta el stream
+            return None, e
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="cfdi-xml") as pool:
+        for item in it:
+            inflight.append((item, pool.submit(call, item)))
+            if len(inflight) >= window:
+                head, fut = inflight.popleft()
+                yield (head, *fut.result())
+        while inflight:
+            head, fut = inflight.popleft()
+            yield (head, *fut.result())
+
+
+# ======================================================
+# Export
+# ======================================================
+def cartas_for_export(
+    *,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    customer_id: Optional[int] = None,
+    status: str = "stamped",
+):
+    qs = (
+        CartaPorteCFDI.objects
+        .select_related("customer", "trip")
+        .filter(uuid__isnull=False)
+        .exclude(uuid="")
+    )
+    if status:
+        qs = qs.filter(status=status)
+    if date_from:
+        qs = qs.filter(fecha_salida__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(fecha_salida__date__lte=date_to)
+    if customer_id:
+        qs = qs.filter(customer_id=customer_id)
+    return qs.order_by("fecha_salida", "id")
+
+
+def export_entry_name(carta: CartaPorteCFDI, ext: str) -> str:
+    return f"{ext}/carta-porte-{carta.uuid}.{ext}"
+
+
+def _xml_entries(cartas: list, errors: list, max_workers: int) -> Iterator[tuple[str, bytes]]:
+    # Primero lo que ya está en caché (sin hilos); el resto en paralelo
+    missing = []
+    for carta in cartas:
+        cached = read_cached_xml(carta)
+        if cached is not None:
+            yield export_entry_name(carta, "xml"), cached
+        else:
+            missing.append(carta)
+
+    for carta, xml_bytes, err in _bounded_map(get_carta_xml, missing, max_workers):
+        if err is not None:
+            msg = str(err) if isinstance(err, FacturapiError) else repr(err)
+            errors.append(f"XML carta #{carta.id} ({carta.uuid}): {msg}")
+            continue
+        yield export_entry_name(carta, "xml"), xml_bytes
+
+
+def _pdf_entries(cartas: list, base_url: str) -> Iterator[tuple[str, bytes]]:
+    jobs = (
+        (export_entry_name(carta, "pdf"), render_to_string(PDF_TEMPLATE, carta_porte_pdf_context(carta)))
+        for carta in cartas
+    )
+    yield from iter_pdf_batch(jobs, base_url=base_url)
+
+
+def iter_cfdi_export(
+    cartas,
+    *,
+    base_url: str,
+    include_xml: bool = True,
+    include_pdf: bool = True,
+    max_workers: Optional[int] = None,
+) -> Iterator[tuple[str, bytes]]:
+    """
+    (nombre, bytes) para common.pdf.iter_zip. Los XML que no se pudieron
+    obtener se listan en errores.txt al final del ZIP.
+    """
+    cartas = list(cartas)
+    workers = max_workers or int(getattr(settings, "CFDI_EXPORT_MAX_WORKERS", 4) or 4)
+    errors: list[str] = []
+
+    if include_xml:
+        yield from _xml_entries(cartas, errors, workers)
+    if include_pdf:
+        yield from _pdf_entries(cartas, base_url)
+
+    if errors:
+        yield "errores.txt", ("\n".join(errors) + "\n").encode("utf-8")
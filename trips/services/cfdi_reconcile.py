@@ -0,0 +1,172 @@
+# trips/services/cfdi_reconcile.py
+"""
+Conciliación de estatus CFDI local vs Facturapi.
+
+CartaPorteCFDI.status se fija al timbrar y no se vuelve a consultar; las
+cancelaciones hechas del lado del proveedor no se ven aquí. Este módulo
+recorre por páginas las cartas no finales que tienen ID de Facturapi,
+consulta su estatus en paralelo (sesión con pool + rate limit) y aplica
+los cambios con bulk_update.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from django.utils import timezone
+
+from trips.models import CartaPorteCFDI
+from trips.services.facturapi import FacturapiError, facturapi_session, get_invoice
+
+# Estatus locales que ya no cambian del lado de Facturapi
+FINAL_STATUSES = ("canceled",)
+
+# "draft" no se mapea: una carta timbrada nunca regresa a borrador
+FACTURAPI_TO_LOCAL_STATUS = {
+    "valid": "stamped",
+    "stamped": "stamped",
+    "canceled": "canceled",
+    "cancelled": "canceled",
+}
+
+
+class RateLimiter:
+    """Token bucket simple y thread-safe (N llamadas por segundo)."""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class Drift:
+    carta_id: int
+    uuid: str
+    invoice_id: str
+    local_status: str
+    remote_status: str
+    cancellation_status: str = ""
+
+
+@dataclass
+class ReconcileReport:
+    checked: int = 0
+    unchanged: int = 0
+    cancellation_changed: int = 0  # mismo estatus, cambió solo la solicitud de cancelación
+    drifts: List[Drift] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    updated: int = 0
+
+
+def iter_reconcilable(page_size: int = 200, statuses: Optional[list[str]] = None) -> Iterator[list[CartaPorteCFDI]]:
+    """Páginas (keyset por id) de cartas no finales con ID de Facturapi."""
+    qs = (
+        CartaPorteCFDI.objects
+        .exclude(status__in=FINAL_STATUSES)
+        .exclude(facturapi_id="")
+        .only("id", "uuid", "facturapi_id", "status", "cancellation_status", "updated_at")
+        .order_by("id")
+    )
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+
+    last_id = 0
+    while True:
+        page = list(qs.filter(id__gt=last_id)[:page_size])
+        if not page:
+            return
+        last_id = page[-1].id
+        yield page
+
+
+def reconcile(
+    *,
+    concurrency: int = 8,
+    rate_per_sec: float = 10.0,
+    page_size: int = 200,
+    dry_run: bool = False,
+    statuses: Optional[list[str]] = None,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> ReconcileReport:
+    report = ReconcileReport()
+    limiter = RateLimiter(rate_per_sec)
+    session = facturapi_session(pool_size=concurrency)
+
+    def fetch(carta: CartaPorteCFDI):
+        limiter.wait()
+        try:
+            return carta, get_invoice(
+                invoice_id=carta.facturapi_id,
+                session=session,
+                api_key=api_key,
+                base_url=base_url,
+            ), None
+        except FacturapiError as e:
+            return carta, None, e
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cfdi-reconcile") as pool:
+            for page in iter_reconcilable(page_size, statuses):
+                to_update: list[CartaPorteCFDI] = []
+                now = timezone.now()
+
+                for carta, remote, err in pool.map(fetch, page):
+                    report.checked += 1
+                    if err is not None:
+                        report.errors.append(f"Carta #{carta.id}: {err}")
+                        continue
+
+                    remote_raw = (remote.get("status") or "").strip().lower()
+                    new_status = FACTURAPI_TO_LOCAL_STATUS.get(remote_raw)
+                    cancellation = (remote.get("cancellation_status") or "").strip().lower()
+
+                    cancellation_changed = (carta.cancellation_status or "") != cancellation
+                    status_changed = bool(new_status) and new_status != carta.status
+
+                    if not (status_changed or cancellation_changed):
+                        report.unchanged += 1
+                        continue
+
+                    if status_changed:
+                        report.drifts.append(Drift(
+                            carta_id=carta.id,
+                            uuid=carta.uuid or remote.get("uuid") or "",
+                            invoice_id=carta.facturapi_id,
+                            local_status=carta.status,
+                            remote_status=remote_raw,
+                            cancellation_status=cancellation,
+                        ))
+                        carta.status = new_status
+                    else:
+                        report.cancellation_changed += 1
+
+                    carta.cancellation_status = cancellation[:20]
+                    carta.uuid = carta.uuid or remote.get("uuid") or None
+                    carta.updated_at = now
+                    to_update.append(carta)
+
+                if to_update and not dry_run:
+                    CartaPorteCFDI.objects.bulk_update(
+                        to_update, ["status", "cancellation_status", "uuid", "updated_at"], batch_size=200
+                    )
+                    report.updated += len(to_update)
+    finally:
+        session.close()
+
+    return report
@@ -7,9 +7,11 @@ import xml.etree.ElementTree as ET
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 from trips.models import CartaPorteCFDI, Trip
 from trips.facturapi_payloads import build_cfdi_payload
+from trips.services.carta_porte_validation import format_issues, validate_cfdi_payload
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +41,18 @@ def _get_facturapi_config():
 # ======================================================
 # HTTP helper (JSON)
 # ======================================================
+def facturapi_session(pool_size: int = 10) -> requests.Session:
+    """
+    Session con pool de conexiones keep-alive (para procesos en lote que
+    hacen muchas llamadas seguidas; el flujo normal usa `requests` directo).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def _facturapi_request(
     *,
     method: str,
@@ -46,6 +60,7 @@ def _facturapi_request(
     api_key: str,
     payload: Optional[Dict[str, Any]] = None,
     timeout: int = 30,
+    session: Optional[requests.Session] = None,
 ) -> Dict[str, Any]:
 
     headers = {
@@ -54,8 +69,9 @@ def _facturapi_request(
         "Accept": "application/json",
     }
 
+    http = session or requests
     try:
-        resp = requests.request(
+        resp = http.request(
             method=method.upper(),
             url=url,
             headers=headers,
@@ -180,16 +196,21 @@ def create_invoice_in_facturapi(*, carta: CartaPorteCFDI, trip: Trip) -> Dict[st
     if carta.total <= 0:
         raise FacturapiError("El total del CFDI debe ser mayor a 0.")
 
-    # =============================
-    # Config
-    # =============================
-    api_key, base_url, timeout = _get_facturapi_config()
-
     payload = build_cfdi_payload(
         carta=carta,
         trip_operator=trip.operator,
     )
 
+    # Validación local: errores de SAT detectables sin gastar una llamada
+    issues = validate_cfdi_payload(payload)
+    if any(i.is_error for i in issues):
+        raise FacturapiError(f"Validación local: {format_issues(issues)}")
+
+    # =============================
+    # Config
+    # =============================
+    api_key, base_url, timeout = _get_facturapi_config()
+
     url = f"{base_url}/invoices"
 
     # =============================
@@ -245,8 +266,11 @@ def create_invoice_in_facturapi(*, carta: CartaPorteCFDI, trip: Trip) -> Dict[st
 
 def _get_facturapi_invoice_id_from_carta(carta: CartaPorteCFDI) -> Optional[str]:
     """
-    Resuelve el invoice_id de Facturapi desde response_snapshot.
+    Resuelve el invoice_id de Facturapi (campo indexado; response_snapshot,
+    que vive en CartaPorteSnapshot, como respaldo para registros anteriores).
     """
+    if getattr(carta, "facturapi_id", ""):
+        return carta.facturapi_id
     snap = carta.response_snapshot or {}
     if not isinstance(snap, dict):
         return None
@@ -264,3 +288,32 @@ def download_carta_porte_xml(*, carta: CartaPorteCFDI) -> bytes:
             "No se encontró el ID de Facturapi en response_snapshot para descargar el XML."
         )
     return download_invoice_xml(invoice_id=invoice_id)
+
+
+# ======================================================
+# Consultar estatus de una factura
+# ======================================================
+def get_invoice(
+    *,
+    invoice_id: str,
+    session: Optional[requests.Session] = None,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> Dict[str, Any]:
+    """GET /invoices/{id} (status, cancellation_status, uuid, ...)."""
+    if not invoice_id:
+        raise FacturapiError("invoice_id requerido para consultar la factura.")
+
+    if api_key and base_url:
+        timeout = int(getattr(settings, "FACTURAPI_TIMEOUT_SECONDS", 30) or 30)
+    else:
+        cfg_key, cfg_url, timeout = _get_facturapi_config()
+        api_key, base_url = api_key or cfg_key, base_url or cfg_url
+
+    return _facturapi_request(
+        method="GET",
+        url=f"{base_url.rstrip('/')}/invoices/{invoice_id}",
+        api_key=api_key,
+        timeout=timeout,
+        session=session,
+    )
@@ -0,0 +1,214 @@
+# trips/services/facturapi_webhooks.py
+"""
+Webhooks de Facturapi (eventos de factura).
+
+- La vista valida la firma HMAC-SHA256 del cuerpo y guarda el evento; el
+  event_id es único, así que los reintentos del proveedor no se duplican.
+- El procesamiento corre fuera del request (cola en memoria + hilo
+  worker). Si el proceso se reinicia, lo pendiente se drena con
+  `manage.py process_facturapi_events`.
+- Aplicar un evento es idempotente: se fija el estatus remoto, no se
+  acumula nada. Una carta cancelada nunca regresa a timbrada.
+- Si aún no existe la carta (el webhook llegó antes de que se confirmara
+  el facturapi_id del timbrado) el evento queda pendiente y se reintenta
+  hasta FACTURAPI_WEBHOOK_MAX_ATTEMPTS veces; "ignored" es solo para tipos
+  de evento que no se manejan.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import queue
+import threading
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from trips.models import CartaPorteCFDI, FacturapiWebhookEvent
+from trips.services.cfdi_reconcile import FACTURAPI_TO_LOCAL_STATUS
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "Facturapi-Signature"
+
+
+class WebhookError(Exception):
+    """Evento inválido (se responde 400)."""
+    pass
+
+
+# ======================================================
+# Firma
+# ======================================================
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    """HMAC-SHA256 (hex) del cuerpo crudo; acepta el prefijo "sha256="."""
+    if not (secret and signature):
+        return False
+    sig = signature.strip()
+    if sig.startswith("sha256="):
+        sig = sig[len("sha256="):]
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, sig.lower())
+
+
+# ======================================================
+# Registro (deduplicado por event_id)
+# ======================================================
+def _invoice_object(payload: dict) -> dict:
+    data = payload.get("data") or {}
+    obj = data.get("object") if isinstance(data, dict) else None
+    return obj if isinstance(obj, dict) else {}
+
+
+def record_event(payload: dict) -> Tuple[FacturapiWebhookEvent, bool]:
+    """Guarda el evento. Regresa (evento, creado); creado=False si ya existía."""
+    if not isinstance(payload, dict):
+        raise WebhookError("El cuerpo debe ser un objeto JSON.")
+
+    event_id = str(payload.get("id") or "").strip()
+    if not event_id:
+        raise WebhookError("El evento no trae id.")
+
+    obj = _invoice_object(payload)
+    return FacturapiWebhookEvent.objects.get_or_create(
+        event_id=event_id[:64],
+        defaults={
+            "event_type": str(payload.get("type") or "")[:80],
+            "invoice_id": str(obj.get("id") or "")[:40],
+            "uuid": str(obj.get("uuid") or "")[:100],
+            "payload": payload,
+        },
+    )
+
+
+# ======================================================
+# Procesamiento
+# ======================================================
+def _find_carta(invoice_id: str, uuid: str) -> Optional[CartaPorteCFDI]:
+    # Búsquedas por columnas indexadas; nunca se recorre la tabla
+    qs = CartaPorteCFDI.objects.select_for_update().select_related("trip")
+    if invoice_id:
+        carta = qs.filter(facturapi_id=invoice_id).first()
+        if carta:
+            return carta
+    if uuid:
+        return qs.filter(uuid=uuid).first()
+    return None
+
+
+def _apply(event: FacturapiWebhookEvent) -> str:
+    if not event.event_type.startswith("invoice."):
+        event.last_error = f"Tipo de evento no manejado: {event.event_type or '-'}"
+        return "ignored"
+
+    obj = _invoice_object(event.payload)
+    carta = _find_carta(event.invoice_id, event.uuid)
+    if carta is None:
+        # puede ser un timbrado aún sin confirmar: se reintenta
+        event.last_error = "No hay Carta Porte con ese ID de Facturapi / UUID (se reintenta)."
+        return "pending"
+    event.carta = carta
+
+    remote_raw = (obj.get("status") or "").strip().lower()
+    cancellation = (obj.get("cancellation_status") or "").strip().lower()
+    new_status = FACTURAPI_TO_LOCAL_STATUS.get(remote_raw)
+    if carta.status == "canceled" and new_status != "canceled":
+        new_status = None  # evento atrasado: no se "des-cancela"
+
+    carta.status = new_status or carta.status
+    if cancellation:
+        carta.cancellation_status = cancellation[:20]
+    carta.uuid = carta.uuid or obj.get("uuid") or None
+    carta.facturapi_id = carta.facturapi_id or event.invoice_id
+    carta.save(update_fields=["status", "cancellation_status", "uuid", "facturapi_id", "updated_at"])
+    event.last_error = ""
+    return "processed"
+
+
+def process_event(event_pk: int) -> Optional[str]:
+    """
+    Procesa un evento pendiente (o con error y reintentos disponibles).
+    Regresa el estatus final, o None si no había nada que hacer.
+    """
+    max_attempts = int(getattr(settings, "FACTURAPI_WEBHOOK_MAX_ATTEMPTS", 5) or 5)
+
+    with transaction.atomic():
+        event = (
+            FacturapiWebhookEvent.objects.select_for_update()
+            .filter(pk=event_pk, status__in=("pending", "error"), attempts__lt=max_attempts)
+            .first()
+        )
+        if event is None:
+            return None
+
+        event.attempts += 1
+        try:
+            with transaction.atomic():
+                event.status = _apply(event)
+        except Exception as e:
+            logger.exception("Webhook Facturapi %s: error al procesar", event.event_id)
+            event.status = "error"
+            event.last_error = repr(e)[:2000]
+        if event.status == "pending" and event.attempts >= max_attempts:
+            event.status = "error"  # sin reintentos disponibles: queda a la vista
+
+        event.processed_at = timezone.now()
+        event.save(update_fields=["status", "attempts", "last_error", "carta", "processed_at"])
+        return event.status
+
+
+def process_pending(limit: int = 500) -> dict:
+    """Drena pendientes/errores reintentables (orden de llegada)."""
+    max_attempts = int(getattr(settings, "FACTURAPI_WEBHOOK_MAX_ATTEMPTS", 5) or 5)
+    pks = list(
+        FacturapiWebhookEvent.objects
+        .filter(status__in=("pending", "error"), attempts__lt=max_attempts)
+        .order_by("received_at", "id")
+        .values_list("pk", flat=True)[:limit]
+    )
+    counts: dict = {}
+    for pk in pks:
+        result = process_event(pk)
+        if result:
+            counts[result] = counts.get(result, 0) + 1
+    return counts
+
+
+# ======================================================
+# Cola en memoria (un hilo worker por proceso)
+# ======================================================
+_queue: "queue.Queue[int]" = queue.Queue()
+_worker_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+
+
+def _retry_later(event_pk: int) -> None:
+    delay = int(getattr(settings, "FACTURAPI_WEBHOOK_RETRY_SECONDS", 30) or 30)
+    timer = threading.Timer(delay, enqueue, args=(event_pk,))
+    timer.daemon = True
+    timer.start()
+
+
+def _worker_loop():
+    while True:
+        pk = _queue.get()
+        try:
+            if process_event(pk) == "pending":
+                _retry_later(pk)
+        except Exception:
+            logger.exception("Webhook Facturapi: fallo en worker (evento %s)", pk)
+        finally:
+            connections.close_all()
+            _queue.task_done()
+
+
+def enqueue(event_pk: int) -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="facturapi-webhooks", daemon=True)
+            _worker.start()
+    _queue.put(event_pk)
@@ -0,0 +1,213 @@
+# trips/services/fake_facturapi.py
+"""
+Stand-in local de Facturapi (WSGI puro, sin dependencias) para desarrollo,
+pruebas y benchmarks. NO timbra nada: genera UUIDs y XML con la forma de un
+CFDI 4.0 timbrado (NoCertificado, Certificado, TimbreFiscalDigital).
+
+Endpoints (prefijo /v2):
+  POST   /invoices              -> crea factura (status "valid")
+  GET    /invoices/{id}         -> estatus
+  GET    /invoices/{id}/xml     -> XML
+  DELETE /invoices/{id}         -> cancela (cancellation_status "accepted")
+
+Uso:
+  manage.py fake_facturapi --port 8765 --latency-ms 150 --error-rate 0.02
+  FACTURAPI_BASE_URL=http://127.0.0.1:8765/v2 FACTURAPI_API_KEY=test ...
+"""
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from typing import Optional
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from xml.sax.saxutils import quoteattr
+
+FAKE_EMITTER_NO_CERT = "30001000000500003416"
+FAKE_SAT_NO_CERT = "30001000000500003456"
+FAKE_CERT_B64 = "MIIFuzCCA6OgAwIBAgIUMzAwMDEwMDAwMDA1MDAwMDM0MTYwDQYJKoZIhvcNAQELBQAw"
+
+
+class FakeFacturapi:
+    """App WSGI con almacenamiento en memoria (thread-safe)."""
+
+    def __init__(self, *, latency_ms: int = 0, jitter_ms: int = 0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self.invoices: dict[str, dict] = {}
+        self.requests = 0
+
+    # ----------------------------------------------
+    # Helpers
+    # ----------------------------------------------
+    def _sleep(self):
+        if not (self.latency_ms or self.jitter_ms):
+            return
+        with self._lock:
+            jitter = self._rand.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        time.sleep(max(0.0, (self.latency_ms + jitter) / 1000.0))
+
+    def _should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._rand.random() < self.error_rate
+
+    @staticmethod
+    def _json(start_response, status: str, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        start_response(status, [
+            ("Content-Type", "application/json; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+        ])
+        return [body]
+
+    @staticmethod
+    def _read_json(environ) -> dict:
+        try:
+            size = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            size = 0
+        raw = environ["wsgi.input"].read(size) if size else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _invoice_xml(self, inv: dict) -> bytes:
+        fecha = inv["date"][:19]
+        total = f"{inv.get('total', 0):.2f}"
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" '
+            'xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" '
+            f'Version="4.0" Fecha="{fecha}" NoCertificado="{FAKE_EMITTER_NO_CERT}" '
+            f'Certificado="{FAKE_CERT_B64}" Total="{total}" Moneda={quoteattr(inv.get("currency", "MXN"))} '
+            f'TipoDeComprobante={quoteattr(inv.get("type", "I"))}>'
+            f'<cfdi:Receptor Rfc={quoteattr(inv.get("customer_tax_id", "XAXX010101000"))}/>'
+            '<cfdi:Complemento>'
+            f'<tfd:TimbreFiscalDigital Version="1.1" UUID="{inv["uuid"]}" FechaTimbrado="{fecha}" '
+            f'NoCertificadoSAT="{FAKE_SAT_NO_CERT}"/>'
+            '</cfdi:Complemento>'
+            '</cfdi:Comprobante>'
+        ).encode("utf-8")
+
+    # ----------------------------------------------
+    # Endpoints
+    # ----------------------------------------------
+    def _create(self, start_response, payload: dict):
+        items = payload.get("items") or []
+        if not payload.get("customer") or not items:
+            return self._json(start_response, "400 Bad Request", {
+                "message": "Faltan datos requeridos",
+                "details": [{"path": "customer" if not payload.get("customer") else "items", "message": "requerido"}],
+            })
+
+        total = 0.0
+        for it in items:
+            prod = it.get("product") or {}
+            total += float(it.get("quantity") or 0) * float(prod.get("price") or 0)
+
+        inv_id = uuid.uuid4().hex[:24]
+        inv_uuid = str(uuid.uuid4()).upper()
+        inv = {
+            "id": inv_id,
+            "uuid": inv_uuid,
+            "status": "valid",
+            "cancellation_status": "none",
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "type": payload.get("type") or "I",
+            "currency": payload.get("currency") or "MXN",
+            "total": round(total, 2),
+            "customer_tax_id": (payload.get("customer") or {}).get("tax_id") or "XAXX010101000",
+            "verification_url": f"https://verificacfdi.facturaelectronica.sat.gob.mx/default.aspx?id={inv_uuid}",
+            "stamp": {
+                "sat_cert_number": FAKE_SAT_NO_CERT,
+                "date": datetime.now().isoformat(timespec="seconds"),
+            },
+        }
+        with self._lock:
+            self.invoices[inv_id] = inv
+        return self._json(start_response, "200 OK", self._public(inv))
+
+    @staticmethod
+    def _public(inv: dict) -> dict:
+        return {k: v for k, v in inv.items() if k != "customer_tax_id"}
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.requests += 1
+
+        method = environ.get("REQUEST_METHOD", "GET").upper()
+        path = (environ.get("PATH_INFO") or "/").rstrip("/")
+        if path.startswith("/v2"):
+            path = path[3:]
+
+        if not (environ.get("HTTP_AUTHORIZATION") or "").startswith("Bearer "):
+            return self._json(start_response, "401 Unauthorized", {"message": "API key inválida"})
+
+        self._sleep()
+        if self._should_fail():
+            return self._json(start_response, "500 Internal Server Error", {"message": "Error simulado (fake)"})
+
+        parts = [p for p in path.split("/") if p]
+
+        if parts == ["invoices"] and method == "POST":
+            return self._create(start_response, self._read_json(environ))
+
+        if len(parts) >= 2 and parts[0] == "invoices":
+            with self._lock:
+                inv = self.invoices.get(parts[1])
+            if inv is None:
+                return self._json(start_response, "404 Not Found", {"message": "Factura no encontrada"})
+
+            if len(parts) == 3 and parts[2] == "xml" and method == "GET":
+                body = self._invoice_xml(inv)
+                start_response("200 OK", [
+                    ("Content-Type", "application/xml; charset=utf-8"),
+                    ("Content-Length", str(len(body))),
+                ])
+                return [body]
+
+            if len(parts) == 2 and method == "GET":
+                return self._json(start_response, "200 OK", self._public(inv))
+
+            if len(parts) == 2 and method == "DELETE":
+                with self._lock:
+                    inv["status"] = "canceled"
+                    inv["cancellation_status"] = "accepted"
+                return self._json(start_response, "200 OK", self._public(inv))
+
+        return self._json(start_response, "404 Not Found", {"message": f"Ruta no soportada: {method} {path}"})
+
+
+# ======================================================
+# Servidor
+# ======================================================
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def make_fake_server(app: FakeFacturapi, host: str = "127.0.0.1", port: int = 0, *, quiet: bool = True):
+    """Servidor multi-hilo; port=0 elige un puerto libre (server.server_port)."""
+    handler = _QuietHandler if quiet else WSGIRequestHandler
+    return make_server(host, port, app, server_class=_ThreadingWSGIServer, handler_class=handler)
+
+
+def start_fake_server_in_thread(app: FakeFacturapi, host: str = "127.0.0.1", port: int = 0):
+    """Arranca el servidor en un hilo daemon. Regresa (server, base_url)."""
+    server = make_fake_server(app, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-facturapi", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v2"
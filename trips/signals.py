@@ -0,0 +1,28 @@
+# trips/signals.py
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from customers.models import Client
+from locations.models import Location, Route
+from trips.services.carta_porte_drafts import invalidate_route_templates
+
+
+# ======================================================
+# Plantilla de Carta Porte por ruta: invalidación
+# (borrar una ruta elimina su plantilla por CASCADE)
+# ======================================================
+@receiver(post_save, sender=Route)
+def route_changed(sender, instance, **kwargs):
+    invalidate_route_templates(route_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    invalidate_route_templates(location_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Client)
+def client_changed(sender, instance, created, **kwargs):
+    # el RFC del cliente va en las ubicaciones de la plantilla
+    if not created:
+        invalidate_route_templates(client_ids=[instance.pk])
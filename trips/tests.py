@@ -1,3 +1,55 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from trips.models import FacturapiWebhookEvent
+from trips.services.facturapi_webhooks import process_event, process_pending, record_event
+
+
+def invoice_event(event_id, event_type="invoice.status_updated", invoice_id="inv_1"):
+    event, _created = record_event({
+        "id": event_id,
+        "type": event_type,
+        "data": {"object": {"id": invoice_id, "status": "canceled"}},
+    })
+    return event
+
+
+# ======================================================
+# Webhooks de Facturapi
+# ======================================================
+@override_settings(FACTURAPI_WEBHOOK_MAX_ATTEMPTS=3)
+class WebhookProcessingTests(TestCase):
+    def test_unknown_carta_stays_pending_for_retry(self):
+        event = invoice_event("evt_1")
+        self.assertEqual(process_event(event.pk), "pending")
+
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+        self.assertIn("se reintenta", event.last_error)
+        self.assertEqual(process_pending(), {"pending": 1})
+
+    def test_unknown_carta_becomes_error_after_max_attempts(self):
+        event = invoice_event("evt_2")
+        for _ in range(3):
+            process_event(event.pk)
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("error", 3))
+        self.assertIsNone(process_event(event.pk))
+        self.assertEqual(process_pending(), {})
+
+    def test_unhandled_event_type_is_ignored(self):
+        event = invoice_event("evt_3", event_type="customer.created")
+        self.assertEqual(process_event(event.pk), "ignored")
+        self.assertEqual(process_pending(), {})
+
+
+# ======================================================
+# Conciliación de estatus CFDI
+# ======================================================
+class ReconcileCommandTests(TestCase):
+    @override_settings(FACTURAPI_API_KEY="")
+    def test_missing_api_key_fails_up_front(self):
+        with self.assertRaisesMessage(CommandError, "FACTURAPI_API_KEY"):
+            call_command("reconcile_cfdi_status")
@@ -1,6 +1,13 @@
 from django.urls import path
 from . import views
-from .views_carta_porte import CartaPorteEditView, CartaPorteStampedPDFView, CartaPorteStampedXMLView
+from .views_carta_porte import (
+    CartaPorteDraftsView,
+    CartaPorteEditView,
+    CartaPorteExportView,
+    CartaPorteStampedPDFView,
+    CartaPorteStampedXMLView,
+    FacturapiWebhookView,
+)
 
 app_name = "trips"
 
@@ -14,10 +21,12 @@ urlpatterns = [
     path("monitoreo/", views.TripBoardView.as_view(), name="board"),
     path("monitoreo/cambiar-status/",views.TripChangeStatusView.as_view(), name="change_status",),
     path("viajes/<int:trip_id>/carta-porte/", views.CartaPorteCreateUpdateView.as_view(), name="carta_porte_form"),
-    path("ajax/routes/", views.ajax_routes_by_client, name="ajax_routes_by_client"),
     path("mis-viajes/", views.MyTripListView.as_view(), name="my_list"),
     path("mis-viajes/<int:pk>/", views.MyTripDetailView.as_view(), name="my_detail"),
     path("<int:trip_id>/carta-porte/", CartaPorteEditView.as_view(), name="carta_porte_edit"),
     path("<int:carta_id>/carta-porte/pdf/", CartaPorteStampedPDFView.as_view(), name="carta_porte_pdf"),
     path("<int:carta_id>/carta-porte/xml/", CartaPorteStampedXMLView.as_view(), name="carta_porte_xml"),
+    path("cartas-porte/borradores/", CartaPorteDraftsView.as_view(), name="carta_porte_drafts"),
+    path("cfdi/exportar/", CartaPorteExportView.as_view(), name="cfdi_export"),
+    path("webhooks/facturapi/", FacturapiWebhookView.as_view(), name="facturapi_webhook"),
 ]
\ No newline at end of file
@@ -11,12 +11,10 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views import View
-from django.views.decorators.http import require_GET
 from django.views.generic import (
     ListView, CreateView, UpdateView, DetailView, DeleteView, TemplateView
 )
 
-from locations.models import Route
 from .models import Trip, TripStatus, CartaPorteCFDI
 from .forms import (
     TripForm, TripSearchForm,
@@ -317,29 +315,6 @@ class TripChangeStatusView(OperacionRequiredMixin, View):
         })
 
 
-@require_GET
-def ajax_routes_by_client(request):
-    # Proteger function-view igual que menú (operación)
-    if not request.user.is_authenticated:
-        return JsonResponse({"results": []}, status=401)
-    if not request.user.groups.filter(name__in=["superadmin", "admin", "operacion"]).exists():
-        return JsonResponse({"results": []}, status=403)
-
-    client_id = request.GET.get("client_id")
-    if not client_id:
-        return JsonResponse({"results": []})
-
-    routes = (
-        Route.objects
-        .filter(client_id=client_id, deleted=False)
-        .select_related("origen", "destino")
-        .order_by("origen__nombre", "destino__nombre")
-    )
-
-    results = [{"id": r.id, "label": f"{r.origen.nombre} → {r.destino.nombre}"} for r in routes]
-    return JsonResponse({"results": results})
-
-
 class CartaPorteCreateUpdateView(OperacionRequiredMixin, View):
     template_name = "trips/carta_porte_form.html"
 
@@ -1,54 +1,42 @@
 # trips/views_carta_porte.py
 from __future__ import annotations
 
+import json
 from decimal import Decimal
-from io import BytesIO
-import base64
-import qrcode
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.dateparse import parse_date
 
 from django.contrib import messages
 from django.db import transaction
+from django.forms.models import model_to_dict
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
 from django.views import View
 from django.views.generic import TemplateView
 
-from common.pdf import render_pdf
-from .models import Trip, CartaPorteCFDI, CartaPorteLocation, CartaPorteItem
+from common.mixins import FinanzasRequiredMixin, OperacionRequiredMixin
+from common.pdf import iter_zip, render_pdf
+from .models import Trip, CartaPorteCFDI, CartaPorteGoods, CartaPorteLocation, CartaPorteItem
 from .forms import (
     CartaPorteCFDIForm,
     get_carta_porte_location_formset,
     get_carta_porte_goods_formset,
     get_carta_porte_item_formset,
 )
-from .services.facturapi import create_invoice_in_facturapi, FacturapiError, download_carta_porte_xml
-import re
-# ======================================================
-# QR helper
-# ======================================================
-def build_qr_data_uri(url: str) -> str | None:
-    if not url:
-        return None
-
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=6,
-        border=2,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-
-    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return f"data:image/png;base64,{b64}"
-
-
+from customers.models import Client
+from .services.facturapi import create_invoice_in_facturapi, FacturapiError
+from .services.cfdi_export import (
+    PDF_TEMPLATE,
+    carta_porte_pdf_context,
+    cartas_for_export,
+    get_carta_xml,
+    iter_cfdi_export,
+)
+from .services import carta_porte_drafts, facturapi_webhooks
 # ======================================================
 # PDF Timbrada
 # ======================================================
@@ -61,18 +49,10 @@ class CartaPorteStampedPDFView(View):
             uuid__isnull=False,
         )
 
-        raw = (carta.response_snapshot or {}).get("raw", {}) or {}
-        verification_url = raw.get("verification_url")
-        qr_data_uri = build_qr_data_uri(verification_url)
-
         return render_pdf(
             request,
-            "trips/carta_porte_pdf.html",
-            {
-                "carta": carta,
-                "qr_data_uri": qr_data_uri,
-                "verification_url": verification_url,
-            },
+            PDF_TEMPLATE,
+            carta_porte_pdf_context(carta),
             filename=f"carta-porte-{carta.uuid}.pdf",
         )
 
@@ -86,7 +66,7 @@ class CartaPorteStampedXMLView(View):
         )
 
         try:
-            xml_bytes = download_carta_porte_xml(carta=carta)
+            xml_bytes = get_carta_xml(carta)
         except FacturapiError as e:
             return HttpResponse(str(e), status=400)
 
@@ -94,6 +74,134 @@ class CartaPorteStampedXMLView(View):
         resp["Content-Disposition"] = f'attachment; filename="carta-porte-{carta.uuid}.xml"'
         return resp
 
+
+# ======================================================
+# Export masivo (cierre contable): ZIP en streaming
+# ======================================================
+class CartaPorteExportView(FinanzasRequiredMixin, TemplateView):
+    template_name = "trips/cfdi_export.html"
+
+    def get(self, request, *args, **kwargs):
+        if "download" not in request.GET:
+            return super().get(request, *args, **kwargs)
+
+        date_from = parse_date(request.GET.get("from") or "")
+        date_to = parse_date(request.GET.get("to") or "")
+        if not (date_from and date_to) or date_from > date_to:
+            messages.error(request, "Indica un rango de fechas válido.")
+            return redirect("trips:cfdi_export")
+
+        customer = (request.GET.get("customer") or "").strip()
+        status = (request.GET.get("status") or "stamped").strip()
+        include = (request.GET.get("include") or "both").strip()
+
+        cartas = cartas_for_export(
+            date_from=date_from,
+            date_to=date_to,
+            customer_id=int(customer) if customer.isdigit() else None,
+            status=status if status in ("stamped", "canceled") else "stamped",
+        )
+        if not cartas.exists():
+            messages.warning(request, "No hay CFDI timbrados con esos filtros.")
+            return redirect("trips:cfdi_export")
+
+        entries = iter_cfdi_export(
+            cartas,
+            base_url=request.build_absolute_uri("/"),
+            include_xml=include in ("both", "xml"),
+            include_pdf=include in ("both", "pdf"),
+        )
+        resp = StreamingHttpResponse(iter_zip(entries), content_type="application/zip")
+        resp["Content-Disposition"] = (
+            f'attachment; filename="cfdi-{date_from:%Y%m%d}-{date_to:%Y%m%d}.zip"'
+        )
+        return resp
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        today = timezone.localdate()
+        ctx["default_from"] = today.replace(day=1)
+        ctx["default_to"] = today
+        ctx["customers"] = Client.objects.filter(
+            pk__in=CartaPorteCFDI.objects.filter(status="stamped").values("customer_id")
+        ).order_by("nombre").only("id", "nombre")
+        return ctx
+
+# ======================================================
+# Borradores en lote (viajes programados)
+# ======================================================
+class CartaPorteDraftsView(OperacionRequiredMixin, TemplateView):
+    template_name = "trips/carta_porte_drafts.html"
+
+    def _filters(self, data):
+        today = timezone.localdate()
+        date_from = parse_date(data.get("from") or "") or today
+        date_to = parse_date(data.get("to") or "") or date_from
+        include_undated = data.get("include_undated", "1") == "1"
+        return date_from, date_to, include_undated
+
+    def post(self, request, *args, **kwargs):
+        date_from, date_to, include_undated = self._filters(request.POST)
+        if date_from > date_to:
+            messages.error(request, "Indica un rango de fechas válido.")
+            return redirect("trips:carta_porte_drafts")
+
+        trips = carta_porte_drafts.trips_for_drafts(
+            date_from=date_from, date_to=date_to, include_undated=include_undated
+        )
+        report = carta_porte_drafts.create_draft_cartas(trips)
+
+        if report.created:
+            messages.success(request, f"Se crearon {report.created} borradores de Carta Porte.")
+        else:
+            messages.info(request, "No hay viajes programados sin Carta Porte en ese rango.")
+        if report.skipped:
+            messages.warning(request, f"{len(report.skipped)} viajes sin ruta se omitieron.")
+        return redirect("trips:list")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        date_from, date_to, include_undated = self._filters(self.request.GET)
+        ctx.update({
+            "date_from": date_from,
+            "date_to": date_to,
+            "include_undated": include_undated,
+            "pending": carta_porte_drafts.trips_for_drafts(
+                date_from=date_from, date_to=date_to, include_undated=include_undated
+            ).select_related("operator")[:200],
+        })
+        return ctx
+
+# ======================================================
+# Webhook Facturapi
+# ======================================================
+@method_decorator(csrf_exempt, name="dispatch")
+class FacturapiWebhookView(View):
+    """
+    Recibe eventos de Facturapi. Solo valida firma y registra; el evento se
+    aplica en segundo plano (responder rápido evita reintentos del proveedor).
+    """
+    http_method_names = ["post"]
+
+    def post(self, request):
+        secret = getattr(settings, "FACTURAPI_WEBHOOK_SECRET", "")
+        if not secret:
+            return JsonResponse({"ok": False, "error": "Webhook no configurado"}, status=503)
+
+        signature = request.headers.get(facturapi_webhooks.SIGNATURE_HEADER, "")
+        if not facturapi_webhooks.verify_signature(request.body, signature, secret):
+            return JsonResponse({"ok": False, "error": "Firma inválida"}, status=401)
+
+        try:
+            payload = json.loads(request.body or b"{}")
+            event, created = facturapi_webhooks.record_event(payload)
+        except (ValueError, facturapi_webhooks.WebhookError) as e:
+            return JsonResponse({"ok": False, "error": str(e)}, status=400)
+
+        if created:
+            transaction.on_commit(lambda: facturapi_webhooks.enqueue(event.pk))
+        return JsonResponse({"ok": True, "duplicate": not created})
+
 # ======================================================
 # Edit Carta Porte
 # ======================================================
@@ -103,204 +211,84 @@ class CartaPorteEditView(TemplateView):
     # ======================================================
     # SAT helpers
     # ======================================================
-    ESTADO_SAT_MAP = {
-        "Aguascalientes": "AGS",
-        "Baja California": "BCN",
-        "Baja California Sur": "BCS",
-        "Campeche": "CAM",
-        "Chiapas": "CHP",
-        "Chihuahua": "CHH",
-        "Ciudad de México": "CMX",
-        "Coahuila": "COA",
-        "Colima": "COL",
-        "Durango": "DUR",
-        "Guanajuato": "GUA",
-        "Guerrero": "GRO",
-        "Hidalgo": "HID",
-        "Jalisco": "JAL",
-        "México": "MEX",
-        "Michoacán": "MIC",
-        "Morelos": "MOR",
-        "Nayarit": "NAY",
-        "Nuevo León": "NLE",
-        "Oaxaca": "OAX",
-        "Puebla": "PUE",
-        "Querétaro": "QUE",
-        "Quintana Roo": "ROO",
-        "San Luis Potosí": "SLP",
-        "Sinaloa": "SIN",
-        "Sonora": "SON",
-        "Tabasco": "TAB",
-        "Tamaulipas": "TAM",
-        "Tlaxcala": "TLA",
-        "Veracruz": "VER",
-        "Yucatán": "YUC",
-        "Zacatecas": "ZAC",
-    }
-
-    # Full US state map (name -> abbrev)
-    US_STATE_MAP = {
-        "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR",
-        "California": "CA", "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE",
-        "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID",
-        "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
-        "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
-        "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
-        "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
-        "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
-        "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
-        "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC",
-        "South Dakota": "SD", "Tennessee": "TN", "TEXAS": "TX", "Utah": "UT",
-        "Vermont": "VT", "Virginia": "VA", "Washington": "WA", "West Virginia": "WV",
-        "Wisconsin": "WI", "Wyoming": "WY",
-        "District of Columbia": "DC",
-    }
-
-    @staticmethod
-    def _s(v) -> str:
-        return (v or "").strip()
-
-    @classmethod
-    def pais_sat(cls, loc_model) -> str:
-        """
-        Devuelve country2: MX / US (lo que guardas en CartaPorteLocation.pais)
-        Intenta leer varios nombres de campo del modelo Location.
-        """
-        raw = (
-            cls._s(getattr(loc_model, "pais", None))
-            or cls._s(getattr(loc_model, "country", None))
-            or cls._s(getattr(loc_model, "country_code", None))
-        ).upper()
-
-        if raw in ("US", "USA", "UNITED STATES", "ESTADOS UNIDOS"):
-            return "US"
-        if raw in ("MX", "MEX", "MEXICO", "MÉXICO"):
-            return "MX"
-
-        # Heurística: si el "estado" parece abreviación US (TX, CA, etc.)
-        st = cls._s(getattr(loc_model, "estado", None)).upper()
-        if len(st) == 2 and st.isalpha():
-            return "US"
-
-        return "MX"
-
-    @classmethod
-    def estado_sat(cls, nombre_estado: str, *, country2: str = "MX") -> str:
-        n = cls._s(nombre_estado)
-        if not n:
-            return ""
-
-        c2 = cls._s(country2).upper() or "MX"
-
-        if c2 == "US":
-            raw = n.strip().upper()
-
-            # si viene "TX" (o "T X") lo normaliza
-            raw2 = re.sub(r"[^A-Z]", "", raw)
-            if len(raw2) == 2:
-                return raw2
-
-            # si viene "Texas" / "TEXAS" / "Texas, USA"
-            raw_name = re.sub(r"[^A-Z ]", " ", raw)
-            raw_name = re.sub(r"\s+", " ", raw_name).strip()
-            # intenta match exacto
-            if raw_name in cls.US_STATE_MAP:
-                return cls.US_STATE_MAP[raw_name]
-            # intenta si viene "TEXAS USA"
-            if raw_name.endswith(" USA"):
-                k = raw_name.replace(" USA", "").strip()
-                if k in cls.US_STATE_MAP:
-                    return cls.US_STATE_MAP[k]
-
-            return ""  # si no se reconoce
-
-        # MX (tu mapa actual)
-        return (cls.ESTADO_SAT_MAP.get(n) or "")[:3]
+    # Implementación en trips.services.carta_porte_drafts (compartida con el lote)
+    ESTADO_SAT_MAP = carta_porte_drafts.ESTADO_SAT_MAP
+    US_STATE_MAP = carta_porte_drafts.US_STATE_MAP
+    pais_sat = staticmethod(carta_porte_drafts.pais_sat)
+    estado_sat = staticmethod(carta_porte_drafts.estado_sat)
 
     # ======================================================
     # Helpers base
     # ======================================================
     def get_trip(self):
-        return get_object_or_404(Trip, pk=self.kwargs["trip_id"], deleted=False)
+        return get_object_or_404(
+            Trip.objects.select_related("route__origen__client", "route__destino__client", "operator"),
+            pk=self.kwargs["trip_id"],
+            deleted=False,
+        )
 
     def get_carta(self, trip: Trip):
-        carta, _ = CartaPorteCFDI.objects.get_or_create(trip=trip)
-        return carta
+        """Carta del viaje; si aún no existe se regresa SIN guardar (el GET no escribe)."""
+        return CartaPorteCFDI.objects.filter(trip=trip).first() or CartaPorteCFDI(trip=trip)
 
     def get_success_url(self, trip: Trip):
         return reverse("trips:detail", kwargs={"pk": trip.id})
 
+    @staticmethod
+    def _bulk_upsert(model, objs):
+        """INSERT ... ON CONFLICT (id) DO UPDATE para filas nuevas y existentes (sin señales)."""
+        if not objs:
+            return
+        fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+        model.objects.bulk_create(objs, update_conflicts=True, unique_fields=["id"], update_fields=fields)
+
     # ======================================================
-    # Subtotal snapshot (del viaje)
+    # Subtotal snapshot (del viaje) — solo en memoria
     # ======================================================
     def ensure_subtotal_from_trip(self, trip: Trip, carta: CartaPorteCFDI):
         current = getattr(carta, "subtotal", None)
         if current is not None and current != Decimal("0.00"):
             return
-
-        subtotal = Decimal("0.00")
-
-        if getattr(trip, "tarifa_cliente_snapshot", None):
-            subtotal = trip.tarifa_cliente_snapshot or Decimal("0.00")
-
-        if subtotal == Decimal("0.00") and trip.route:
-            subtotal = getattr(trip.route, "tarifa_cliente", None) or Decimal("0.00")
-
-        carta.subtotal = subtotal
-        carta.save(update_fields=["subtotal"])
+        carta.subtotal = carta_porte_drafts.default_subtotal(trip)
 
     # ======================================================
-    # ✅ EXACTAMENTE 1 CONCEPTO
+    # ✅ EXACTAMENTE 1 CONCEPTO (en memoria)
     # ======================================================
-    def ensure_single_item_from_subtotal(self, trip: Trip, carta: CartaPorteCFDI):
+    def plan_single_item(self, trip: Trip, carta: CartaPorteCFDI, items: list):
+        """
+        Regresa (concepto, ids_sobrantes). El concepto puede ser nuevo (sin pk);
+        nada se guarda aquí.
+        """
         subtotal = (carta.subtotal or Decimal("0.00")).quantize(Decimal("0.01"))
-        route_str = str(trip.route) if trip.route_id else "Servicio de transporte"
-        default_desc = f"Flete {route_str}"[:255]
-
-        qs = carta.items.order_by("orden", "id")
-        first = qs.first()
-
-        if not first:
-            CartaPorteItem.objects.create(
-                carta_porte=carta,
-                orden=0,
-                cantidad=Decimal("1.000"),
-                unidad="E48",
-                producto="FLETE",
-                descripcion=default_desc,
-                precio=subtotal,
-                descuento=Decimal("0.00"),
-                iva_pct=Decimal("16.00"),
-                ret_iva_pct=Decimal("0.00"),
-            )
-            return
+        default_desc = carta_porte_drafts.default_item_description(trip)
+
+        items = sorted(items, key=lambda i: (i.orden or 0, i.pk or 0))
+        it = items[0] if items else None
+        stale = [i.pk for i in items[1:] if i.pk]
 
-        qs.exclude(id=first.id).delete()
+        if it is None:
+            return carta_porte_drafts.default_item(carta, trip), stale
+
+        it.carta_porte = carta
+        it.orden = 0
 
-        changed = False
-        if (first.cantidad is None) or (first.cantidad <= Decimal("0")):
-            first.cantidad = Decimal("1.000")
-            changed = True
+        if (it.cantidad is None) or (it.cantidad <= Decimal("0")):
+            it.cantidad = Decimal("1.000")
 
-        if subtotal > Decimal("0.00") and ((first.precio is None) or (first.precio <= Decimal("0.00"))):
-            first.precio = subtotal
-            changed = True
+        if subtotal > Decimal("0.00") and ((it.precio is None) or (it.precio <= Decimal("0.00"))):
+            it.precio = subtotal
 
-        if not (first.descripcion or "").strip():
-            first.descripcion = default_desc
-            changed = True
+        if not (it.descripcion or "").strip():
+            it.descripcion = default_desc
 
-        if (first.unidad or "").strip() == "":
-            first.unidad = "E48"
-            changed = True
+        if not (it.unidad or "").strip():
+            it.unidad = "E48"
 
-        if (first.producto or "").strip() == "":
-            first.producto = "FLETE"
-            changed = True
+        if not (it.producto or "").strip():
+            it.producto = "FLETE"
 
-        if changed:
-            first.orden = 0
-            first.save()
+        it.compute()
+        return it, stale
 
     # ======================================================
     # Forms
@@ -313,7 +301,7 @@ class CartaPorteEditView(TemplateView):
         if bound:
             form = CartaPorteCFDIForm(request.POST, instance=carta)
             fs_locations = LocationFS(request.POST, instance=carta, prefix="loc")
-            fs_goods = GoodsFS(request.POST, instance=carta, prefix="goods")
+            fs_goods = GoodsFS(request.POST, instance=carta, prefix="goods", queryset=self.goods_queryset())
             fs_items = ItemsFS(request.POST, instance=carta, prefix="cpitem")
             return form, fs_locations, fs_goods, fs_items
 
@@ -334,54 +322,93 @@ class CartaPorteEditView(TemplateView):
         except Exception:
             pass
 
+        # Defaults calculados en memoria (plantilla de la ruta, 1 concepto).
+        # El GET no materializa la plantilla: eso ocurre al guardar.
+        template = self.get_route_template(trip, save=False)
+        saved_locations = list(carta.locations.all()) if carta.pk else []
+        locations, _ = self.plan_locations_from_route(trip, carta, saved_locations, template=template)
+        saved_items = list(carta.items.all()) if carta.pk else []
+        item, _ = self.plan_single_item(trip, carta, saved_items)
+
         form = CartaPorteCFDIForm(instance=carta, initial=initial)
-        fs_locations = LocationFS(instance=carta, prefix="loc")
-        fs_goods = GoodsFS(instance=carta, prefix="goods")
-        fs_items = ItemsFS(instance=carta, prefix="cpitem")
+        fs_locations = self._formset_from_rows(LocationFS, carta, locations, prefix="loc")
+        if template and template.goods and not (carta.pk and carta.goods.exists()):
+            # mercancías típicas de la ruta como filas nuevas
+            typical_goods = carta_porte_drafts.goods_from_template(template, carta)
+            fs_goods = self._formset_from_rows(GoodsFS, carta, typical_goods, prefix="goods")
+        else:
+            fs_goods = GoodsFS(instance=carta, prefix="goods", queryset=self.goods_queryset())
+        fs_items = self._formset_from_rows(ItemsFS, carta, [item], prefix="cpitem")
         return form, fs_locations, fs_goods, fs_items
 
+    @staticmethod
+    def goods_queryset():
+        # la mercancía seleccionada se renderiza sin una consulta por fila
+        return CartaPorteGoods.objects.select_related("mercancia")
+
+    @staticmethod
+    def _formset_from_rows(formset_class, carta: CartaPorteCFDI, rows: list, *, prefix: str):
+        """
+        Formset sin bind a partir de filas en memoria: las que tienen pk se
+        muestran con sus valores ajustados; las nuevas van como forms extra.
+        """
+        saved = {r.pk: r for r in rows if r.pk}
+        new_rows = [r for r in rows if not r.pk]
+        skip = ("id", formset_class.fk.name)
+
+        fs = formset_class(
+            instance=carta,
+            prefix=prefix,
+            queryset=formset_class.model.objects.filter(pk__in=list(saved)),
+            initial=[model_to_dict(r, exclude=skip) for r in new_rows],
+        )
+        fs.extra = len(new_rows)
+
+        for f in fs.initial_forms:
+            row = saved.get(f.instance.pk)
+            if row is not None:
+                f.instance = row
+                f.initial.update(model_to_dict(row, exclude=skip))
+        for f, row in zip(fs.extra_forms, new_rows):
+            f.instance = row
+        return fs
+
     # ======================================================
-    # Locations from route (SAT-safe)
+    # Locations from route (SAT-safe, en memoria)
     # ======================================================
-    def ensure_locations_from_route(self, trip: Trip, carta: CartaPorteCFDI):
+    @staticmethod
+    def get_route_template(trip: Trip, *, save: bool):
+        if not trip.route_id:
+            return None
+        return carta_porte_drafts.get_route_templates([trip.route], save=save).get(trip.route_id)
+
+    def plan_locations_from_route(self, trip: Trip, carta: CartaPorteCFDI, rows: list, *, template=None):
+        """
+        A partir de las ubicaciones actuales (guardadas o no) regresa
+        ([origen, destino], ids_a_borrar). Las escalas y duplicados se
+        descartan; las faltantes se clonan de la plantilla de la ruta.
+        Nada se guarda aquí.
+        """
         r = trip.route
         if not r:
-            return
+            return rows, []
+
+        rows = sorted(rows, key=lambda l: (l.orden or 0, l.pk or 0))
+
+        client_rfc = carta_porte_drafts.client_rfc
+
+        from_template = {
+            l.tipo_ubicacion: l
+            for l in (carta_porte_drafts.locations_from_template(template, carta) if template else [])
+        }
 
-        carta.locations.exclude(tipo_ubicacion__in=["Origen", "Destino"]).delete()
-
-        def client_rfc(loc_model):
-            rfc = getattr(getattr(loc_model, "client", None), "rfc", "")
-            return rfc or "XAXX010101000"
-
-        def build(loc_model, tipo, orden, dt):
-            country2 = self.pais_sat(loc_model)
-            return CartaPorteLocation(
-                carta_porte=carta,
-                tipo_ubicacion=tipo,
-                orden=orden,
-                rfc=client_rfc(loc_model),
-                nombre=loc_model.nombre or "",
-                localidad=getattr(loc_model, "poblacion", None) or getattr(loc_model, "localidad", None) or "",
-                codigo_postal=getattr(loc_model, "cp", None) or getattr(loc_model, "codigo_postal", None) or "",
-                calle=getattr(loc_model, "calle", None) or "",
-                numero_exterior=getattr(loc_model, "no_ext", None) or getattr(loc_model, "numero_exterior", None) or "",
-                numero_interior=getattr(loc_model, "no_int", None) or getattr(loc_model, "numero_interior", None) or "",
-                colonia=getattr(loc_model, "colonia_sat", None) or getattr(loc_model, "colonia", None) or "",
-                municipio=getattr(loc_model, "municipio", None) or "",
-                estado=self.estado_sat(getattr(loc_model, "estado", None), country2=country2),
-                pais=country2,  # ✅ NO forzar "MX"
-                referencia=getattr(loc_model, "referencias", None) or getattr(loc_model, "referencia", None) or "",
-            )
-
-        dt_origen = getattr(trip, "departure_origin_at", None) or timezone.now()
-        dt_destino = getattr(trip, "arrival_destination_at", None) or timezone.now()
+        def build(loc_model, tipo, orden):
+            return from_template.get(tipo) or carta_porte_drafts.location_from_stop(carta, loc_model, tipo, orden)
 
         # -------- Origen --------
-        o = carta.locations.filter(tipo_ubicacion="Origen").first()
+        o = next((l for l in rows if l.tipo_ubicacion == "Origen"), None)
         if not o:
-            o = build(r.origen, "Origen", 0, dt_origen)
-            o.save()
+            o = build(r.origen, "Origen", 0)
         else:
             o.orden = 0
             o.rfc = o.rfc or client_rfc(r.origen)
@@ -393,13 +420,10 @@ class CartaPorteEditView(TemplateView):
             if not (o.estado or "").strip():
                 o.estado = self.estado_sat(getattr(r.origen, "estado", None), country2=o.pais or "MX")
 
-            o.save()
-
         # -------- Destino --------
-        d = carta.locations.filter(tipo_ubicacion="Destino").first()
+        d = next((l for l in rows if l.tipo_ubicacion == "Destino"), None)
         if not d:
-            d = build(r.destino, "Destino", 99, dt_destino)
-            d.save()
+            d = build(r.destino, "Destino", 99)
         else:
             d.orden = 99
             d.rfc = d.rfc or client_rfc(r.destino)
@@ -412,21 +436,19 @@ class CartaPorteEditView(TemplateView):
             expected_state = self.estado_sat(getattr(r.destino, "estado", None), country2=expected_country)
             if expected_state and (d.estado or "").strip().upper() != expected_state:
                 d.estado = expected_state
-            d.save()
 
-        carta.locations.exclude(id__in=[o.id, d.id]).delete()
+        stale = [l.pk for l in rows if l.pk and l is not o and l is not d]
+        return [o, d], stale
 
     # ======================================================
-    # Context
+    # Context (solo lectura)
     # ======================================================
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         trip = self.get_trip()
         carta = self.get_carta(trip)
 
-        self.ensure_locations_from_route(trip, carta)
         self.ensure_subtotal_from_trip(trip, carta)
-        self.ensure_single_item_from_subtotal(trip, carta)
 
         form, fs_locations, fs_goods, fs_items = self.build_forms(
             request=self.request, carta=carta, trip=trip, bound=False
@@ -446,6 +468,24 @@ class CartaPorteEditView(TemplateView):
     # ======================================================
     # POST
     # ======================================================
+    @staticmethod
+    def _merge_formset_rows(current: dict, formset):
+        """
+        Aplica los cambios del formset (commit=False) sobre las filas actuales,
+        sin tocar la BD. Regresa (filas_resultantes, filas_cambiadas_o_nuevas).
+        """
+        rows = dict(current)
+        changed = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            rows.pop(obj.pk, None)
+        new_rows = []
+        for obj in changed:
+            if obj.pk:
+                rows[obj.pk] = obj
+            else:
+                new_rows.append(obj)
+        return list(rows.values()) + new_rows, changed
+
     @transaction.atomic
     def post(self, request, *args, **kwargs):
         trip = self.get_trip()
@@ -469,83 +509,59 @@ class CartaPorteEditView(TemplateView):
 
         action = (request.POST.get("action") or "save").strip()
 
+        # Un solo save de la carta (subtotal/total se recalculan en save())
         carta = form.save(commit=False)
         carta.customer = form.cleaned_data.get("customer")
-        carta.save()
-
         if carta.status == "draft":
             carta.status = "ready"
             carta.last_error = ""
-            carta.save(update_fields=["status", "last_error", "updated_at"])
-
-        fs_locations.save()
-
-        goods = fs_goods.save(commit=False)
-        for obj in fs_goods.deleted_objects:
-            obj.delete()
+        carta.save()
 
-        for g in goods:
+        # Estado actual de los hijos: una consulta por tabla
+        current_locations = {l.pk: l for l in carta.locations.all()}
+        current_goods = {g.pk: g for g in carta.goods.all()}
+        current_items = {i.pk: i for i in carta.items.all()}
+
+        # -------- Ubicaciones (✅ re-hidratar desde ruta SIN forzar MX) --------
+        loc_rows, _ = self._merge_formset_rows(current_locations, fs_locations)
+        removed_locations = set(current_locations) - {l.pk for l in loc_rows if l.pk}
+        template = self.get_route_template(trip, save=True)
+        locations, stale_locations = self.plan_locations_from_route(trip, carta, loc_rows, template=template)
+        for loc in locations:
+            loc.carta_porte = carta
+
+        # -------- Mercancías (solo las que cambiaron) --------
+        goods_rows, goods_changed = self._merge_formset_rows(current_goods, fs_goods)
+        stale_goods = set(current_goods) - {g.pk for g in goods_rows if g.pk}
+        goods = []
+        for g in goods_changed:
             if not g.mercancia_id:
                 if g.pk:
-                    g.delete()
+                    stale_goods.add(g.pk)
                 continue
             g.carta_porte = carta
-            g.save()
+            goods.append(g)
 
-        # ======================================================
-        # ✅ ITEMS: forzar EXACTAMENTE 1
-        # ======================================================
-        carta.items.all().delete()
-
-        items = fs_items.save(commit=False)
-        for obj in fs_items.deleted_objects:
-            obj.delete()
+        # -------- ✅ ITEMS: forzar EXACTAMENTE 1 --------
+        item_rows, _ = self._merge_formset_rows(current_items, fs_items)
+        item, stale_items = self.plan_single_item(trip, carta, item_rows)
 
-        it = items[0] if items else None
-
-        subtotal = (carta.subtotal or Decimal("0.00")).quantize(Decimal("0.01"))
-        route_str = str(trip.route) if trip.route_id else "Servicio de transporte"
-        default_desc = f"Flete {route_str}"[:255]
-
-        if it is None:
-            CartaPorteItem.objects.create(
-                carta_porte=carta,
-                orden=0,
-                cantidad=Decimal("1.000"),
-                unidad="E48",
-                producto="FLETE",
-                descripcion=default_desc,
-                precio=subtotal,
-                descuento=Decimal("0.00"),
-                iva_pct=Decimal("16.00"),
-                ret_iva_pct=Decimal("0.00"),
-            )
-        else:
-            it.carta_porte = carta
-            it.orden = 0
-
-            if (it.cantidad is None) or (it.cantidad <= Decimal("0")):
-                it.cantidad = Decimal("1.000")
-
-            if subtotal > Decimal("0.00") and ((it.precio is None) or (it.precio <= Decimal("0.00"))):
-                it.precio = subtotal
-
-            if not (it.descripcion or "").strip():
-                it.descripcion = default_desc
-
-            if not (it.unidad or "").strip():
-                it.unidad = "E48"
-
-            if not (it.producto or "").strip():
-                it.producto = "FLETE"
-
-            it.save()
-
-        carta.compute_total()
-        carta.save(update_fields=["total", "updated_at"])
+        # Un delete por tabla (solo si hay algo que borrar) + un upsert por tabla
+        to_delete = (
+            (CartaPorteLocation, set(stale_locations) | removed_locations),
+            (CartaPorteGoods, stale_goods),
+            (CartaPorteItem, set(stale_items)),
+        )
+        for model, pks in to_delete:
+            if pks:
+                model.objects.filter(carta_porte=carta, pk__in=pks).delete()
 
-        # ✅ Re-hidratar ubicaciones desde ruta SIN forzar MX
-        self.ensure_locations_from_route(trip, carta)
+        self._bulk_upsert(CartaPorteLocation, locations)
+        self._bulk_upsert(CartaPorteGoods, goods)
+        if goods or stale_goods:
+            # la plantilla toma las mercancías de la última carta de la ruta
+            carta_porte_drafts.invalidate_route_templates(route_ids=[trip.route_id])
+        self._bulk_upsert(CartaPorteItem, [item])
 
         request.session[f"cp_saved_{trip.id}"] = True
 
@@ -569,6 +585,8 @@ class CartaPorteEditView(TemplateView):
 
                 resp = result.get("response") or {}
                 carta.uuid = resp.get("uuid") or carta.uuid
+                carta.facturapi_id = resp.get("id") or carta.facturapi_id
+                carta.verification_url = ((resp.get("raw") or {}).get("verification_url") or "")[:500]
                 carta.emitter_no_cert = resp.get("emitter_no_cert") or ""
                 carta.sat_no_cert = resp.get("sat_no_cert") or ""
                 carta.pdf_url = resp.get("pdf_url") or resp.get("pdf") or carta.pdf_url
@@ -595,6 +613,8 @@ class CartaPorteEditView(TemplateView):
                     "payload_snapshot",
                     "response_snapshot",
                     "uuid",
+                    "facturapi_id",
+                    "verification_url",
                     "pdf_url",
                     "xml_url",
                     "emitter_no_cert",
@@ -78,8 +78,21 @@ class SparePartForm(forms.ModelForm):
 class SparePartSearchForm(forms.Form):
     """
     Form de búsqueda para la lista de refacciones.
-    Solo un campo 'q' por ahora (código, nombre, descripción).
+    'q' (código, nombre, descripción) + filtro y orden por stock.
     """
+    STOCK_CHOICES = (
+        ("", "Todo el stock"),
+        ("low", "En o bajo mínimo"),
+        ("out", "Sin existencia"),
+        ("available", "Con existencia"),
+    )
+    SORT_CHOICES = (
+        ("name", "Nombre"),
+        ("code", "Código"),
+        ("stock", "Stock ↑"),
+        ("-stock", "Stock ↓"),
+    )
+
     q = forms.CharField(
         required=False,
         label="",
@@ -90,6 +103,66 @@ class SparePartSearchForm(forms.Form):
             }
         ),
     )
+    stock = forms.ChoiceField(
+        required=False,
+        label="",
+        choices=STOCK_CHOICES,
+        widget=forms.Select(attrs={"class": "form-control form-control-sm"}),
+    )
+    sort = forms.ChoiceField(
+        required=False,
+        label="",
+        choices=SORT_CHOICES,
+        widget=forms.Select(attrs={"class": "form-control form-control-sm"}),
+    )
+
+class InventoryValuationForm(forms.Form):
+    """Filtros del reporte de valuación: búsqueda y fecha de corte opcional."""
+    q = forms.CharField(
+        required=False,
+        label="",
+        widget=forms.TextInput(
+            attrs={
+                "class": "form-control form-control-sm",
+                "placeholder": "Código o nombre…",
+            }
+        ),
+    )
+    as_of = forms.DateField(
+        required=False,
+        label="",
+        widget=forms.DateInput(attrs={"class": "form-control form-control-sm", "type": "date"}),
+    )
+
+
+class PayablesAgingForm(forms.Form):
+    """Filtros de antigüedad de saldos: fecha de corte y proveedor (detalle)."""
+    as_of = forms.DateField(
+        required=False,
+        label="",
+        widget=forms.DateInput(attrs={"class": "form-control form-control-sm", "type": "date"}),
+    )
+    supplier = forms.ModelChoiceField(
+        required=False,
+        label="",
+        queryset=Supplier.objects.all(),
+        widget=forms.HiddenInput(),
+    )
+
+
+class SparePartImportForm(forms.Form):
+    """Archivo del catálogo de refacciones (ver warehouse/services/catalog_import.py)."""
+    file = forms.FileField(
+        label="Archivo CSV o XLSX",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control-file", "accept": ".csv,.xlsx,.xlsm"}),
+    )
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith((".csv", ".txt", ".xlsx", ".xlsm")):
+            raise forms.ValidationError("Solo se aceptan archivos CSV o XLSX.")
+        return f
+
 
 class SparePartPurchaseForm(forms.ModelForm):
     class Meta:
@@ -211,6 +284,12 @@ class SparePartPurchaseStatusForm(forms.ModelForm):
 from .models import SupplierPayment, SupplierPaymentAllocation
 
 class SupplierPaymentForm(forms.ModelForm):
+    auto_allocate = forms.BooleanField(
+        label="Aplicar automáticamente (compras más antiguas primero)",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "custom-control-input js-auto-allocate"}),
+    )
+
     class Meta:
         model = SupplierPayment
         fields = ["supplier", "date", "method", "reference", "amount", "notes"]
@@ -232,6 +311,15 @@ class SupplierPaymentForm(forms.ModelForm):
         self.fields["supplier"].empty_label = "Selecciona proveedor..."
         self.fields["supplier"].label_from_instance = lambda s: (s.razon_social or s.nombre)
 
+    def clean(self):
+        cleaned = super().clean()
+        # en modo automático el monto lo captura el usuario (en manual se calcula)
+        if cleaned.get("auto_allocate"):
+            amount = cleaned.get("amount")
+            if not amount or amount <= 0:
+                self.add_error("amount", "Captura el monto a aplicar.")
+        return cleaned
+
     def save(self, commit=True):
         obj = super().save(commit=False)
         if getattr(obj, "created_by_id", None) is None and getattr(self, "_user", None):
@@ -273,6 +361,7 @@ class SupplierPaymentAllocationForm(forms.ModelForm):
                 supplier_id=supplier_id,
                 status=SparePartPurchase.Status.APPROVED,
             )
+            .with_totals()  # la etiqueta muestra total/saldo sin consultar por opción
             .order_by("-date", "-id")
         )
 
@@ -0,0 +1,47 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.models import InventoryCheckpoint
+from warehouse.services.valuation import build_checkpoint, closed_months, first_movement_date, month_end
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera los cierres mensuales de inventario (cantidad y valor por refacción "
+        "al fin de cada mes). Sin argumentos genera los meses cerrados que falten, "
+        "desde el primer movimiento; pensado para correr a diario o a inicio de mes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Solo este mes (AAAA-MM); lo regenera si ya existe")
+        parser.add_argument("--rebuild", action="store_true", help="Regenera también los meses ya cerrados")
+
+    def _parse_month(self, raw):
+        try:
+            return month_end(dt.datetime.strptime(raw, "%Y-%m").date())
+        except ValueError:
+            raise CommandError("--month debe tener el formato AAAA-MM.")
+
+    def handle(self, *args, **opts):
+        if opts["month"]:
+            periods = [self._parse_month(opts["month"])]
+        else:
+            first = first_movement_date()
+            if first is None:
+                self.stdout.write("No hay movimientos: nada que cerrar.")
+                return
+            periods = closed_months(first)
+            if not opts["rebuild"]:
+                existing = set(InventoryCheckpoint.objects.values_list("period", flat=True).distinct())
+                periods = [p for p in periods if p not in existing]
+
+        # en orden: cada cierre parte del anterior
+        for period in periods:
+            try:
+                parts = build_checkpoint(period)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"{period:%Y-%m}: {parts} refacción(es)")
+
+        self.stdout.write(self.style.SUCCESS(f"Cierres generados: {len(periods)}."))
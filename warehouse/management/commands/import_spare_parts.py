@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.services.catalog_import import import_parts, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa el catálogo de refacciones desde CSV/XLSX (upsert por código, con "
+        "existencia inicial opcional). Por omisión solo muestra lo que haría; usa "
+        "--apply para escribir. Ej: manage.py import_spare_parts refacciones.csv --apply"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Ruta del archivo CSV/XLSX")
+        parser.add_argument("--apply", action="store_true", help="Aplicar los cambios (sin esto es dry-run)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Renglones por INSERT")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        try:
+            result = import_parts(
+                read_rows(opts["path"]),
+                dry_run=not opts["apply"],
+                batch_size=max(1, opts["batch_size"]),
+                source_name=opts["path"],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for issue in result.errors:
+            self.stderr.write(f"línea {issue.line} [{issue.code or '—'}] ERROR: {issue.message}")
+        for issue in result.warnings:
+            self.stdout.write(f"línea {issue.line} [{issue.code}] aviso: {issue.message}")
+        if opts["verbosity"] > 1:
+            for c in result.changes:
+                detail = ", ".join(f"{k}: {old!r} → {new!r}" for k, (old, new) in c.changes.items())
+                stock = f" existencia {c.initial_qty}" if c.initial_qty else ""
+                self.stdout.write(f"línea {c.line} [{c.code}] {c.action}{stock} {detail}")
+
+        verb = "Importado" if opts["apply"] else "Dry-run (sin cambios)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: {result.rows} renglones · {result.created} nuevas · {result.updated} actualizadas · "
+            f"{result.unchanged} sin cambios · {result.stock_rows} con existencia inicial · "
+            f"{len(result.errors)} con error ({time.monotonic() - t0:.1f}s)."
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.services.stock import rebuild_stock_balances
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica SparePart.stock_balance contra la suma de movimientos vivos y "
+        "corrige las diferencias (con --check solo reporta)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Solo reportar; falla si hay diferencias")
+        parser.add_argument("--limit", type=int, default=50, help="Máximo de diferencias a listar")
+
+    def handle(self, *args, **opts):
+        check_only = opts["check"]
+        mismatches = rebuild_stock_balances(fix=not check_only)
+
+        for m in mismatches[: max(0, opts["limit"])]:
+            self.stdout.write(f"  {m.code}: guardado {m.stored} · movimientos {m.actual}")
+        if len(mismatches) > opts["limit"]:
+            self.stdout.write(f"  … y {len(mismatches) - opts['limit']} más")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Saldos de stock consistentes."))
+        elif check_only:
+            raise CommandError(f"{len(mismatches)} refacción(es) con saldo inconsistente.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Saldos corregidos: {len(mismatches)}."))
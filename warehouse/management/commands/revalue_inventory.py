@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.models import SparePart
+from warehouse.services.valuation import revalue_parts
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye la valuación de inventario (costo promedio, capas PEPS e "
+        "importes por movimiento) reproduciendo los movimientos vivos. Necesario "
+        "una vez después de la migración 0008 y tras correcciones masivas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--code", action="append", default=[], help="Solo esta(s) refacción(es) por código")
+        parser.add_argument("--batch", type=int, default=200, help="Refacciones por transacción")
+
+    def handle(self, *args, **opts):
+        qs = SparePart.objects.order_by("id")
+        if opts["code"]:
+            qs = qs.filter(code__in=opts["code"])
+            if not qs.exists():
+                raise CommandError("No hay refacciones con esos códigos.")
+
+        ids = list(qs.values_list("id", flat=True))
+        batch = max(1, opts["batch"])
+        changed = 0
+        for i in range(0, len(ids), batch):
+            changed += revalue_parts(ids[i:i + batch])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Refacciones revaluadas: {len(ids)} · movimientos con importe corregido: {changed}."
+        ))
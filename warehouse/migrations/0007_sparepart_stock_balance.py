@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:32
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_stock_balance(apps, schema_editor):
+    SparePart = apps.get_model("warehouse", "SparePart")
+    SparePartMovement = apps.get_model("warehouse", "SparePartMovement")
+
+    totals = dict(
+        SparePartMovement.objects.filter(deleted=False)
+        .order_by()
+        .values("spare_part_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("spare_part_id", "total")
+    )
+    parts = []
+    for part in SparePart.objects.filter(pk__in=list(totals)).only("id"):
+        part.stock_balance = totals[part.id] or 0
+        parts.append(part)
+    SparePart.objects.bulk_update(parts, ["stock_balance"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_alter_supplierpayment_supplier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sparepart',
+            name='stock_balance',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, help_text='Saldo mantenido por los movimientos; no se captura.', max_digits=12, verbose_name='Stock'),
+        ),
+        migrations.RunPython(backfill_stock_balance, migrations.RunPython.noop),
+    ]
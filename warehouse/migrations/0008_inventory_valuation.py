@@ -0,0 +1,97 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_sparepart_stock_balance'),
+        ('workshop', '0005_maintenancerequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(db_index=True, verbose_name='Cierre')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Cantidad')),
+                ('stock_value', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Valor (costo promedio)')),
+                ('fifo_value', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Valor (PEPS)')),
+                ('created_at', models.DateTimeField(auto_now=True, verbose_name='Generado en')),
+            ],
+            options={
+                'verbose_name': 'Cierre de inventario',
+                'verbose_name_plural': 'Cierres de inventario',
+                'ordering': ['-period', 'spare_part'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SparePartCostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='Costo unitario')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Cantidad')),
+                ('remaining', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Restante')),
+            ],
+            options={
+                'verbose_name': 'Capa de costo (PEPS)',
+                'verbose_name_plural': 'Capas de costo (PEPS)',
+                'ordering': ['spare_part', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sparepart',
+            name='avg_cost',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=12, verbose_name='Costo promedio'),
+        ),
+        migrations.AddField(
+            model_name='sparepart',
+            name='fifo_value',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Valor (PEPS)'),
+        ),
+        migrations.AddField(
+            model_name='sparepart',
+            name='stock_value',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Valor (costo promedio)'),
+        ),
+        migrations.AddField(
+            model_name='sparepartmovement',
+            name='fifo_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Importe (PEPS)'),
+        ),
+        migrations.AddField(
+            model_name='sparepartmovement',
+            name='value_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Importe (costo promedio)'),
+        ),
+        migrations.AddIndex(
+            model_name='sparepartmovement',
+            index=models.Index(fields=['date'], name='sparepartmov_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='inventorycheckpoint',
+            name='spare_part',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='warehouse.sparepart', verbose_name='Refacción'),
+        ),
+        migrations.AddField(
+            model_name='sparepartcostlayer',
+            name='movement',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layer', to='warehouse.sparepartmovement', verbose_name='Movimiento de entrada'),
+        ),
+        migrations.AddField(
+            model_name='sparepartcostlayer',
+            name='spare_part',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='warehouse.sparepart', verbose_name='Refacción'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorycheckpoint',
+            constraint=models.UniqueConstraint(fields=('period', 'spare_part'), name='uniq_inventory_checkpoint_period_part'),
+        ),
+        migrations.AddIndex(
+            model_name='sparepartcostlayer',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['spare_part', 'id'], name='sparepart_open_layers_idx'),
+        ),
+    ]
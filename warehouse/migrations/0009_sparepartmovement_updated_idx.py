@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_inventory_valuation'),
+        ('workshop', '0005_maintenancerequest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sparepartmovement',
+            index=models.Index(fields=['updated_at'], name='sparepartmov_updated_idx'),
+        ),
+    ]
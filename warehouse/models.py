@@ -1,7 +1,11 @@
 # warehouse/models.py
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import Case, ExpressionWrapper, F, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from suppliers.models import Supplier
 
 
@@ -25,11 +29,13 @@ class SoftDeleteQuerySet(models.QuerySet):
 
 class SoftDeleteManager(models.Manager):
     """Devuelve SOLO registros no eliminados por defecto."""
+    queryset_class = SoftDeleteQuerySet
+
     def get_queryset(self):
-        return SoftDeleteQuerySet(self.model, using=self._db).filter(deleted=False)
+        return self.queryset_class(self.model, using=self._db).filter(deleted=False)
 
     def with_deleted(self):
-        return SoftDeleteQuerySet(self.model, using=self._db)
+        return self.queryset_class(self.model, using=self._db)
 
     def deleted_only(self):
         return self.with_deleted().dead()
@@ -41,8 +47,14 @@ class SparePart(models.Model):
     """
     Refacción en almacén.
 
-    El stock actual NO se guarda en un campo, se calcula a partir
-    de los movimientos (SparePartMovement).
+    El stock actual es un saldo (stock_balance) que mantienen los propios
+    movimientos (SparePartMovement) al crearse, borrarse o restaurarse,
+    con UPDATE ... SET stock_balance = stock_balance + delta. Leerlo no
+    consulta movimientos. `manage.py rebuild_stock_balances` lo verifica /
+    reconstruye contra la suma de movimientos.
+
+    avg_cost / stock_value / fifo_value son la valuación vigente (costo
+    promedio y PEPS); las mantiene warehouse.services.valuation.
     """
     code = models.CharField("Código", max_length=50, unique=True)
     name = models.CharField("Nombre", max_length=255)
@@ -65,6 +77,27 @@ class SparePart(models.Model):
 
     notes = models.TextField("Notas", blank=True)
 
+    stock_balance = models.DecimalField(
+        "Stock",
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text="Saldo mantenido por los movimientos; no se captura.",
+    )
+
+    # Valuación (ver warehouse/services/valuation.py)
+    avg_cost = models.DecimalField(
+        "Costo promedio", max_digits=12, decimal_places=4, default=0, editable=False,
+    )
+    stock_value = models.DecimalField(
+        "Valor (costo promedio)", max_digits=14, decimal_places=2, default=0, editable=False,
+    )
+    fifo_value = models.DecimalField(
+        "Valor (PEPS)", max_digits=14, decimal_places=2, default=0, editable=False,
+    )
+
     # Auditoría / soft delete
     created_at = models.DateTimeField("Creado en", auto_now_add=True)
     updated_at = models.DateTimeField("Actualizado en", auto_now=True)
@@ -81,6 +114,18 @@ class SparePart(models.Model):
     def __str__(self):
         return f"{self.code} - {self.name}"
 
+    # Saldo y valuación: solo los escriben movimientos / valuation (UPDATE directo)
+    MAINTAINED_FIELDS = ("stock_balance", "avg_cost", "stock_value", "fifo_value")
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.pk:
+            # una instancia vieja (p. ej. el formulario de edición) no debe pisar el saldo
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs["update_fields"] = [f for f in update_fields if f not in self.MAINTAINED_FIELDS]
+        return super().save(*args, **kwargs)
+
     def soft_delete(self, using=None, keep_parents=False):
         if not self.deleted:
             self.deleted = True
@@ -88,18 +133,92 @@ class SparePart(models.Model):
 
     @property
     def stock_actual(self):
+        """Stock actual (saldo mantenido; ver stock_balance)."""
+        return self.stock_balance
+
+    @property
+    def is_low_stock(self):
+        return self.stock_balance <= self.min_stock
+
+    @staticmethod
+    def adjust_stock(deltas, using=None):
         """
-        Stock actual calculado como suma de todos los movimientos no borrados.
-        Se espera que las entradas tengan cantidad positiva y las salidas negativa.
+        Aplica {spare_part_id: delta} al saldo con UPDATE atómico.
+        Varias refacciones: se bloquean en orden de id (para que dos
+        transacciones no se bloqueen en cruz) y se actualizan en un solo
+        UPDATE ... CASE.
         """
-        total = self.movements.filter(deleted=False).aggregate(
-            total=Sum("quantity")
-        )["total"] or 0
-        return total
+        deltas = {k: v for k, v in deltas.items() if v}
+        if not deltas:
+            return
+        qs = SparePart.objects.using(using)
+        if len(deltas) == 1:
+            (part_id, delta), = deltas.items()
+            qs.filter(pk=part_id).update(stock_balance=F("stock_balance") + delta)
+            return
+
+        with transaction.atomic(using=using):
+            ids = list(qs.select_for_update().filter(pk__in=deltas).order_by("id").values_list("id", flat=True))
+            qs.filter(pk__in=ids).update(
+                stock_balance=F("stock_balance") + Case(
+                    *[When(pk=part_id, then=Value(deltas[part_id])) for part_id in ids],
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                )
+            )
 
 
 # === Cabecera de compra de refacciones ===
 
+MONEY_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SparePartPurchaseQuerySet(SoftDeleteQuerySet):
+
+    def with_totals(self, as_of=None):
+        """
+        Anota total_amount (partidas vivas), paid_amount (aplicaciones vivas)
+        y balance_amount con subconsultas: una sola consulta para la página,
+        ordenable por saldo. total / amount_paid / balance las usan si están.
+
+        Con as_of (fecha de corte) solo cuentan los pagos vigentes (no
+        borrados ni anulados) con fecha hasta el corte.
+        """
+        items = (
+            SparePartPurchaseItem.objects
+            .filter(purchase=OuterRef("pk"))
+            .order_by()
+            .values("purchase")
+            .annotate(t=Sum(F("quantity") * F("unit_price"), output_field=MONEY_FIELD))
+            .values("t")
+        )
+        allocations = SupplierPaymentAllocation.objects.filter(purchase=OuterRef("pk"))
+        if as_of is not None:
+            allocations = allocations.filter(payment__date__lte=as_of, payment__deleted=False).exclude(
+                payment__status=SupplierPayment.Status.VOID
+            )
+        paid = (
+            allocations
+            .order_by()
+            .values("purchase")
+            .annotate(t=Sum("amount_applied"))
+            .values("t")
+        )
+        zero = Value(Decimal("0.00"), output_field=MONEY_FIELD)
+        return self.annotate(
+            total_amount=Coalesce(Subquery(items, output_field=MONEY_FIELD), zero),
+            paid_amount=Coalesce(Subquery(paid, output_field=MONEY_FIELD), zero),
+        ).annotate(
+            balance_amount=ExpressionWrapper(F("total_amount") - F("paid_amount"), output_field=MONEY_FIELD),
+        )
+
+
+class SparePartPurchaseManager(SoftDeleteManager):
+    queryset_class = SparePartPurchaseQuerySet
+
+    def with_totals(self, as_of=None):
+        return self.get_queryset().with_totals(as_of=as_of)
+
+
 class SparePartPurchase(models.Model):
     """
     Cabecera de una compra de refacciones.
@@ -139,8 +258,8 @@ class SparePartPurchase(models.Model):
     updated_at = models.DateTimeField("Actualizado en", auto_now=True)
     deleted = models.BooleanField(default=False, db_index=True)
 
-    objects = SoftDeleteManager()
-    all_objects = SoftDeleteQuerySet.as_manager()
+    objects = SparePartPurchaseManager()
+    all_objects = SparePartPurchaseQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Compra de refacciones"
@@ -151,18 +270,25 @@ class SparePartPurchase(models.Model):
         prov = (self.supplier.razon_social or self.supplier.nombre) if self.supplier else "—"
         return f"Compra #{self.id} - {prov} ({self.date})"
 
+    # Si la compra viene de .with_totals() se usan las anotaciones (sin consultas)
     @property
     def total(self):
+        if hasattr(self, "total_amount"):
+            return self.total_amount
         return sum((item.subtotal for item in self.items.all()), 0)
 
     @property
     def amount_paid(self):
+        if hasattr(self, "paid_amount"):
+            return self.paid_amount
         return self.payment_allocations.filter(deleted=False).aggregate(
             total=Sum("amount_applied")
         )["total"] or 0
 
     @property
     def balance(self):
+        if hasattr(self, "balance_amount"):
+            return self.balance_amount
         return (self.total or 0) - (self.amount_paid or 0)
 
     def amount_paid_excluding_allocation(self, allocation_pk=None):
@@ -223,6 +349,74 @@ class SparePartPurchaseItem(models.Model):
 
 # === Movimientos de inventario ===
 
+def _merge_deltas(*parts):
+    out = {}
+    for deltas in parts:
+        for part_id, qty in deltas.items():
+            out[part_id] = out.get(part_id, 0) + qty
+    return {k: v for k, v in out.items() if v}
+
+
+def _revalue(part_ids, using=None, since=None):
+    # import diferido: el servicio importa estos modelos
+    from warehouse.services.valuation import revalue_parts
+    revalue_parts(part_ids, using=using, since=since)
+
+
+class SparePartMovementQuerySet(SoftDeleteQuerySet):
+    """
+    Bajas / restauraciones en lote que también mueven SparePart.stock_balance
+    (un GROUP BY por refacción + un UPDATE por refacción afectada) y
+    revalúan las refacciones afectadas.
+    Un .update(quantity=...) directo NO ajusta saldos: usar save() o
+    reconstruir con rebuild_stock_balances / revalue_inventory.
+    """
+
+    def _totals(self, *, deleted):
+        """({spare_part_id: cantidad}, fecha del movimiento más antiguo)."""
+        rows = (
+            self.filter(deleted=deleted)
+            .order_by()
+            .values("spare_part_id")
+            .annotate(total=Sum("quantity"), first=Min("date"))
+            .values_list("spare_part_id", "total", "first")
+        )
+        totals, since = {}, None
+        for part_id, total, first in rows:
+            totals[part_id] = total or 0
+            if since is None or first < since:
+                since = first
+        return totals, since
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            totals, since = self._totals(deleted=False)
+            count = self.filter(deleted=False).update(deleted=True, updated_at=timezone.now())
+            SparePart.adjust_stock({k: -v for k, v in totals.items()}, using=self.db)
+            _revalue(totals, using=self.db, since=since)
+        return count
+
+    def restore(self):
+        with transaction.atomic(using=self.db):
+            totals, since = self._totals(deleted=True)
+            count = self.filter(deleted=True).update(deleted=False, updated_at=timezone.now())
+            SparePart.adjust_stock(totals, using=self.db)
+            _revalue(totals, using=self.db, since=since)
+        return count
+
+    def hard_delete(self):
+        with transaction.atomic(using=self.db):
+            totals, since = self._totals(deleted=False)
+            result = super().hard_delete()
+            SparePart.adjust_stock({k: -v for k, v in totals.items()}, using=self.db)
+            _revalue(totals, using=self.db, since=since)
+        return result
+
+
+class SparePartMovementManager(SoftDeleteManager):
+    queryset_class = SparePartMovementQuerySet
+
+
 class SparePartMovement(models.Model):
     """
     Movimiento de inventario de una refacción.
@@ -275,6 +469,14 @@ class SparePartMovement(models.Model):
         help_text="Opcional. Útil para valuación de inventario.",
     )
 
+    # Importe con el que el movimiento entró a la valuación (con signo)
+    value_amount = models.DecimalField(
+        "Importe (costo promedio)", max_digits=14, decimal_places=2, default=0, editable=False,
+    )
+    fifo_amount = models.DecimalField(
+        "Importe (PEPS)", max_digits=14, decimal_places=2, default=0, editable=False,
+    )
+
     # En caso de que el movimiento venga de una compra
     purchase_item = models.ForeignKey(
         SparePartPurchaseItem,
@@ -303,13 +505,19 @@ class SparePartMovement(models.Model):
     updated_at = models.DateTimeField("Actualizado en", auto_now=True)
     deleted = models.BooleanField(default=False, db_index=True)
 
-    objects = SoftDeleteManager()
-    all_objects = SoftDeleteQuerySet.as_manager()
+    objects = SparePartMovementManager()
+    all_objects = SparePartMovementQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Movimiento de refacción"
         verbose_name_plural = "Movimientos de refacciones"
         ordering = ["-date", "-id"]
+        indexes = [
+            # valor / stock a una fecha: movimientos después del último cierre
+            models.Index(fields=["date"], name="sparepartmov_date_idx"),
+            # sugerencias de reorden: movimientos cambiados desde la última lectura
+            models.Index(fields=["updated_at"], name="sparepartmov_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.get_movement_type_display()} {self.quantity} de {self.spare_part}"
@@ -342,9 +550,190 @@ class SparePartMovement(models.Model):
                 "Para entradas (inicial, compra o ajuste de entrada) la cantidad debe ser positiva."
             )
 
+    # ------------------------------------------------------------
+    # Saldo de stock (SparePart.stock_balance)
+    # ------------------------------------------------------------
+    STOCK_FIELDS = ("spare_part", "quantity", "deleted")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        # estado con el que se leyó: base para calcular el delta al guardar
+        if all(f in field_names for f in ("spare_part_id", "quantity", "deleted")):
+            obj._stock_row = (obj.spare_part_id, obj.quantity, obj.deleted)
+        if "unit_cost" in field_names:
+            obj._loaded_unit_cost = obj.unit_cost
+        return obj
+
+    @staticmethod
+    def _stock_contribution(row):
+        part_id, qty, deleted = row
+        if deleted or not part_id or not qty:
+            return {}
+        return {part_id: qty}
+
+    def _stored_stock_row(self):
+        if self._state.adding or not self.pk:
+            return None
+        row = getattr(self, "_stock_row", None)
+        if row is None:
+            row = (
+                type(self).all_objects.using(self._state.db)
+                .filter(pk=self.pk)
+                .values_list("spare_part_id", "quantity", "deleted")
+                .first()
+            )
+        return row
+
+    # Importes de valuación: solo los escribe warehouse.services.valuation
+    VALUATION_FIELDS = ("value_amount", "fifo_amount")
+
+    def _cost_changed(self, update_fields):
+        if update_fields is not None and "unit_cost" not in update_fields:
+            return False
+        loaded = getattr(self, "_loaded_unit_cost", None)
+        return not hasattr(self, "_loaded_unit_cost") or loaded != self.unit_cost
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        return super().save(*args, **kwargs)
+        using = kwargs.get("using") or self._state.db or "default"
+
+        if not self._state.adding and self.pk and kwargs.get("update_fields") is None:
+            # una instancia vieja no debe pisar importes ya revaluados
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.VALUATION_FIELDS
+            ]
+
+        with transaction.atomic(using=using):
+            old = self._stored_stock_row()
+            new = [self.spare_part_id, self.quantity, self.deleted]
+
+            update_fields = kwargs.get("update_fields")
+            if old is not None and update_fields is not None:
+                # lo que no se escribe conserva el valor guardado
+                names = set(update_fields)
+                for i, name in enumerate(self.STOCK_FIELDS):
+                    if name not in names and f"{name}_id" not in names:
+                        new[i] = old[i]
+
+            result = super().save(*args, **kwargs)
+
+            new = tuple(new)
+            before = self._stock_contribution(old) if old else {}
+            SparePart.adjust_stock(
+                _merge_deltas(self._stock_contribution(new), {k: -v for k, v in before.items()}),
+                using=using,
+            )
+
+            # Valuación: lo nuevo se valúa incremental; una corrección
+            # (cantidad, refacción, costo, baja/restauración) revalúa.
+            if old is None:
+                if self._stock_contribution(new):
+                    from warehouse.services.valuation import post_movements
+                    post_movements([self], using=using)
+            elif tuple(old) != new or (self._cost_changed(update_fields) and self._stock_contribution(new)):
+                _revalue({old[0], new[0]}, using=using, since=self.date)
+                self.refresh_from_db(using=using, fields=list(self.VALUATION_FIELDS))
+
+            self._stock_row = new
+            self._loaded_unit_cost = self.unit_cost
+        return result
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get("using") or self._state.db or "default"
+        with transaction.atomic(using=using):
+            old = self._stored_stock_row()
+            result = super().delete(*args, **kwargs)
+            if old:
+                contribution = self._stock_contribution(old)
+                SparePart.adjust_stock({k: -v for k, v in contribution.items()}, using=using)
+                if contribution:
+                    _revalue(contribution, using=using, since=self.date)
+        return result
+
+    def soft_delete(self):
+        if not self.deleted:
+            self.deleted = True
+            self.save(update_fields=["deleted", "updated_at"])
+
+    def restore(self):
+        if self.deleted:
+            self.deleted = False
+            self.save(update_fields=["deleted", "updated_at"])
+
+
+# === Valuación de inventario ===
+
+class SparePartCostLayer(models.Model):
+    """
+    Capa PEPS: una por movimiento de entrada, con lo que aún queda de ella.
+    Las salidas consumen capas de la más antigua a la más nueva
+    (ver warehouse/services/valuation.py).
+    """
+    spare_part = models.ForeignKey(
+        SparePart,
+        verbose_name="Refacción",
+        related_name="cost_layers",
+        on_delete=models.CASCADE,
+    )
+    movement = models.OneToOneField(
+        SparePartMovement,
+        verbose_name="Movimiento de entrada",
+        related_name="cost_layer",
+        on_delete=models.CASCADE,
+    )
+    unit_cost = models.DecimalField("Costo unitario", max_digits=12, decimal_places=4)
+    quantity = models.DecimalField("Cantidad", max_digits=10, decimal_places=2)
+    remaining = models.DecimalField("Restante", max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Capa de costo (PEPS)"
+        verbose_name_plural = "Capas de costo (PEPS)"
+        ordering = ["spare_part", "id"]
+        indexes = [
+            models.Index(
+                fields=["spare_part", "id"],
+                condition=models.Q(remaining__gt=0),
+                name="sparepart_open_layers_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.spare_part_id}: {self.remaining}/{self.quantity} @ {self.unit_cost}"
+
+
+class InventoryCheckpoint(models.Model):
+    """
+    Cierre mensual por refacción: cantidad y valor al final del día `period`
+    (último día del mes). El valor a una fecha parte del cierre anterior más
+    cercano y suma solo los movimientos posteriores.
+    """
+    spare_part = models.ForeignKey(
+        SparePart,
+        verbose_name="Refacción",
+        related_name="checkpoints",
+        on_delete=models.CASCADE,
+    )
+    period = models.DateField("Cierre", db_index=True)
+    quantity = models.DecimalField("Cantidad", max_digits=12, decimal_places=2)
+    stock_value = models.DecimalField("Valor (costo promedio)", max_digits=14, decimal_places=2)
+    fifo_value = models.DecimalField("Valor (PEPS)", max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField("Generado en", auto_now=True)
+
+    class Meta:
+        verbose_name = "Cierre de inventario"
+        verbose_name_plural = "Cierres de inventario"
+        ordering = ["-period", "spare_part"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "spare_part"],
+                name="uniq_inventory_checkpoint_period_part",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period:%Y-%m} {self.spare_part_id}: {self.quantity}"
 
 from django.conf import settings
 from django.db import models
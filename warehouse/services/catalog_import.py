@@ -0,0 +1,374 @@
+# warehouse/services/catalog_import.py
+"""
+Importación masiva del catálogo de refacciones (CSV o XLSX).
+
+- Upsert por `code` (único) con INSERT ... ON CONFLICT (code) DO UPDATE en
+  lotes (bulk_create(update_conflicts=True)). En una refacción existente,
+  las celdas vacías conservan el valor guardado.
+- Existencia inicial: un movimiento INITIAL por refacción, insertados con
+  bulk_create; el saldo se ajusta con SparePart.adjust_stock y la
+  valuación con services.valuation.post_movements (igual que la entrada de
+  compras). Solo para refacciones sin movimientos: volver a cargar el
+  mismo archivo no duplica existencias.
+- Errores por renglón: cada renglón se valida con los campos del modelo;
+  los inválidos se reportan con su número de línea y se omiten, el resto
+  se importa.
+- dry_run=True: el mismo análisis (qué se crea, qué cambia campo por
+  campo) sin escribir nada.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import os
+import unicodedata
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from audit.signals import log_batch
+from warehouse.models import SparePart, SparePartMovement
+from warehouse.services.valuation import post_movements
+
+ZERO = Decimal("0")
+
+# campos de SparePart que se pueden importar (además de code)
+PART_FIELDS = ("name", "description", "unit", "min_stock", "notes")
+
+# campo -> encabezados aceptados
+COLUMNS = {
+    "code": ("codigo", "clave", "code"),
+    "name": ("nombre", "name"),
+    "description": ("descripcion", "description"),
+    "unit": ("unidad", "unidad de medida", "unit"),
+    "min_stock": ("stock minimo", "minimo", "min stock"),
+    "notes": ("notas", "notes"),
+    "initial_qty": ("existencia", "existencia inicial", "cantidad", "initial qty"),
+    "unit_cost": ("costo", "costo unitario", "unit cost"),
+}
+
+INITIAL_DESCRIPTION = "Carga inicial (importación de catálogo)"
+
+
+def _norm(text) -> str:
+    """minúsculas, sin acentos, '_' como espacio (para comparar encabezados)."""
+    t = unicodedata.normalize("NFKD", str(text or "").strip().lower().replace("_", " "))
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return " ".join(t.split())
+
+
+# ======================================================
+# Lectura (CSV / XLSX)
+# ======================================================
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # Excel guarda 1234 como 1234.0
+    return str(value).strip()
+
+
+def read_rows(source, filename: Optional[str] = None) -> Iterator[list[str]]:
+    """
+    Renglones del archivo como listas de strings. `source` es una ruta o un
+    archivo binario (p.ej. request.FILES[...]). XLSX requiere openpyxl; el
+    CSV puede venir separado por coma, punto y coma o tabulador.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        filename = filename or str(source)
+        with open(source, "rb") as fh:
+            yield from read_rows(fh, filename)
+        return
+
+    if (filename or "").lower().endswith((".xlsx", ".xlsm")):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as e:
+            raise ValueError("Para leer XLSX instala openpyxl o guarda la hoja como CSV.") from e
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield [_cell(v) for v in row]
+        finally:
+            wb.close()
+        return
+
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(text, dialect):
+            yield [_cell(v) for v in row]
+    finally:
+        text.detach()  # el archivo es del llamador
+
+
+# ======================================================
+# Resultado
+# ======================================================
+@dataclass
+class RowIssue:
+    line: int
+    code: str
+    message: str
+
+
+@dataclass
+class RowChange:
+    line: int
+    code: str
+    action: str                                   # "create" | "update" | "unchanged"
+    changes: dict = field(default_factory=dict)   # campo -> (antes, después)
+    initial_qty: Optional[Decimal] = None
+    unit_cost: Optional[Decimal] = None
+
+
+@dataclass
+class ImportResult:
+    dry_run: bool
+    rows: int = 0
+    changes: list = field(default_factory=list)   # RowChange (sin "unchanged" sin existencia)
+    errors: list = field(default_factory=list)    # RowIssue: renglón omitido
+    warnings: list = field(default_factory=list)  # RowIssue: renglón importado con ajuste
+    unchanged: int = 0
+    movements: int = 0
+
+    @property
+    def created(self) -> int:
+        return sum(1 for c in self.changes if c.action == "create")
+
+    @property
+    def updated(self) -> int:
+        return sum(1 for c in self.changes if c.action == "update")
+
+    @property
+    def stock_rows(self) -> int:
+        return sum(1 for c in self.changes if c.initial_qty)
+
+
+# ======================================================
+# Análisis
+# ======================================================
+def _header_index(header: list[str]) -> dict:
+    normalized = [_norm(h) for h in header]
+    index = {}
+    for name, aliases in COLUMNS.items():
+        for alias in aliases:
+            if _norm(alias) in normalized:
+                index[name] = normalized.index(_norm(alias))
+                break
+    if "code" not in index:
+        raise ValueError("No se encontró la columna 'codigo' en el encabezado.")
+    return index
+
+
+def _clean_value(model, name: str, raw: str):
+    """Valida/convierte con el campo del modelo (max_length, dígitos, etc.)."""
+    model_field = model._meta.get_field(name)
+    if model_field.get_internal_type() == "DecimalField":
+        raw = raw.replace("$", "").replace(" ", "")
+        raw = raw.replace(",", ".") if "." not in raw else raw.replace(",", "")
+    return model_field.clean(raw, None)
+
+
+def _parse(rows: Iterator[list[str]], result: ImportResult) -> list[tuple[int, dict]]:
+    """[(línea, {campo: valor})] solo con las celdas capturadas."""
+    index = None
+    parsed = []
+    seen: dict = {}
+    for line, row in enumerate(rows, start=1):
+        if not any(row):
+            continue
+        if index is None:
+            index = _header_index(row)
+            continue
+
+        result.rows += 1
+        values = {}
+        problems = []
+        failed = set()
+        for name, i in index.items():
+            raw = row[i] if i < len(row) else ""
+            if not raw:
+                continue
+            model = SparePartMovement if name in ("initial_qty", "unit_cost") else SparePart
+            target = {"initial_qty": "quantity"}.get(name, name)
+            try:
+                values[name] = _clean_value(model, target, raw)
+            except ValidationError as e:
+                failed.add(name)
+                label = model._meta.get_field(target).verbose_name
+                problems.append(f"{label}: {' '.join(e.messages)}")
+
+        code = values.get("code", "")
+        if not code and "code" not in failed:
+            problems.append("Falta el código.")
+        if code in seen:
+            problems.append(f"Código repetido (ya viene en la línea {seen[code]}).")
+        for name, label in (("min_stock", "Stock mínimo"), ("initial_qty", "Existencia"), ("unit_cost", "Costo unitario")):
+            if values.get(name) is not None and values[name] < 0:
+                problems.append(f"{label}: no puede ser negativo.")
+
+        if problems:
+            result.errors.append(RowIssue(line, code, "; ".join(problems)))
+            continue
+        seen[code] = line
+        parsed.append((line, values))
+
+    if index is None:
+        raise ValueError("El archivo está vacío.")
+    return parsed
+
+
+def _chunks(items: list, size: int) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _existing(codes: list[str], batch_size: int) -> dict:
+    out = {}
+    for chunk in _chunks(codes, batch_size):
+        for row in (
+            SparePart.all_objects.filter(code__in=chunk)
+            .values("id", "code", "deleted", *PART_FIELDS)
+        ):
+            out[row["code"]] = row
+    return out
+
+
+def _with_movements(part_ids: list[int], batch_size: int) -> set:
+    out = set()
+    for chunk in _chunks(part_ids, batch_size):
+        out.update(
+            SparePartMovement.objects.filter(spare_part_id__in=chunk)
+            .order_by().values_list("spare_part_id", flat=True).distinct()
+        )
+    return out
+
+
+def analyze(rows: Iterable[list[str]], *, batch_size: int = 1000, dry_run: bool = True):
+    """
+    Lee y valida los renglones contra el catálogo actual. Regresa
+    (ImportResult, {code: SparePart a escribir}, {code: id de las existentes}).
+    """
+    result = ImportResult(dry_run=dry_run)
+    parsed = _parse(iter(rows), result)
+
+    existing = _existing([v["code"] for _line, v in parsed], batch_size)
+    moved = _with_movements([r["id"] for r in existing.values()], batch_size)
+    defaults = {name: SparePart._meta.get_field(name).get_default() for name in PART_FIELDS}
+
+    to_write = {}
+    ids = {}
+    for line, values in parsed:
+        code = values["code"]
+        current = existing.get(code)
+        qty = values.get("initial_qty") or None
+
+        if current is not None and current["deleted"]:
+            result.errors.append(RowIssue(line, code, "La refacción está dada de baja; restáurala antes de importarla."))
+            continue
+
+        if current is None:
+            if not values.get("name"):
+                result.errors.append(RowIssue(line, code, "Falta el nombre (obligatorio para refacciones nuevas)."))
+                continue
+            data = {**defaults, **{k: values[k] for k in PART_FIELDS if k in values}}
+            change = RowChange(line, code, "create", {k: (None, data[k]) for k in PART_FIELDS if data[k] not in ("", None)})
+            part = SparePart(code=code, **data)
+        else:
+            data = {k: values.get(k, current[k]) for k in PART_FIELDS}
+            diff = {k: (current[k], data[k]) for k in PART_FIELDS if data[k] != current[k]}
+            change = RowChange(line, code, "update" if diff else "unchanged", diff)
+            part = SparePart(code=code, **data)
+            ids[code] = current["id"]
+            if qty and current["id"] in moved:
+                result.warnings.append(RowIssue(
+                    line, code, "Existencia ignorada: la refacción ya tiene movimientos (usa un ajuste).",
+                ))
+                qty = None
+
+        if qty:
+            change.initial_qty = qty
+            change.unit_cost = values.get("unit_cost")
+        if change.action == "unchanged" and not qty:
+            result.unchanged += 1
+            continue
+        result.changes.append(change)
+        to_write[code] = part
+
+    result.errors.sort(key=lambda issue: issue.line)
+    return result, to_write, ids
+
+
+# ======================================================
+# Importación
+# ======================================================
+def import_parts(
+    rows: Iterable[list[str]],
+    *,
+    dry_run: bool = True,
+    batch_size: int = 1000,
+    source_name: str = "",
+) -> ImportResult:
+    """Analiza y, si no es dry_run, aplica el upsert y las existencias iniciales."""
+    result, to_write, ids = analyze(rows, batch_size=batch_size, dry_run=dry_run)
+    if dry_run or not result.changes:
+        return result
+
+    with transaction.atomic():
+        upserts = [to_write[c.code] for c in result.changes if c.action != "unchanged"]
+        for chunk in _chunks(upserts, batch_size):
+            SparePart.objects.bulk_create(
+                chunk,
+                update_conflicts=True,
+                unique_fields=["code"],
+                update_fields=[*PART_FIELDS, "updated_at"],
+            )
+            # no todos los motores regresan el id de los renglones insertados
+            ids.update((p.code, p.pk) for p in chunk if p.pk is not None)
+            missing = [p.code for p in chunk if p.code not in ids]
+            if missing:
+                ids.update(SparePart.objects.filter(code__in=missing).values_list("code", "id"))
+
+        movements = SparePartMovement.objects.bulk_create(
+            [
+                SparePartMovement(
+                    spare_part_id=ids[c.code],
+                    movement_type="INITIAL",
+                    quantity=c.initial_qty,
+                    unit_cost=c.unit_cost,
+                    description=INITIAL_DESCRIPTION,
+                )
+                for c in result.changes
+                if c.initial_qty
+            ],
+            batch_size=batch_size,
+        )
+        if movements:
+            SparePart.adjust_stock({m.spare_part_id: m.quantity for m in movements})
+            post_movements(movements)
+        result.movements = len(movements)
+
+        log_batch(
+            SparePart,
+            summary=(
+                f"Importación de catálogo{f' ({source_name})' if source_name else ''}: "
+                f"{result.created} nuevas, {result.updated} actualizadas, "
+                f"{result.movements} existencias iniciales"
+            ),
+            changes={
+                "created": [c.code for c in result.changes if c.action == "create"],
+                "updated": {c.code: c.changes for c in result.changes if c.action == "update"},
+                "initial_stock": {c.code: c.initial_qty for c in result.changes if c.initial_qty},
+                "errors": len(result.errors),
+            },
+        )
+    return result
@@ -0,0 +1,159 @@
+# warehouse/services/payables.py
+"""
+Cuentas por pagar a proveedores (compras de refacciones).
+
+- Saldo por compra = partidas vivas - aplicaciones de pago vivas
+  (SparePartPurchaseQuerySet.with_totals, subconsultas correlacionadas);
+  a la fecha de corte solo cuentan pagos vigentes hechos hasta ese día.
+- Antigüedad por fecha de compra contra una fecha de corte, en cubetas
+  0–30 / 31–60 / 61–90 / 90+ días.
+- El resumen por proveedor es un solo GROUP BY; el detalle y el CSV se
+  leen con .values() / .iterator(): no se instancian modelos, así que
+  años de compras no crecen la memoria.
+"""
+from __future__ import annotations
+
+import csv
+import datetime as dt
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from warehouse.models import SparePartPurchase
+
+ZERO = Decimal("0.00")
+
+# (clave, etiqueta, días desde, días hasta) — hasta=None: sin límite
+AGING_BUCKETS = (
+    ("d0_30", "0–30", 0, 30),
+    ("d31_60", "31–60", 31, 60),
+    ("d61_90", "61–90", 61, 90),
+    ("d90_plus", "90+", 91, None),
+)
+
+
+def open_purchases(as_of: Optional[dt.date] = None, supplier_id: Optional[int] = None):
+    """Compras aprobadas con saldo pendiente, a la fecha de corte (compras y pagos)."""
+    as_of = as_of or timezone.localdate()
+    qs = (
+        SparePartPurchase.objects
+        .filter(status=SparePartPurchase.Status.APPROVED, date__lte=as_of)
+        .with_totals(as_of=as_of)
+        .filter(balance_amount__gt=0)
+    )
+    if supplier_id:
+        qs = qs.filter(supplier_id=supplier_id)
+    return qs
+
+
+def _bucket_filter(as_of: dt.date, start: int, end: Optional[int]) -> Q:
+    q = Q(date__lte=as_of - dt.timedelta(days=start))
+    if end is not None:
+        q &= Q(date__gte=as_of - dt.timedelta(days=end))
+    return q
+
+
+def bucket_for(age_days: int) -> str:
+    for key, _label, start, end in AGING_BUCKETS:
+        if age_days >= start and (end is None or age_days <= end):
+            return key
+    return AGING_BUCKETS[0][0]
+
+
+def aging_by_supplier(as_of: Optional[dt.date] = None) -> list[dict]:
+    """
+    Una fila por proveedor: supplier_id, supplier__nombre, una columna por
+    cubeta, total y número de compras abiertas. Un solo query agrupado.
+    """
+    as_of = as_of or timezone.localdate()
+    buckets = {
+        key: Sum("balance_amount", filter=_bucket_filter(as_of, start, end), default=ZERO)
+        for key, _label, start, end in AGING_BUCKETS
+    }
+    return list(
+        open_purchases(as_of)
+        .order_by()
+        .values("supplier_id", "supplier__nombre")
+        .annotate(**buckets, total=Sum("balance_amount"), purchases=Count("id"))
+        .order_by("-total", "supplier__nombre")
+    )
+
+
+def aging_totals(rows: Iterable[dict]) -> dict:
+    keys = [b[0] for b in AGING_BUCKETS] + ["total", "purchases"]
+    out = {k: 0 for k in keys}
+    for row in rows:
+        for k in keys:
+            out[k] += row[k] or 0
+    return out
+
+
+DETAIL_FIELDS = (
+    "id", "date", "invoice_number", "supplier_id", "supplier__nombre",
+    "total_amount", "paid_amount", "balance_amount",
+)
+
+
+def aging_detail(as_of: Optional[dt.date] = None, supplier_id: Optional[int] = None):
+    """Compras abiertas (más antiguas primero) como dicts, sin modelos."""
+    return (
+        open_purchases(as_of, supplier_id)
+        .order_by("date", "id")
+        .values(*DETAIL_FIELDS)
+    )
+
+
+def with_age(rows: Iterable[dict], as_of: dt.date) -> Iterator[dict]:
+    for row in rows:
+        age = (as_of - row["date"]).days
+        yield {**row, "age_days": age, "bucket": bucket_for(age)}
+
+
+# ======================================================
+# CSV en streaming
+# ======================================================
+class _Echo:
+    """Pseudo-archivo: csv.writer escribe y regresamos la línea tal cual."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header: list, rows: Iterable[Iterable]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield "\ufeff"  # BOM: Excel abre bien los acentos
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def summary_csv_rows(as_of: dt.date) -> tuple[list, Iterator[list]]:
+    labels = [label for _key, label, _s, _e in AGING_BUCKETS]
+    header = ["Proveedor", *labels, "Total", "Compras"]
+
+    def rows():
+        for r in aging_by_supplier(as_of):
+            yield [
+                r["supplier__nombre"] or "—",
+                *[r[key] for key, *_ in AGING_BUCKETS],
+                r["total"], r["purchases"],
+            ]
+
+    return header, rows()
+
+
+def detail_csv_rows(as_of: dt.date, supplier_id: Optional[int] = None) -> tuple[list, Iterator[list]]:
+    header = ["Compra", "Fecha", "Factura", "Proveedor", "Total", "Pagado", "Saldo", "Días", "Antigüedad"]
+    labels = {key: label for key, label, _s, _e in AGING_BUCKETS}
+
+    def rows():
+        for r in with_age(aging_detail(as_of, supplier_id).iterator(chunk_size=2000), as_of):
+            yield [
+                r["id"], r["date"].isoformat(), r["invoice_number"], r["supplier__nombre"] or "—",
+                r["total_amount"], r["paid_amount"], r["balance_amount"],
+                r["age_days"], labels[r["bucket"]],
+            ]
+
+    return header, rows()
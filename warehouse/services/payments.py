@@ -0,0 +1,103 @@
+# warehouse/services/payments.py
+"""
+Aplicación automática de pagos a proveedor (la compra más antigua primero).
+
+- Se bloquean las compras aprobadas del proveedor (SELECT ... FOR UPDATE)
+  y DESPUÉS se leen sus saldos en una sola consulta anotada
+  (SparePartPurchaseQuerySet.with_totals, sin fecha de corte): en READ
+  COMMITTED la segunda consulta ve lo que otro pago concurrente haya
+  confirmado.
+- El reparto se calcula en memoria y las aplicaciones se insertan con
+  bulk_create (sin SupplierPaymentAllocation.clean, que recalcula el
+  saldo con varias consultas por renglón).
+- La bitácora recibe una sola entrada con el lote.
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from audit.signals import log_batch
+from warehouse.models import SparePartPurchase, SupplierPayment, SupplierPaymentAllocation
+
+ZERO = Decimal("0.00")
+
+
+def plan_allocation(open_rows, amount: Decimal) -> list[tuple[int, Decimal]]:
+    """
+    Reparte `amount` sobre `open_rows` (dicts con id y balance_amount, ya
+    ordenados del más antiguo al más reciente). Regresa [(purchase_id, monto)].
+    """
+    remaining = amount
+    plan = []
+    for row in open_rows:
+        if remaining <= 0:
+            break
+        applied = min(remaining, row["balance_amount"])
+        if applied > 0:
+            plan.append((row["id"], applied))
+            remaining -= applied
+    return plan
+
+
+def allocate_oldest_first(payment: SupplierPayment) -> list[SupplierPaymentAllocation]:
+    """
+    Guarda `payment` (aún sin pk, con proveedor y monto) y lo aplica a las
+    compras abiertas del proveedor, la más antigua primero. Si el monto
+    excede el saldo pendiente no se guarda nada.
+    """
+    amount = payment.amount or ZERO
+    if amount <= 0:
+        raise ValidationError({"amount": "El monto del pago debe ser mayor a cero."})
+
+    with transaction.atomic():
+        list(
+            SparePartPurchase.objects
+            .select_for_update()
+            .filter(supplier_id=payment.supplier_id, status=SparePartPurchase.Status.APPROVED)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        # saldo con TODAS las aplicaciones vivas (no solo las de pagos hasta
+        # payment.date): un pago con fecha anterior no debe volver a cubrir
+        # lo que ya pagó otro con fecha posterior
+        rows = list(
+            SparePartPurchase.objects
+            .filter(
+                supplier_id=payment.supplier_id,
+                status=SparePartPurchase.Status.APPROVED,
+                date__lte=payment.date,
+            )
+            .with_totals()
+            .filter(balance_amount__gt=0)
+            .order_by("date", "id")
+            .values("id", "balance_amount")
+        )
+
+        pending = sum((r["balance_amount"] for r in rows), ZERO)
+        if not rows:
+            raise ValidationError("El proveedor no tiene compras aprobadas con saldo pendiente.")
+        if amount > pending:
+            raise ValidationError({
+                "amount": f"El monto excede el saldo pendiente del proveedor (${pending:,.2f})."
+            })
+
+        payment.save()
+        allocations = SupplierPaymentAllocation.objects.bulk_create([
+            SupplierPaymentAllocation(payment=payment, purchase_id=purchase_id, amount_applied=applied)
+            for purchase_id, applied in plan_allocation(rows, amount)
+        ])
+
+        log_batch(
+            payment,
+            summary=f"Aplicación automática del pago #{payment.pk}: {len(allocations)} compra(s)",
+            changes={
+                "allocations": [
+                    {"purchase": a.purchase_id, "amount_applied": a.amount_applied}
+                    for a in allocations
+                ],
+            },
+        )
+    return allocations
@@ -0,0 +1,109 @@
+# warehouse/services/purchases.py
+"""
+Entrada a inventario de compras aprobadas.
+
+Un movimiento PURCHASE por partida viva que aún no lo tenga, en una
+sola transacción:
+- las reglas de SparePartMovement.clean se validan en Python contra las
+  partidas ya cargadas (sin full_clean ni consultas por renglón);
+- los movimientos se insertan con bulk_create (no pasan por save() ni por
+  las señales de auditoría), el saldo se ajusta con un solo UPDATE y la
+  valuación con un lote (services.valuation.post_movements);
+- la bitácora recibe una sola entrada con el lote.
+"""
+from __future__ import annotations
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from audit.signals import log_batch
+from warehouse.models import SparePart, SparePartMovement, SparePartPurchase, SparePartPurchaseItem, _merge_deltas
+from warehouse.services.valuation import post_movements
+
+
+def pending_items(purchase):
+    """Partidas vivas de la compra sin movimiento PURCHASE vivo."""
+    return (
+        SparePartPurchaseItem.objects
+        .filter(purchase=purchase)
+        .annotate(has_move=Exists(
+            SparePartMovement.objects.filter(
+                movement_type="PURCHASE",
+                purchase_item=OuterRef("pk"),
+            )
+        ))
+        .filter(has_move=False)
+        .order_by("id")
+    )
+
+
+def _validate(items) -> None:
+    errors = []
+    for n, item in enumerate(items, start=1):
+        label = f"Partida {n} ({item.spare_part_id and item.spare_part or 'sin refacción'})"
+        if not item.spare_part_id:
+            errors.append(f"{label}: falta la refacción.")
+        if item.quantity is None or item.quantity <= 0:
+            errors.append(f"{label}: para entradas (compra) la cantidad debe ser positiva.")
+        if item.unit_price is not None and item.unit_price < 0:
+            errors.append(f"{label}: el precio unitario no puede ser negativo.")
+    if errors:
+        raise ValidationError(errors)
+
+
+def post_purchase_movements(purchase: SparePartPurchase) -> list[SparePartMovement]:
+    """
+    Aplica a inventario las partidas pendientes de una compra APROBADA.
+    Idempotente: la compra se bloquea y solo se postean partidas sin
+    movimiento, así que aprobar dos veces no duplica entradas.
+    Regresa los movimientos creados.
+    """
+    with transaction.atomic():
+        purchase = (
+            SparePartPurchase.objects.select_for_update(of=("self",))
+            .select_related("supplier")
+            .get(pk=purchase.pk)
+        )
+        if purchase.status != SparePartPurchase.Status.APPROVED:
+            raise ValidationError("Solo las compras aprobadas entran a inventario.")
+
+        items = list(pending_items(purchase).select_related("spare_part"))
+        if not items:
+            return []
+        _validate(items)
+
+        supplier_name = purchase.supplier.nombre if purchase.supplier else "—"
+        description = f"Compra #{purchase.id} - {supplier_name}"
+        movements = SparePartMovement.objects.bulk_create([
+            SparePartMovement(
+                spare_part_id=item.spare_part_id,
+                movement_type="PURCHASE",
+                quantity=item.quantity,
+                unit_cost=item.unit_price,
+                purchase_item=item,
+                description=description,
+            )
+            for item in items
+        ])
+
+        SparePart.adjust_stock(_merge_deltas(*({m.spare_part_id: m.quantity} for m in movements)))
+        post_movements(movements)
+
+        log_batch(
+            purchase,
+            summary=f"Entrada a inventario de la compra #{purchase.id}: {len(movements)} movimiento(s)",
+            changes={
+                "movements": [
+                    {
+                        "id": m.pk,
+                        "spare_part": m.spare_part_id,
+                        "quantity": m.quantity,
+                        "unit_cost": m.unit_cost,
+                        "purchase_item": m.purchase_item_id,
+                    }
+                    for m in movements
+                ],
+            },
+        )
+    return movements
@@ -0,0 +1,199 @@
+# warehouse/services/reorder.py
+"""
+Sugerencias de reorden de refacciones por velocidad de consumo.
+
+- Consumo: movimientos WORKSHOP_USAGE de los últimos 30 y 90 días, en un
+  solo GROUP BY por refacción. La tasa diaria es la mayor de las dos
+  (tendencia reciente o promedio trimestral) para no quedarse corto.
+- Días de cobertura = saldo actual / tasa diaria.
+- Punto de reorden = tasa × días de entrega + stock mínimo; si el saldo
+  está en o por debajo, se sugiere comprar hasta cubrir entrega + días
+  objetivo (settings.REORDER_LEAD_TIME_DAYS / REORDER_TARGET_DAYS).
+- Proveedor habitual: el que más compras aprobadas tiene de la refacción
+  (desempate: la más reciente).
+
+Consumo y proveedor habitual se guardan en la caché de Django por día.
+Cada lectura solo recalcula las refacciones con movimientos creados o
+modificados desde la anterior (índice sobre updated_at, con un margen
+para transacciones que confirman después de la lectura); saldo y mínimo
+se leen siempre de SparePart (una consulta sobre columnas). Cambios en
+compras (estatus, proveedor, partidas) vacían la caché (warehouse.signals).
+"""
+from __future__ import annotations
+
+import datetime as dt
+from decimal import ROUND_CEILING, Decimal
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from warehouse.models import SparePart, SparePartMovement, SparePartPurchase, SparePartPurchaseItem
+
+ZERO = Decimal("0")
+SHORT_WINDOW = 30
+LONG_WINDOW = 90
+
+CACHE_KEY = "warehouse:reorder:stats"
+
+
+def _day_start(day: dt.date) -> dt.datetime:
+    return timezone.make_aware(dt.datetime.combine(day, dt.time.min))
+
+
+# ======================================================
+# Estadísticas (cacheables)
+# ======================================================
+def _usage(part_ids: Optional[Iterable[int]], today: dt.date) -> dict:
+    """{spare_part_id: (consumo 30 días, consumo 90 días)} en unidades positivas."""
+    start_short = _day_start(today - dt.timedelta(days=SHORT_WINDOW - 1))
+    start_long = _day_start(today - dt.timedelta(days=LONG_WINDOW - 1))
+    qs = SparePartMovement.objects.filter(movement_type="WORKSHOP_USAGE", date__gte=start_long)
+    if part_ids is not None:
+        qs = qs.filter(spare_part_id__in=list(part_ids))
+    rows = (
+        qs.order_by()
+        .values("spare_part_id")
+        .annotate(
+            short=Sum("quantity", filter=Q(date__gte=start_short), default=ZERO),
+            long=Sum("quantity"),
+        )
+        .values_list("spare_part_id", "short", "long")
+    )
+    # los consumos se guardan con cantidad negativa
+    return {part_id: (-short, -long) for part_id, short, long in rows if long}
+
+
+def _usual_suppliers(part_ids: Optional[Iterable[int]]) -> dict:
+    """{spare_part_id: (supplier_id, nombre)} según compras aprobadas."""
+    qs = SparePartPurchaseItem.objects.filter(
+        purchase__deleted=False,
+        purchase__status=SparePartPurchase.Status.APPROVED,
+        purchase__supplier__isnull=False,
+    )
+    if part_ids is not None:
+        qs = qs.filter(spare_part_id__in=list(part_ids))
+    rows = (
+        qs.order_by()
+        .values("spare_part_id", "purchase__supplier_id", "purchase__supplier__nombre")
+        .annotate(n=Count("purchase_id", distinct=True), last=Max("purchase__date"))
+        .values_list("spare_part_id", "purchase__supplier_id", "purchase__supplier__nombre", "n", "last")
+    )
+    best: dict = {}
+    for part_id, supplier_id, name, n, last in rows:
+        if part_id not in best or (n, last) > best[part_id][0]:
+            best[part_id] = ((n, last), (supplier_id, name))
+    return {part_id: supplier for part_id, (_rank, supplier) in best.items()}
+
+
+def _stats() -> dict:
+    """Consumo y proveedor habitual del día, desde caché + lo que cambió."""
+    today = timezone.localdate()
+    started = timezone.now()
+    data = cache.get(CACHE_KEY)
+
+    if not data or data["day"] != today:
+        # cambió el día: las ventanas se movieron, se recalcula todo
+        data = {"day": today, "usage": _usage(None, today), "suppliers": _usual_suppliers(None)}
+    else:
+        touched = set(
+            SparePartMovement.all_objects
+            .filter(updated_at__gte=data["watermark"])
+            .order_by()
+            .values_list("spare_part_id", flat=True)
+            .distinct()
+        )
+        if not touched:
+            return data
+        for part_id in touched:
+            data["usage"].pop(part_id, None)
+            data["suppliers"].pop(part_id, None)
+        data["usage"].update(_usage(touched, today))
+        data["suppliers"].update(_usual_suppliers(touched))
+
+    # marca tomada ANTES de leer y con margen: un movimiento guardado antes
+    # pero confirmado después de esta lectura se revisa en la siguiente
+    data["watermark"] = started - dt.timedelta(seconds=settings.REORDER_WATERMARK_MARGIN_SECONDS)
+    cache.set(CACHE_KEY, data, settings.REORDER_CACHE_SECONDS)
+    return data
+
+
+def clear_cache() -> None:
+    cache.delete(CACHE_KEY)
+
+
+# ======================================================
+# Reporte
+# ======================================================
+def _ceil(value: Decimal) -> Decimal:
+    return value.quantize(Decimal("1"), rounding=ROUND_CEILING)
+
+
+def reorder_report(*, include_all: bool = False) -> list[dict]:
+    """
+    Una fila por refacción con consumo reciente o bajo su mínimo:
+    consumo 30/90, tasa diaria, días de cobertura, punto de reorden,
+    cantidad sugerida y proveedor habitual. Sin include_all solo las que
+    necesitan compra. Ordenadas por urgencia (menos días de cobertura).
+    """
+    stats = _stats()
+    usage, suppliers = stats["usage"], stats["suppliers"]
+    lead = Decimal(settings.REORDER_LEAD_TIME_DAYS)
+    target = Decimal(settings.REORDER_TARGET_DAYS)
+
+    parts = (
+        SparePart.objects.filter(deleted=False)
+        .filter(Q(pk__in=list(usage)) | Q(min_stock__gt=0, stock_balance__lte=F("min_stock")))
+        .values("id", "code", "name", "unit", "stock_balance", "min_stock", "avg_cost")
+    )
+
+    rows = []
+    for part in parts:
+        short, long = usage.get(part["id"], (ZERO, ZERO))
+        rate = max(short / SHORT_WINDOW, long / LONG_WINDOW)
+        balance = part["stock_balance"]
+        min_stock = part["min_stock"] or ZERO
+
+        reorder_point = rate * lead + min_stock
+        needed = balance <= reorder_point if rate > 0 else balance <= min_stock
+        suggested = max(_ceil(rate * (lead + target) + min_stock - balance), ZERO) if needed else ZERO
+        if not include_all and not suggested:
+            continue
+
+        if rate > 0:
+            days_cover = max(balance, ZERO) / rate
+        else:
+            days_cover = None
+        supplier_id, supplier_name = suppliers.get(part["id"], (None, None))
+        rows.append({
+            **part,
+            "usage_short": short,
+            "usage_long": long,
+            "daily_rate": rate.quantize(Decimal("0.01")),
+            "days_cover": days_cover.quantize(Decimal("0.1")) if days_cover is not None else None,
+            "reorder_point": _ceil(reorder_point),
+            "suggested_qty": suggested,
+            "est_amount": (suggested * (part["avg_cost"] or ZERO)).quantize(Decimal("0.01")),
+            "supplier_id": supplier_id,
+            "supplier_name": supplier_name,
+        })
+
+    rows.sort(key=lambda r: (r["days_cover"] is None, r["days_cover"] or ZERO, r["code"]))
+    return rows
+
+
+def group_by_supplier(rows: Iterable[dict]) -> list[dict]:
+    """Agrupa el reporte por proveedor habitual (sin proveedor al final)."""
+    groups: dict = {}
+    for row in rows:
+        group = groups.setdefault(row["supplier_id"], {
+            "supplier_id": row["supplier_id"],
+            "supplier_name": row["supplier_name"],
+            "rows": [],
+            "est_amount": ZERO,
+        })
+        group["rows"].append(row)
+        group["est_amount"] += row["est_amount"]
+    return sorted(groups.values(), key=lambda g: (g["supplier_id"] is None, (g["supplier_name"] or "").lower()))
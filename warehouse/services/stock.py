@@ -0,0 +1,180 @@
+# warehouse/services/stock.py
+"""
+Saldo de stock por refacción (SparePart.stock_balance).
+
+El saldo lo mantienen los movimientos (ver SparePartMovement.save y
+SparePartMovementQuerySet). Aquí viven:
+
+- post_workshop_usage: consumo de refacciones de una OT con las
+  refacciones bloqueadas (select_for_update), rechazando salidas mayores
+  al saldo.
+- la verificación / reconstrucción contra la suma de movimientos vivos,
+  que usa el comando rebuild_stock_balances.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+
+from warehouse.models import SparePart, SparePartMovement, _merge_deltas
+
+
+@dataclass
+class StockMismatch:
+    part_id: int
+    code: str
+    stored: Decimal
+    actual: Decimal
+
+
+@dataclass
+class Shortage:
+    part_id: int
+    code: str
+    name: str
+    available: Decimal
+    requested: Decimal
+
+    @property
+    def missing(self) -> Decimal:
+        return self.requested - self.available
+
+    def __str__(self):
+        return (
+            f"{self.code} - {self.name}: stock insuficiente "
+            f"(disponible {self.available}, faltan {self.missing})."
+        )
+
+
+class InsufficientStock(ValidationError):
+    """El consumo dejaría alguna refacción con stock negativo."""
+
+    def __init__(self, shortages: list[Shortage]):
+        self.shortages = shortages
+        super().__init__([str(s) for s in shortages])
+
+
+# ======================================================
+# Consumo en órdenes de taller
+# ======================================================
+def _negate(deltas: dict) -> dict:
+    return {k: -v for k, v in deltas.items()}
+
+
+def post_workshop_usage(order, movements, deleted=()) -> None:
+    """
+    Guarda el consumo de refacciones de una OT en una sola transacción.
+
+    - movements: SparePartMovement nuevos o editados (cantidad capturada en
+      positivo o negativo; se guarda como salida WORKSHOP_USAGE de la OT).
+    - deleted: movimientos de la OT que se dan de baja (regresan al stock).
+
+    Se bloquean primero los movimientos editados/borrados y luego las
+    refacciones afectadas (una consulta cada uno, en orden de id), se
+    calcula el efecto neto por refacción contra el saldo ya bloqueado y, si
+    alguna quedaría en negativo, se lanza InsufficientStock sin escribir
+    nada. Dos mecánicos consumiendo la misma refacción se forman en el
+    bloqueo en vez de pasarse del saldo.
+    """
+    movements = [mv for mv in movements if mv.quantity]
+    deleted = [mv for mv in deleted if mv.pk]
+
+    for mv in movements:
+        mv.movement_type = "WORKSHOP_USAGE"
+        mv.workshop_order = order
+        mv.quantity = -abs(mv.quantity)
+
+    with transaction.atomic():
+        stored_pks = [mv.pk for mv in movements if mv.pk] + [mv.pk for mv in deleted]
+        stored = {}
+        if stored_pks:
+            stored = {
+                pk: (part_id, qty, is_deleted)
+                for pk, part_id, qty, is_deleted in (
+                    SparePartMovement.all_objects.select_for_update()
+                    .filter(pk__in=stored_pks)
+                    .order_by("id")
+                    .values_list("pk", "spare_part_id", "quantity", "deleted")
+                )
+            }
+
+        contribution = SparePartMovement._stock_contribution
+        changes = []
+        for mv in movements + deleted:
+            old = stored.get(mv.pk)
+            if old is not None:
+                mv._stock_row = old  # lo leído con bloqueo, no lo del formulario
+                changes.append(_negate(contribution(old)))
+        for mv in movements:
+            changes.append(contribution((mv.spare_part_id, mv.quantity, False)))
+        deltas = _merge_deltas(*changes)
+
+        if deltas:
+            parts = (
+                SparePart.objects.select_for_update()
+                .filter(pk__in=deltas)
+                .order_by("id")
+                .values_list("id", "code", "name", "stock_balance")
+            )
+            shortages = [
+                Shortage(part_id, code, name, balance, -deltas[part_id])
+                for part_id, code, name, balance in parts
+                if deltas[part_id] < 0 and balance + deltas[part_id] < 0
+            ]
+            if shortages:
+                raise InsufficientStock(shortages)
+
+        # Las refacciones ya están bloqueadas: cada save() solo aplica su
+        # delta (UPDATE stock_balance = stock_balance + delta) y audita.
+        for mv in deleted:
+            mv.soft_delete()
+        for mv in movements:
+            mv.save()
+
+
+# ======================================================
+# Verificación / reconstrucción
+# ======================================================
+def movement_totals() -> dict:
+    """{spare_part_id: suma de movimientos vivos} en un solo GROUP BY."""
+    rows = (
+        SparePartMovement.objects
+        .order_by()
+        .values("spare_part_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("spare_part_id", "total")
+    )
+    return {part_id: total or Decimal("0") for part_id, total in rows}
+
+
+def rebuild_stock_balances(*, fix: bool = True, batch_size: int = 500) -> list[StockMismatch]:
+    """
+    Compara stock_balance contra la suma de movimientos y, si fix=True,
+    corrige las diferencias. Las refacciones se bloquean (select_for_update)
+    durante la revisión: un movimiento concurrente espera a que termine.
+    """
+    with transaction.atomic():
+        parts = list(
+            SparePart.objects.select_for_update()
+            .order_by("id")
+            .values_list("id", "code", "stock_balance")
+        )
+        totals = movement_totals()
+
+        mismatches = []
+        for part_id, code, stored in parts:
+            actual = totals.get(part_id, Decimal("0"))
+            if stored != actual:
+                mismatches.append(StockMismatch(part_id, code, stored, actual))
+
+        if fix and mismatches:
+            SparePart.objects.bulk_update(
+                [SparePart(id=m.part_id, stock_balance=m.actual) for m in mismatches],
+                ["stock_balance"],
+                batch_size=batch_size,
+            )
+    return mismatches
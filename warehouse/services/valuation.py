@@ -0,0 +1,419 @@
+# warehouse/services/valuation.py
+"""
+Valuación de inventario: costo promedio ponderado móvil y capas PEPS.
+
+- Cada movimiento vivo guarda con qué importe entró a la valuación
+  (value_amount a costo promedio, fifo_amount a PEPS, con signo). En
+  SparePart, stock_value / fifo_value son la suma de esos importes y
+  avg_cost el promedio vigente: valuar el almacén completo es leer
+  columnas de SparePart (valuation_report), sin recorrer movimientos.
+- Un movimiento nuevo se valúa de forma incremental (post_movements):
+  las entradas van a su unit_cost (o al promedio vigente si no lo traen)
+  y abren una capa PEPS; las salidas se valúan al promedio y consumen
+  capas de la más antigua a la más nueva.
+- Una corrección (editar cantidad/costo/refacción, baja o restauración)
+  revalúa solo las refacciones afectadas, reproduciendo sus movimientos
+  vivos en orden (revalue_parts).
+- Valor a una fecha: último cierre mensual (InventoryCheckpoint) más los
+  importes de los movimientos posteriores (valuation_as_of). Los cierres
+  los genera build_inventory_checkpoints; una corrección que toca un mes
+  ya cerrado recalcula, solo para las refacciones afectadas, sus renglones
+  de los cierres desde ese mes (refresh_checkpoints): los demás quedan
+  intactos y la consulta sigue partiendo del cierre.
+"""
+from __future__ import annotations
+
+import calendar
+import datetime as dt
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from warehouse.models import InventoryCheckpoint, SparePart, SparePartCostLayer, SparePartMovement
+
+ZERO = Decimal("0")
+CENT = Decimal("0.01")
+COST_PLACES = Decimal("0.0001")
+
+PART_FIELDS = ("avg_cost", "stock_value", "fifo_value")
+MOVEMENT_FIELDS = ("value_amount", "fifo_amount")
+
+
+# ======================================================
+# Motor (por refacción, en memoria)
+# ======================================================
+class _PartValuation:
+    """Estado de valuación de una refacción mientras se aplican movimientos."""
+
+    def __init__(self, qty=ZERO, value=ZERO, fifo_value=ZERO, avg_cost=ZERO, layers=()):
+        self.qty = qty
+        self.value = value
+        self.fifo_value = fifo_value
+        self.avg_cost = avg_cost
+        self.layers = list(layers)   # capas abiertas, de la más antigua a la más nueva
+        self.new_layers = []
+        self.dirty_layers = {}       # capas ya guardadas cuyo restante cambió
+
+    def apply(self, mv) -> None:
+        if mv.quantity > 0:
+            self._receive(mv)
+        else:
+            self._issue(mv)
+
+    def _receive(self, mv):
+        qty = mv.quantity
+        cost = mv.unit_cost if mv.unit_cost is not None else self.avg_cost
+        amount = (qty * cost).quantize(CENT)
+
+        layer = SparePartCostLayer(
+            spare_part_id=mv.spare_part_id, movement_id=mv.pk,
+            unit_cost=cost, quantity=qty, remaining=qty,
+        )
+        self.layers.append(layer)
+        self.new_layers.append(layer)
+
+        mv.value_amount = amount
+        mv.fifo_amount = amount
+        self.qty += qty
+        self.value += amount
+        self.fifo_value += amount
+        self.avg_cost = (self.value / self.qty).quantize(COST_PLACES) if self.qty > 0 else cost
+
+    def _issue(self, mv):
+        qty = -mv.quantity
+        qty_after = self.qty - qty
+
+        # Promedio: la salida no mueve el costo promedio
+        if qty_after == 0 and self.qty > 0:
+            value_amount = -self.value  # sin residuos de redondeo
+        else:
+            value_amount = -(qty * self.avg_cost).quantize(CENT)
+
+        # PEPS: consumir capas de la más antigua a la más nueva
+        pending = qty
+        cost = ZERO
+        while pending > 0 and self.layers:
+            layer = self.layers[0]
+            take = min(layer.remaining, pending)
+            layer.remaining -= take
+            cost += take * layer.unit_cost
+            pending -= take
+            if layer.pk:
+                self.dirty_layers[layer.pk] = layer
+            if layer.remaining <= 0:
+                self.layers.pop(0)
+        cost += pending * self.avg_cost  # sin capas (stock negativo): al promedio
+        fifo_amount = -cost.quantize(CENT)
+        if qty_after == 0 and not self.layers:
+            fifo_amount = -self.fifo_value
+
+        mv.value_amount = value_amount
+        mv.fifo_amount = fifo_amount
+        self.qty = qty_after
+        self.value += value_amount
+        self.fifo_value += fifo_amount
+
+    def store(self, part) -> None:
+        part.avg_cost = self.avg_cost
+        part.stock_value = self.value
+        part.fifo_value = self.fifo_value
+
+
+def _open_layers(part_ids, using) -> dict:
+    layers: dict = {}
+    qs = (
+        SparePartCostLayer.objects.using(using)
+        .filter(spare_part_id__in=part_ids, remaining__gt=0)
+        .order_by("spare_part_id", "id")
+    )
+    for layer in qs:
+        layers.setdefault(layer.spare_part_id, []).append(layer)
+    return layers
+
+
+# ======================================================
+# Incremental
+# ======================================================
+def post_movements(movements: Iterable[SparePartMovement], using: Optional[str] = None) -> None:
+    """
+    Valúa movimientos recién guardados (con pk), en el orden dado.
+
+    Se llama después de SparePart.adjust_stock: la cantidad previa de cada
+    refacción es su stock_balance menos lo que suman estos movimientos.
+    Consultas fijas por lote: refacciones (bloqueadas), capas abiertas y
+    un bulk por tabla.
+    """
+    movements = [mv for mv in movements if mv.pk and not mv.deleted and mv.quantity]
+    if not movements:
+        return
+    using = using or "default"
+
+    batch_qty: dict = {}
+    for mv in movements:
+        batch_qty[mv.spare_part_id] = batch_qty.get(mv.spare_part_id, ZERO) + mv.quantity
+
+    with transaction.atomic(using=using):
+        parts = {
+            p.pk: p for p in
+            SparePart.objects.using(using).select_for_update()
+            .filter(pk__in=batch_qty).order_by("id")
+            .only("id", "stock_balance", *PART_FIELDS)
+        }
+        layers = _open_layers(list(parts), using)
+
+        states = {
+            part_id: _PartValuation(
+                qty=part.stock_balance - batch_qty[part_id],
+                value=part.stock_value,
+                fifo_value=part.fifo_value,
+                avg_cost=part.avg_cost,
+                layers=layers.get(part_id, ()),
+            )
+            for part_id, part in parts.items()
+        }
+        for mv in movements:
+            states[mv.spare_part_id].apply(mv)
+
+        for part_id, state in states.items():
+            state.store(parts[part_id])
+
+        SparePartCostLayer.objects.using(using).bulk_create(
+            [layer for state in states.values() for layer in state.new_layers]
+        )
+        dirty = [layer for state in states.values() for layer in state.dirty_layers.values()]
+        if dirty:
+            SparePartCostLayer.objects.using(using).bulk_update(dirty, ["remaining"])
+        SparePartMovement.all_objects.using(using).bulk_update(movements, MOVEMENT_FIELDS)
+        SparePart.objects.using(using).bulk_update(list(parts.values()), PART_FIELDS)
+
+
+# ======================================================
+# Revaluación (correcciones / reconstrucción)
+# ======================================================
+def revalue_parts(
+    part_ids: Iterable[int],
+    using: Optional[str] = None,
+    batch_size: int = 1000,
+    since=None,
+) -> int:
+    """
+    Rehace la valuación de las refacciones dadas reproduciendo sus
+    movimientos vivos por fecha: importes de cada movimiento, capas PEPS y
+    totales de SparePart. Regresa cuántos movimientos cambiaron de importe.
+
+    `since` es la fecha del movimiento corregido (si se conoce): los
+    renglones de estas refacciones en los cierres desde ahí, o desde el
+    primer importe que cambie, se recalculan.
+    """
+    part_ids = sorted({pk for pk in part_ids if pk})
+    if not part_ids:
+        return 0
+    using = using or "default"
+    changed = 0
+    first_changed = since
+
+    with transaction.atomic(using=using):
+        parts = list(
+            SparePart.objects.using(using).select_for_update()
+            .filter(pk__in=part_ids).order_by("id")
+            .only("id", *PART_FIELDS)
+        )
+        SparePartCostLayer.objects.using(using).filter(spare_part_id__in=part_ids).delete()
+
+        states = {p.pk: _PartValuation() for p in parts}
+        movements = (
+            SparePartMovement.objects.using(using)
+            .filter(spare_part_id__in=part_ids)
+            .exclude(quantity=0)
+            .order_by("spare_part_id", "date", "id")
+            .only("id", "spare_part_id", "date", "quantity", "unit_cost", *MOVEMENT_FIELDS)
+        )
+        pending = []
+        for mv in movements.iterator(chunk_size=batch_size):
+            before = (mv.value_amount, mv.fifo_amount)
+            states[mv.spare_part_id].apply(mv)
+            if (mv.value_amount, mv.fifo_amount) != before:
+                pending.append(mv)
+                if first_changed is None or mv.date < first_changed:
+                    first_changed = mv.date
+            if len(pending) >= batch_size:
+                SparePartMovement.all_objects.using(using).bulk_update(pending, MOVEMENT_FIELDS)
+                changed += len(pending)
+                pending = []
+        if pending:
+            SparePartMovement.all_objects.using(using).bulk_update(pending, MOVEMENT_FIELDS)
+            changed += len(pending)
+
+        for part in parts:
+            states[part.pk].store(part)
+        SparePartCostLayer.objects.using(using).bulk_create(
+            [layer for state in states.values() for layer in state.new_layers],
+            batch_size=batch_size,
+        )
+        SparePart.objects.using(using).bulk_update(parts, PART_FIELDS, batch_size=batch_size)
+
+        if first_changed is not None:
+            refresh_checkpoints(part_ids, first_changed, using=using)
+
+    return changed
+
+
+# ======================================================
+# Reportes
+# ======================================================
+REPORT_FIELDS = ("id", "code", "name", "unit", "stock_balance", "avg_cost", "stock_value", "fifo_value")
+
+
+def valuation_report(*, include_empty: bool = False):
+    """Valuación vigente por refacción: una consulta sobre columnas de SparePart."""
+    qs = SparePart.objects.filter(deleted=False)
+    if not include_empty:
+        qs = qs.exclude(stock_balance=0, stock_value=0, fifo_value=0)
+    return qs.order_by("code").values(*REPORT_FIELDS)
+
+
+def valuation_totals(rows_qs) -> dict:
+    totals = rows_qs.order_by().aggregate(
+        quantity=Sum("stock_balance"), stock_value=Sum("stock_value"), fifo_value=Sum("fifo_value"),
+    )
+    return {k: v or ZERO for k, v in totals.items()}
+
+
+def month_end(day: dt.date) -> dt.date:
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _day_start(day: dt.date) -> dt.datetime:
+    return timezone.make_aware(dt.datetime.combine(day, dt.time.min))
+
+
+def latest_checkpoint(as_of: dt.date, *, before: bool = False) -> Optional[dt.date]:
+    """Cierre más reciente en (o, con before=True, antes de) as_of; None si no hay."""
+    lookup = "period__lt" if before else "period__lte"
+    return InventoryCheckpoint.objects.filter(**{lookup: as_of}).aggregate(p=Max("period"))["p"]
+
+
+def _values_from(period: Optional[dt.date], as_of: dt.date) -> dict:
+    out: dict = {}
+    if period is not None:
+        for part_id, qty, value, fifo in (
+            InventoryCheckpoint.objects.filter(period=period)
+            .values_list("spare_part_id", "quantity", "stock_value", "fifo_value")
+        ):
+            out[part_id] = {"quantity": qty, "stock_value": value, "fifo_value": fifo}
+
+    movements = SparePartMovement.objects.filter(date__lt=_day_start(as_of + dt.timedelta(days=1)))
+    if period is not None:
+        movements = movements.filter(date__gte=_day_start(period + dt.timedelta(days=1)))
+    rows = (
+        movements.order_by()
+        .values("spare_part_id")
+        .annotate(q=Sum("quantity"), v=Sum("value_amount"), f=Sum("fifo_amount"))
+        .values_list("spare_part_id", "q", "v", "f")
+    )
+    for part_id, qty, value, fifo in rows:
+        row = out.setdefault(part_id, {"quantity": ZERO, "stock_value": ZERO, "fifo_value": ZERO})
+        row["quantity"] += qty or ZERO
+        row["stock_value"] += value or ZERO
+        row["fifo_value"] += fifo or ZERO
+    return out
+
+
+def valuation_as_of(as_of: dt.date) -> dict:
+    """
+    {spare_part_id: {"quantity", "stock_value", "fifo_value"}} al cierre
+    del día as_of: cierre mensual más cercano + un GROUP BY de los
+    movimientos posteriores (índice por fecha).
+    """
+    return _values_from(latest_checkpoint(as_of), as_of)
+
+
+def _local_date(value) -> dt.date:
+    if isinstance(value, dt.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def refresh_checkpoints(part_ids: Iterable[int], since, using: Optional[str] = None) -> int:
+    """
+    Recalcula los renglones de `part_ids` en los cierres ya generados de los
+    meses que incluyen `since` (fecha o datetime) y posteriores: un GROUP BY
+    por cierre, solo sobre los movimientos de esas refacciones. Los demás
+    renglones del cierre no se tocan. Regresa cuántos renglones quedaron.
+    """
+    part_ids = sorted({pk for pk in part_ids if pk})
+    db = using or "default"
+    periods = list(
+        InventoryCheckpoint.objects.using(db)
+        .filter(period__gte=_local_date(since))
+        .order_by("period")
+        .values_list("period", flat=True)
+        .distinct()
+    )
+    if not part_ids or not periods:
+        return 0
+
+    rows = []
+    for period in periods:
+        sums = (
+            SparePartMovement.objects.using(db)
+            .filter(spare_part_id__in=part_ids, date__lt=_day_start(period + dt.timedelta(days=1)))
+            .order_by()
+            .values("spare_part_id")
+            .annotate(q=Sum("quantity"), v=Sum("value_amount"), f=Sum("fifo_amount"))
+            .values_list("spare_part_id", "q", "v", "f")
+        )
+        rows.extend(
+            InventoryCheckpoint(spare_part_id=part_id, period=period, quantity=q, stock_value=v, fifo_value=f)
+            for part_id, q, v, f in sums
+            if q or v or f
+        )
+
+    with transaction.atomic(using=db):
+        InventoryCheckpoint.objects.using(db).filter(spare_part_id__in=part_ids, period__gte=periods[0]).delete()
+        InventoryCheckpoint.objects.using(db).bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def closed_months(start: dt.date, end: Optional[dt.date] = None) -> list[dt.date]:
+    """Fin de mes de cada mes cerrado desde el mes de `start` hasta antes de hoy (o `end`)."""
+    today = timezone.localdate()
+    end = min(end or today, today - dt.timedelta(days=1))
+    out = []
+    period = month_end(start)
+    while period <= end:
+        out.append(period)
+        period = month_end(period + dt.timedelta(days=1))
+    return out
+
+
+def first_movement_date() -> Optional[dt.date]:
+    first = SparePartMovement.objects.aggregate(d=Min("date"))["d"]
+    return _local_date(first) if first else None
+
+
+def build_checkpoint(period: dt.date) -> int:
+    """
+    Genera (o regenera) el cierre del mes de `period` a partir del cierre
+    anterior. Regresa cuántas refacciones quedaron en el cierre.
+    Solo meses cerrados: el mes en curso todavía recibe movimientos.
+    """
+    period = month_end(period)
+    if period >= timezone.localdate():
+        raise ValueError("Solo se pueden cerrar meses completos (anteriores a hoy).")
+    values = _values_from(latest_checkpoint(period, before=True), period)
+    rows = [
+        InventoryCheckpoint(
+            spare_part_id=part_id, period=period,
+            quantity=v["quantity"], stock_value=v["stock_value"], fifo_value=v["fifo_value"],
+        )
+        for part_id, v in values.items()
+        if v["quantity"] or v["stock_value"] or v["fifo_value"]
+    ]
+    with transaction.atomic():
+        InventoryCheckpoint.objects.filter(period=period).delete()
+        InventoryCheckpoint.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,20 @@
+# warehouse/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from warehouse.models import SparePartPurchase, SparePartPurchaseItem
+from warehouse.services import reorder
+
+
+# ======================================================
+# Sugerencias de reorden: proveedor habitual
+# (aprobar/rechazar una compra o cambiarle proveedor/partidas no siempre
+# crea movimientos, así que la caché no lo detecta sola)
+# ======================================================
+@receiver(post_save, sender=SparePartPurchase)
+@receiver(post_delete, sender=SparePartPurchase)
+@receiver(post_save, sender=SparePartPurchaseItem)
+@receiver(post_delete, sender=SparePartPurchaseItem)
+def purchase_changed(sender, instance, **kwargs):
+    transaction.on_commit(reorder.clear_cache)
@@ -1,3 +1,542 @@
+import datetime as dt
+import io
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.utils import timezone
+
+from suppliers.models import Supplier
+from trucks.models import Truck
+from warehouse.models import (
+    InventoryCheckpoint,
+    SparePart,
+    SparePartMovement,
+    SparePartPurchase,
+    SparePartPurchaseItem,
+    SupplierPayment,
+    SupplierPaymentAllocation,
+)
+from warehouse.services.catalog_import import import_parts, read_rows
+from warehouse.services.payables import aging_by_supplier, open_purchases
+from warehouse.services.payments import allocate_oldest_first
+from warehouse.services import reorder
+from warehouse.services.purchases import post_purchase_movements
+from warehouse.services.stock import InsufficientStock, post_workshop_usage
+from warehouse.services.valuation import _values_from, build_checkpoint, month_end, valuation_as_of
+from workshop.models import WorkshopOrder
+
+
+def D(value) -> Decimal:
+    return Decimal(str(value))
+
+
+def make_part(code="R-001", **kwargs):
+    kwargs.setdefault("name", f"Refacción {code}")
+    return SparePart.objects.create(code=code, **kwargs)
+
+
+def move(part, qty, movement_type=None, **kwargs):
+    qty = D(qty)
+    movement_type = movement_type or ("ADJUST_IN" if qty > 0 else "ADJUST_OUT")
+    return SparePartMovement.objects.create(spare_part=part, movement_type=movement_type, quantity=qty, **kwargs)
+
+
+def make_purchase(supplier, items, date=None, status=SparePartPurchase.Status.APPROVED):
+    """items: [(refacción, cantidad, precio unitario)]"""
+    purchase = SparePartPurchase.objects.create(supplier=supplier, date=date or dt.date(2026, 1, 1), status=status)
+    for part, qty, price in items:
+        SparePartPurchaseItem.objects.create(purchase=purchase, spare_part=part, quantity=D(qty), unit_price=D(price))
+    return purchase
+
+
+def balance(part) -> Decimal:
+    return SparePart.objects.values_list("stock_balance", flat=True).get(pk=part.pk)
+
+
+# ======================================================
+# Saldo de stock (SparePart.stock_balance)
+# ======================================================
+class StockBalanceTests(TestCase):
+    def setUp(self):
+        self.part = make_part("R-001")
+        self.other = make_part("R-002")
+
+    def test_create_adds_to_balance(self):
+        move(self.part, 10)
+        move(self.part, -3)
+        self.assertEqual(balance(self.part), D(7))
+
+    def test_edit_quantity_applies_difference(self):
+        mv = move(self.part, 10)
+        mv.quantity = D(4)
+        mv.save()
+        self.assertEqual(balance(self.part), D(4))
+
+    def test_edit_spare_part_moves_balance(self):
+        mv = move(self.part, 10)
+        mv.spare_part = self.other
+        mv.save()
+        self.assertEqual(balance(self.part), D(0))
+        self.assertEqual(balance(self.other), D(10))
+
+    def test_stale_instance_does_not_double_apply(self):
+        mv = move(self.part, 10)
+        stale = SparePartMovement.objects.get(pk=mv.pk)
+        mv.quantity = D(6)
+        mv.save()
+        stale.description = "solo descripción"
+        stale.save(update_fields=["description", "updated_at"])
+        self.assertEqual(balance(self.part), D(6))
+
+    def test_soft_delete_and_restore(self):
+        mv = move(self.part, 10)
+        move(self.part, 5)
+        mv.soft_delete()
+        self.assertEqual(balance(self.part), D(5))
+        mv.restore()
+        self.assertEqual(balance(self.part), D(15))
+
+    def test_queryset_delete_and_restore(self):
+        move(self.part, 10)
+        move(self.part, -4)
+        move(self.other, 7)
+
+        SparePartMovement.objects.filter(spare_part__in=[self.part, self.other]).delete()
+        self.assertEqual(balance(self.part), D(0))
+        self.assertEqual(balance(self.other), D(0))
+
+        SparePartMovement.all_objects.filter(spare_part=self.part).restore()
+        self.assertEqual(balance(self.part), D(6))
+        self.assertEqual(balance(self.other), D(0))
+
+    def test_queryset_delete_skips_already_deleted(self):
+        mv = move(self.part, 10)
+        move(self.part, 2)
+        mv.soft_delete()
+        SparePartMovement.all_objects.filter(spare_part=self.part).delete()
+        self.assertEqual(balance(self.part), D(0))
+
+    def test_stale_part_save_keeps_balance(self):
+        stale = SparePart.objects.get(pk=self.part.pk)
+        move(self.part, 10, unit_cost=D(5))
+        stale.name = "Renombrada"
+        stale.save()
+
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.name, "Renombrada")
+        self.assertEqual(part.stock_balance, D(10))
+        self.assertEqual(part.stock_value, D(50))
+
+
+# ======================================================
+# Consumo en órdenes de taller (post_workshop_usage)
+# ======================================================
+class WorkshopUsageTests(TestCase):
+    def setUp(self):
+        self.part = make_part("R-001")
+        self.other = make_part("R-002")
+        move(self.part, 10)
+        move(self.other, 2)
+        truck = Truck.objects.create(placas="ABC-123", numero_economico="T-01")
+        self.order = WorkshopOrder.objects.create(truck=truck, estado="ABIERTA", descripcion="Servicio")
+
+    def usage(self, part, qty):
+        return SparePartMovement(spare_part=part, quantity=D(qty))
+
+    def test_usage_is_stored_as_negative_outflow(self):
+        mv = self.usage(self.part, 4)
+        post_workshop_usage(self.order, [mv])
+
+        mv.refresh_from_db()
+        self.assertEqual(mv.movement_type, "WORKSHOP_USAGE")
+        self.assertEqual(mv.workshop_order, self.order)
+        self.assertEqual(mv.quantity, D(-4))
+        self.assertEqual(balance(self.part), D(6))
+
+    def test_over_consumption_raises_and_writes_nothing(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            post_workshop_usage(self.order, [self.usage(self.part, 3), self.usage(self.other, 5)])
+
+        (shortage,) = ctx.exception.shortages
+        self.assertEqual(shortage.part_id, self.other.pk)
+        self.assertEqual(shortage.available, D(2))
+        self.assertEqual(shortage.missing, D(3))
+        self.assertEqual(balance(self.part), D(10))
+        self.assertEqual(balance(self.other), D(2))
+        self.assertFalse(SparePartMovement.objects.filter(workshop_order=self.order).exists())
+
+    def test_editing_usage_checks_only_the_difference(self):
+        mv = self.usage(self.part, 8)
+        post_workshop_usage(self.order, [mv])
+
+        mv = SparePartMovement.objects.get(pk=mv.pk)
+        mv.quantity = D(10)
+        post_workshop_usage(self.order, [mv])
+        self.assertEqual(balance(self.part), D(0))
+
+        mv = SparePartMovement.objects.get(pk=mv.pk)
+        mv.quantity = D(11)
+        with self.assertRaises(InsufficientStock):
+            post_workshop_usage(self.order, [mv])
+        self.assertEqual(balance(self.part), D(0))
+
+    def test_deleted_usage_returns_stock(self):
+        mv = self.usage(self.part, 10)
+        post_workshop_usage(self.order, [mv])
+
+        # lo que se da de baja libera saldo para el consumo nuevo
+        post_workshop_usage(self.order, [self.usage(self.part, 7)], deleted=[mv])
+        self.assertEqual(balance(self.part), D(3))
+
+
+# ======================================================
+# Valuación (costo promedio y PEPS)
+# ======================================================
+class ValuationTests(TestCase):
+    def setUp(self):
+        self.part = make_part("R-001")
+        self.first = move(self.part, 10, unit_cost=D(10))
+        self.second = move(self.part, 10, unit_cost=D(20))
+
+    def test_receipts(self):
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.avg_cost, D(15))
+        self.assertEqual(part.stock_value, D(300))
+        self.assertEqual(part.fifo_value, D(300))
+
+    def test_issue_at_average_and_oldest_layers(self):
+        issue = move(self.part, -15)
+        issue.refresh_from_db()
+        self.assertEqual(issue.value_amount, D(-225))   # 15 × 15
+        self.assertEqual(issue.fifo_amount, D(-200))    # 10 × 10 + 5 × 20
+
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.avg_cost, D(15))
+        self.assertEqual(part.stock_value, D(75))
+        self.assertEqual(part.fifo_value, D(100))
+
+    def test_editing_earlier_receipt_revalues_later_issue(self):
+        issue = move(self.part, -15)
+
+        receipt = SparePartMovement.objects.get(pk=self.first.pk)
+        receipt.unit_cost = D(12)
+        receipt.save()
+
+        issue.refresh_from_db()
+        self.assertEqual(issue.value_amount, D(-240))   # promedio (120 + 200) / 20 = 16
+        self.assertEqual(issue.fifo_amount, D(-220))    # 10 × 12 + 5 × 20
+
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.avg_cost, D(16))
+        self.assertEqual(part.stock_value, D(80))
+        self.assertEqual(part.fifo_value, D(100))
+
+    def test_deleting_receipt_revalues(self):
+        move(self.part, -5)
+        SparePartMovement.objects.get(pk=self.first.pk).soft_delete()
+
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.stock_balance, D(5))
+        self.assertEqual(part.stock_value, D(100))
+        self.assertEqual(part.fifo_value, D(100))
+
+
+
+class CheckpointCorrectionTests(TestCase):
+    def setUp(self):
+        # un mes ya cerrado (el anterior al pasado)
+        first_of_month = timezone.localdate().replace(day=1)
+        self.period = month_end(first_of_month - dt.timedelta(days=40))
+        moved_on = timezone.make_aware(dt.datetime.combine(self.period.replace(day=10), dt.time(12)))
+
+        self.part = make_part("R-001")
+        self.other = make_part("R-002")
+        self.receipt = move(self.part, 10, unit_cost=D(10))
+        move(self.other, 5, unit_cost=D(20))
+        SparePartMovement.objects.update(date=moved_on)
+        build_checkpoint(self.period)
+
+    def test_correction_updates_only_affected_part_rows(self):
+        other_row = InventoryCheckpoint.objects.get(period=self.period, spare_part=self.other)
+
+        receipt = SparePartMovement.objects.get(pk=self.receipt.pk)
+        receipt.unit_cost = D(12)
+        receipt.save()
+
+        row = InventoryCheckpoint.objects.get(period=self.period, spare_part=self.part)
+        self.assertEqual((row.quantity, row.stock_value, row.fifo_value), (D(10), D(120), D(120)))
+        self.assertEqual(InventoryCheckpoint.objects.get(period=self.period, spare_part=self.other).pk, other_row.pk)
+        self.assertEqual(valuation_as_of(self.period), _values_from(None, self.period))
+
+    def test_deleting_old_movement_drops_its_row(self):
+        SparePartMovement.objects.filter(pk=self.receipt.pk).delete()
+
+        self.assertFalse(InventoryCheckpoint.objects.filter(spare_part=self.part).exists())
+        self.assertTrue(InventoryCheckpoint.objects.filter(spare_part=self.other).exists())
+        self.assertEqual(valuation_as_of(self.period), _values_from(None, self.period))
+
+# ======================================================
+# Entrada a inventario de compras (post_purchase_movements)
+# ======================================================
+class PurchasePostingTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(nombre="Refaccionaria del Norte")
+        self.part = make_part("R-001")
+        self.other = make_part("R-002")
+
+    def test_posts_one_movement_per_item(self):
+        purchase = make_purchase(self.supplier, [(self.part, 5, 10), (self.other, 2, 30), (self.part, 1, 16)])
+        movements = post_purchase_movements(purchase)
+
+        self.assertEqual(len(movements), 3)
+        self.assertEqual(balance(self.part), D(6))
+        self.assertEqual(balance(self.other), D(2))
+        part = SparePart.objects.get(pk=self.part.pk)
+        self.assertEqual(part.stock_value, D(66))
+        self.assertEqual(part.avg_cost, D(11))
+
+    def test_is_idempotent(self):
+        purchase = make_purchase(self.supplier, [(self.part, 5, 10)])
+        post_purchase_movements(purchase)
+        self.assertEqual(post_purchase_movements(purchase), [])
+
+        self.assertEqual(SparePartMovement.objects.filter(purchase_item__purchase=purchase).count(), 1)
+        self.assertEqual(balance(self.part), D(5))
+
+    def test_posts_only_items_added_later(self):
+        purchase = make_purchase(self.supplier, [(self.part, 5, 10)])
+        post_purchase_movements(purchase)
+        SparePartPurchaseItem.objects.create(purchase=purchase, spare_part=self.other, quantity=D(3), unit_price=D(7))
+
+        movements = post_purchase_movements(purchase)
+        self.assertEqual([m.spare_part_id for m in movements], [self.other.pk])
+        self.assertEqual(balance(self.part), D(5))
+        self.assertEqual(balance(self.other), D(3))
+
+    def test_rejects_unapproved_purchase(self):
+        purchase = make_purchase(self.supplier, [(self.part, 5, 10)], status=SparePartPurchase.Status.DRAFT)
+        with self.assertRaises(ValidationError):
+            post_purchase_movements(purchase)
+        self.assertEqual(balance(self.part), D(0))
+
+
+# ======================================================
+# Pagos a proveedor: aplicación automática
+# ======================================================
+class AllocateOldestFirstTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(nombre="Refaccionaria del Norte")
+        self.part = make_part("R-001")
+        # se crean fuera de orden: manda la fecha, no el id
+        self.newest = make_purchase(self.supplier, [(self.part, 1, 100)], date=dt.date(2026, 3, 1))
+        self.oldest = make_purchase(self.supplier, [(self.part, 1, 100)], date=dt.date(2026, 1, 1))
+        self.middle = make_purchase(self.supplier, [(self.part, 1, 100)], date=dt.date(2026, 2, 1))
+
+    def payment(self, amount, date=dt.date(2026, 3, 15)):
+        return SupplierPayment(supplier=self.supplier, date=date, amount=D(amount))
+
+    def applied(self, payment):
+        return dict(
+            SupplierPaymentAllocation.objects.filter(payment=payment).values_list("purchase_id", "amount_applied")
+        )
+
+    def test_pays_oldest_first(self):
+        payment = self.payment(150)
+        allocate_oldest_first(payment)
+
+        self.assertIsNotNone(payment.pk)
+        self.assertEqual(self.applied(payment), {self.oldest.pk: D(100), self.middle.pk: D(50)})
+        self.assertEqual(SparePartPurchase.objects.with_totals().get(pk=self.middle.pk).balance, D(50))
+
+    def test_next_payment_continues_with_remaining_balance(self):
+        allocate_oldest_first(self.payment(150))
+        payment = self.payment(120)
+        allocate_oldest_first(payment)
+        self.assertEqual(self.applied(payment), {self.middle.pk: D(50), self.newest.pk: D(70)})
+
+    def test_ignores_purchases_after_payment_date(self):
+        with self.assertRaises(ValidationError) as ctx:
+            allocate_oldest_first(self.payment(250, date=dt.date(2026, 2, 15)))
+        self.assertIn("amount", ctx.exception.message_dict)
+
+    def test_amount_over_pending_balance_saves_nothing(self):
+        payment = self.payment("300.01")
+        with self.assertRaises(ValidationError) as ctx:
+            allocate_oldest_first(payment)
+
+        self.assertIn("amount", ctx.exception.message_dict)
+        self.assertIsNone(payment.pk)
+        self.assertFalse(SupplierPayment.objects.exists())
+        self.assertFalse(SupplierPaymentAllocation.objects.exists())
+
+    def test_rejects_non_positive_amount(self):
+        with self.assertRaises(ValidationError) as ctx:
+            allocate_oldest_first(self.payment(0))
+        self.assertIn("amount", ctx.exception.message_dict)
+
+    def test_supplier_without_open_purchases(self):
+        other = Supplier.objects.create(nombre="Sin compras")
+        with self.assertRaises(ValidationError):
+            allocate_oldest_first(SupplierPayment(supplier=other, date=dt.date(2026, 3, 15), amount=D(10)))
+
+    def test_backdated_payment_sees_later_allocations(self):
+        allocate_oldest_first(self.payment(100, date=dt.date(2026, 3, 1)))   # cubre la del 1 de enero
+
+        backdated = self.payment(100, date=dt.date(2026, 2, 1))
+        allocate_oldest_first(backdated)
+        self.assertEqual(self.applied(backdated), {self.middle.pk: D(100)})
+
+        with self.assertRaises(ValidationError):
+            allocate_oldest_first(self.payment(100, date=dt.date(2026, 2, 1)))
+        balances = SparePartPurchase.objects.with_totals().values_list("balance_amount", flat=True)
+        self.assertTrue(all(b >= 0 for b in balances))
+
+
+# ======================================================
+# Cuentas por pagar: saldo a la fecha de corte
+# ======================================================
+class PayablesAsOfTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(nombre="Refaccionaria del Norte")
+        self.purchase = make_purchase(self.supplier, [(make_part("R-001"), 1, 100)], date=dt.date(2026, 1, 10))
+
+    def pay(self, amount, date, **kwargs):
+        payment = SupplierPayment.objects.create(supplier=self.supplier, date=date, amount=D(amount), **kwargs)
+        SupplierPaymentAllocation.objects.create(payment=payment, purchase=self.purchase, amount_applied=D(amount))
+        return payment
+
+    def balance_at(self, as_of):
+        return list(open_purchases(as_of, self.supplier.pk).values_list("balance_amount", flat=True))
+
+    def test_payments_after_cut_off_do_not_count(self):
+        self.pay(30, dt.date(2026, 1, 20))
+        self.pay(70, dt.date(2026, 3, 1))
+
+        self.assertEqual(self.balance_at(dt.date(2026, 1, 31)), [D(70)])
+        self.assertEqual(self.balance_at(dt.date(2026, 3, 31)), [])
+
+        (row,) = aging_by_supplier(dt.date(2026, 2, 15))
+        self.assertEqual(row["d31_60"], D(70))
+        self.assertEqual(row["total"], D(70))
+
+    def test_void_and_deleted_payments_do_not_count(self):
+        self.pay(30, dt.date(2026, 1, 20), status=SupplierPayment.Status.VOID)
+        deleted = self.pay(20, dt.date(2026, 1, 21))
+        SupplierPayment.objects.filter(pk=deleted.pk).update(deleted=True)
+
+        self.assertEqual(self.balance_at(dt.date(2026, 1, 31)), [D(100)])
+
+
+# ======================================================
+# Importación del catálogo
+# ======================================================
+CATALOG_CSV = """codigo,nombre,unidad,stock_minimo,existencia,costo_unitario
+R-001,,,5,,
+R-002,Balata,juego,2,10,150
+R-003,,,,,
+R-004,Banda,,-1,,
+R-002,Balata repetida,,,,
+"""
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.existing = make_part("R-001", name="Filtro de aceite")
+
+    def run_import(self, dry_run):
+        return import_parts(read_rows(io.BytesIO(CATALOG_CSV.encode("utf-8")), "catalogo.csv"), dry_run=dry_run)
+
+    def test_dry_run_writes_nothing(self):
+        result = self.run_import(dry_run=True)
+
+        self.assertEqual(result.rows, 5)
+        self.assertEqual((result.created, result.updated, result.stock_rows), (1, 1, 1))
+        self.assertEqual([e.line for e in result.errors], [4, 5, 6])
+        self.assertFalse(SparePart.objects.filter(code="R-002").exists())
+        self.assertEqual(SparePart.objects.get(code="R-001").min_stock, D(0))
+        self.assertFalse(SparePartMovement.objects.exists())
+
+    def test_apply_then_reapply(self):
+        result = self.run_import(dry_run=False)
+        self.assertEqual((result.created, result.updated, result.movements), (1, 1, 1))
+
+        existing = SparePart.objects.get(code="R-001")
+        self.assertEqual(existing.name, "Filtro de aceite")  # celda vacía: se conserva
+        self.assertEqual(existing.min_stock, D(5))
+        created = SparePart.objects.get(code="R-002")
+        self.assertEqual((created.name, created.unit, created.min_stock), ("Balata", "juego", D(2)))
+        self.assertEqual(created.stock_balance, D(10))
+        self.assertEqual(created.stock_value, D(1500))
+        self.assertEqual(created.movements.get().movement_type, "INITIAL")
+
+        again = self.run_import(dry_run=False)
+        self.assertEqual((again.created, again.updated, again.movements), (0, 0, 0))
+        self.assertEqual(again.unchanged, 2)
+        self.assertEqual([w.code for w in again.warnings], ["R-002"])
+        self.assertEqual(SparePart.objects.filter(code__in=["R-001", "R-002"]).count(), 2)
+        self.assertEqual(balance(created), D(10))
+        self.assertEqual(SparePartMovement.objects.count(), 1)
+
+    def test_xlsx(self):
+        from openpyxl import Workbook
+
+        wb = Workbook()
+        wb.active.append(["Código", "Nombre", "Existencia", "Costo unitario"])
+        wb.active.append([1234, "Bujía", 4, 55.5])   # Excel guarda números, no texto
+        wb.active.append(["R-001", None, None, None])
+        buf = io.BytesIO()
+        wb.save(buf)
+        buf.seek(0)
+
+        result = import_parts(read_rows(buf, "catalogo.xlsx"), dry_run=False)
+        self.assertEqual((result.created, result.unchanged, result.errors), (1, 1, []))
+        part = SparePart.objects.get(code="1234")
+        self.assertEqual(part.stock_balance, D(4))
+        self.assertEqual(part.stock_value, D("222.00"))
+
+    def test_deleted_part_is_reported(self):
+        SparePart.objects.filter(pk=self.existing.pk).update(deleted=True)
+        result = self.run_import(dry_run=True)
+        self.assertIn(2, [e.line for e in result.errors])
+
+
+# ======================================================
+# Sugerencias de reorden: caché
+# ======================================================
+class ReorderCacheTests(TestCase):
+    def setUp(self):
+        reorder.clear_cache()
+        self.addCleanup(reorder.clear_cache)
+        self.supplier = Supplier.objects.create(nombre="Refaccionaria del Norte")
+        self.part = make_part("R-001")
+        self.purchase = make_purchase(self.supplier, [(self.part, 10, 5)], date=timezone.localdate())
+        post_purchase_movements(self.purchase)
+        truck = Truck.objects.create(placas="ABC-123", numero_economico="T-01")
+        self.order = WorkshopOrder.objects.create(truck=truck, estado="ABIERTA", descripcion="Servicio")
+
+    def use(self, qty):
+        return SparePartMovement.objects.create(
+            spare_part=self.part, movement_type="WORKSHOP_USAGE", quantity=-D(qty), workshop_order=self.order,
+        )
+
+    def row(self):
+        return next(r for r in reorder.reorder_report(include_all=True) if r["id"] == self.part.pk)
+
+    def test_late_commit_inside_margin_is_picked_up(self):
+        self.use(3)
+        self.assertEqual(self.row()["usage_short"], D(3))
+
+        # guardado antes de la marca de la lectura anterior, confirmado después
+        late = self.use(2)
+        SparePartMovement.objects.filter(pk=late.pk).update(updated_at=timezone.now() - dt.timedelta(seconds=60))
+        self.assertEqual(self.row()["usage_short"], D(5))
+
+    def test_purchase_status_change_refreshes_usual_supplier(self):
+        self.use(3)
+        self.assertEqual(self.row()["supplier_id"], self.supplier.pk)
 
-# Create your tests here.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.purchase.status = SparePartPurchase.Status.REJECTED
+            self.purchase.save(update_fields=["status", "updated_at"])
+        self.assertIsNone(self.row()["supplier_id"])
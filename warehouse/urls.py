@@ -5,7 +5,11 @@ app_name = "warehouse"
 
 urlpatterns = [
     path("", SparePartListView.as_view(), name="sparepart_list"),
+    path("valuacion/", InventoryValuationView.as_view(), name="valuation"),
+    path("cxp/antiguedad/", PayablesAgingView.as_view(), name="payables_aging"),
+    path("reorden/", ReorderReportView.as_view(), name="reorder"),
     path("nuevo/", SparePartCreateView.as_view(), name="sparepart_create"),
+    path("importar/", SparePartImportView.as_view(), name="sparepart_import"),
     path("<int:pk>/editar/", SparePartUpdateView.as_view(), name="sparepart_update"),
     path("<int:pk>/", SparePartDetailView.as_view(), name="sparepart_detail"),
     path("<int:pk>/eliminar/", SparePartSoftDeleteView.as_view(), name="sparepart_delete"),
@@ -1,19 +1,25 @@
 # warehouse/views.py
 
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q, Exists, OuterRef
+from django.db.models import F, Q, Prefetch
 from django.urls import reverse_lazy
-from django.http import HttpResponseRedirect
-from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView, View
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView, View, TemplateView, FormView
 from django.db import transaction
+from django.core.exceptions import ValidationError
 from decimal import Decimal
 from django.forms import inlineformset_factory
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.utils import timezone
 
-from .models import SparePart, SparePartPurchase, SparePartMovement, SupplierPayment, SupplierPaymentAllocation
+from .models import SparePart, SparePartPurchase, SupplierPayment, SupplierPaymentAllocation
 from .forms import (
     SparePartForm,
     SparePartSearchForm,
+    InventoryValuationForm,
+    PayablesAgingForm,
+    SparePartImportForm,
     SparePartPurchaseForm,
     SparePartPurchaseItemFormSet,
     SparePartPurchaseStatusForm,
@@ -22,6 +28,9 @@ from .forms import (
 )
 
 from common.mixins import AlmacenRequiredMixin
+from warehouse.services import catalog_import, payables, payments, reorder
+from warehouse.services.purchases import post_purchase_movements
+from warehouse.services.valuation import COST_PLACES, latest_checkpoint, valuation_as_of, valuation_report, valuation_totals
 
 
 
@@ -61,6 +70,14 @@ class SparePartListView(AlmacenRequiredMixin, ListView):
         return q.split() if q else []
 
     # ---------- filtros ----------
+    # stock_balance es una columna (saldo mantenido): filtrar/ordenar por stock no agrega
+    SPAREPART_ORDERING = {
+        "name": ("name", "id"),
+        "code": ("code",),
+        "stock": ("stock_balance", "name"),
+        "-stock": ("-stock_balance", "name"),
+    }
+
     def _filter_spareparts(self, qs):
         for token in self._q_tokens():
             qs = qs.filter(
@@ -68,7 +85,26 @@ class SparePartListView(AlmacenRequiredMixin, ListView):
                 Q(name__icontains=token) |
                 Q(description__icontains=token)
             )
-        return qs.order_by("name")
+
+        stock = self.request.GET.get("stock") or ""
+        if stock == "low":
+            qs = qs.filter(stock_balance__lte=F("min_stock"))
+        elif stock == "out":
+            qs = qs.filter(stock_balance__lte=0)
+        elif stock == "available":
+            qs = qs.filter(stock_balance__gt=0)
+
+        sort = self.request.GET.get("sort") or "name"
+        return qs.order_by(*self.SPAREPART_ORDERING.get(sort, self.SPAREPART_ORDERING["name"]))
+
+    # total / pagado / saldo vienen anotados (with_totals): ordenar no agrega consultas
+    PURCHASE_ORDERING = {
+        "date": ("-date", "-created_at", "-id"),
+        "balance": ("balance_amount", "-date", "-id"),
+        "-balance": ("-balance_amount", "-date", "-id"),
+        "total": ("total_amount", "-date", "-id"),
+        "-total": ("-total_amount", "-date", "-id"),
+    }
 
     def _filter_purchases(self, qs):
         # ajusta campos si tu modelo difiere
@@ -78,7 +114,12 @@ class SparePartListView(AlmacenRequiredMixin, ListView):
                 Q(notes__icontains=token) |
                 Q(supplier__nombre__icontains=token)
             )
-        return qs.select_related("supplier").order_by("-date", "-created_at", "-id")
+        sort = self.request.GET.get("psort") or "date"
+        return (
+            qs.with_totals()
+            .select_related("supplier")
+            .order_by(*self.PURCHASE_ORDERING.get(sort, self.PURCHASE_ORDERING["date"]))
+        )
 
     def _filter_payments(self, qs):
         for token in self._q_tokens():
@@ -150,6 +191,199 @@ class SparePartListView(AlmacenRequiredMixin, ListView):
 
         return ctx
 
+class InventoryValuationView(AlmacenRequiredMixin, TemplateView):
+    """
+    Valuación del almacén (costo promedio y PEPS).
+    - Sin fecha: valuación vigente, leída de columnas de SparePart.
+    - Con fecha (as_of): cierre mensual más cercano + movimientos posteriores.
+    - ?export=csv: el reporte completo en CSV (streaming), para auditoría.
+    """
+    template_name = "warehouse/valuation.html"
+    paginate_by = 50
+
+    CSV_HEADER = ["Código", "Refacción", "Unidad", "Existencia", "Costo promedio", "Valor promedio", "Valor PEPS"]
+
+    def get(self, request, *args, **kwargs):
+        form = InventoryValuationForm(request.GET or None)
+        data = form.cleaned_data if form.is_valid() else {}
+        self.form = form
+        self.as_of = data.get("as_of")
+        self.tokens = (data.get("q") or "").split()
+
+        if request.GET.get("export") == "csv":
+            return self.export_csv()
+        return super().get(request, *args, **kwargs)
+
+    def _rows(self):
+        if self.as_of:
+            return self._as_of_rows(self.as_of, self.tokens)
+        rows = valuation_report()
+        for token in self.tokens:
+            rows = rows.filter(Q(code__icontains=token) | Q(name__icontains=token))
+        return rows, valuation_totals(rows)
+
+    def export_csv(self):
+        rows, _totals = self._rows()
+        if not isinstance(rows, list):
+            rows = rows.iterator(chunk_size=2000)
+        stamp = (self.as_of or timezone.localdate()).strftime("%Y%m%d")
+
+        def lines():
+            for r in rows:
+                yield [
+                    r["code"], r["name"], r["unit"], r["stock_balance"],
+                    r["avg_cost"] if r["avg_cost"] is not None else "",
+                    r["stock_value"], r["fifo_value"],
+                ]
+
+        resp = StreamingHttpResponse(
+            payables.iter_csv(self.CSV_HEADER, lines()), content_type="text/csv; charset=utf-8",
+        )
+        resp["Content-Disposition"] = f'attachment; filename="valuacion-inventario-{stamp}.csv"'
+        return resp
+
+    def _as_of_rows(self, as_of, tokens):
+        values = valuation_as_of(as_of)
+        parts = SparePart.objects.filter(pk__in=list(values))
+        for token in tokens:
+            parts = parts.filter(Q(code__icontains=token) | Q(name__icontains=token))
+
+        rows = []
+        for part in parts.order_by("code").values("id", "code", "name", "unit"):
+            v = values[part["id"]]
+            if not (v["quantity"] or v["stock_value"] or v["fifo_value"]):
+                continue
+            qty = v["quantity"]
+            rows.append({
+                **part,
+                "stock_balance": qty,
+                "avg_cost": (v["stock_value"] / qty).quantize(COST_PLACES) if qty > 0 else None,
+                "stock_value": v["stock_value"],
+                "fifo_value": v["fifo_value"],
+            })
+        totals = {
+            "quantity": sum((r["stock_balance"] for r in rows), Decimal("0")),
+            "stock_value": sum((r["stock_value"] for r in rows), Decimal("0")),
+            "fifo_value": sum((r["fifo_value"] for r in rows), Decimal("0")),
+        }
+        return rows, totals
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        rows, totals = self._rows()
+
+        paginator = Paginator(rows, self.paginate_by)
+        try:
+            page_obj = paginator.page(self.request.GET.get("page", 1))
+        except PageNotAnInteger:
+            page_obj = paginator.page(1)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages)
+
+        ctx.update({
+            "form": self.form,
+            "as_of": self.as_of,
+            "checkpoint": latest_checkpoint(self.as_of) if self.as_of else None,
+            "rows": page_obj.object_list,
+            "page_obj": page_obj,
+            "paginator": paginator,
+            "is_paginated": paginator.num_pages > 1,
+            "totals": totals,
+        })
+        return ctx
+
+
+class PayablesAgingView(AlmacenRequiredMixin, TemplateView):
+    """
+    Antigüedad de saldos de proveedores (cuentas por pagar).
+    - Sin proveedor: resumen por proveedor en cubetas 0–30/31–60/61–90/90+.
+    - ?supplier=<id>: detalle de compras abiertas de ese proveedor.
+    - ?export=csv: el mismo reporte en CSV (streaming).
+    """
+    template_name = "warehouse/payables_aging.html"
+    paginate_by = 25
+
+    def get(self, request, *args, **kwargs):
+        form = PayablesAgingForm(request.GET or None)
+        data = form.cleaned_data if form.is_valid() else {}
+        self.form = form
+        self.as_of = data.get("as_of") or timezone.localdate()
+        self.supplier = data.get("supplier")
+
+        if request.GET.get("export") == "csv":
+            return self.export_csv()
+        return super().get(request, *args, **kwargs)
+
+    def export_csv(self):
+        stamp = self.as_of.strftime("%Y%m%d")
+        if self.supplier:
+            header, rows = payables.detail_csv_rows(self.as_of, self.supplier.pk)
+            filename = f"cxp-antiguedad-{self.supplier.pk}-{stamp}.csv"
+        elif self.request.GET.get("detail") == "1":
+            header, rows = payables.detail_csv_rows(self.as_of)
+            filename = f"cxp-antiguedad-detalle-{stamp}.csv"
+        else:
+            header, rows = payables.summary_csv_rows(self.as_of)
+            filename = f"cxp-antiguedad-{stamp}.csv"
+
+        resp = StreamingHttpResponse(payables.iter_csv(header, rows), content_type="text/csv; charset=utf-8")
+        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return resp
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx.update({
+            "form": self.form,
+            "as_of": self.as_of,
+            "supplier": self.supplier,
+            "buckets": payables.AGING_BUCKETS,
+        })
+
+        if self.supplier:
+            paginator = Paginator(payables.aging_detail(self.as_of, self.supplier.pk), self.paginate_by)
+            try:
+                page_obj = paginator.page(self.request.GET.get("page", 1))
+            except PageNotAnInteger:
+                page_obj = paginator.page(1)
+            except EmptyPage:
+                page_obj = paginator.page(paginator.num_pages)
+            ctx.update({
+                "purchases": list(payables.with_age(page_obj.object_list, self.as_of)),
+                "page_obj": page_obj,
+                "paginator": paginator,
+                "is_paginated": paginator.num_pages > 1,
+            })
+        else:
+            rows = payables.aging_by_supplier(self.as_of)
+            ctx["rows"] = rows
+            ctx["totals"] = payables.aging_totals(rows)
+        return ctx
+
+
+class ReorderReportView(AlmacenRequiredMixin, TemplateView):
+    """
+    Sugerencias de reorden por velocidad de consumo (30/90 días),
+    agrupadas por proveedor habitual. ?all=1 muestra también las
+    refacciones con consumo que aún no necesitan compra.
+    """
+    template_name = "warehouse/reorder.html"
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        include_all = self.request.GET.get("all") == "1"
+        rows = reorder.reorder_report(include_all=include_all)
+        ctx.update({
+            "groups": reorder.group_by_supplier(rows),
+            "parts_count": len(rows),
+            "to_order": sum(1 for r in rows if r["suggested_qty"]),
+            "est_total": sum((r["est_amount"] for r in rows), Decimal("0")),
+            "include_all": include_all,
+            "lead_days": settings.REORDER_LEAD_TIME_DAYS,
+            "target_days": settings.REORDER_TARGET_DAYS,
+        })
+        return ctx
+
+
 class SparePartCreateView(AlmacenRequiredMixin, CreateView):
     model = SparePart
     form_class = SparePartForm
@@ -162,6 +396,45 @@ class SparePartCreateView(AlmacenRequiredMixin, CreateView):
         return resp
 
 
+class SparePartImportView(AlmacenRequiredMixin, FormView):
+    """
+    Importación masiva del catálogo (CSV/XLSX). "Vista previa" analiza el
+    archivo sin escribir (diff y errores por renglón); "Importar" aplica el
+    upsert por código y las existencias iniciales de los renglones válidos.
+    """
+    form_class = SparePartImportForm
+    template_name = "warehouse/sparepart_import.html"
+    preview_limit = 300
+
+    def form_valid(self, form):
+        upload = form.cleaned_data["file"]
+        dry_run = "apply" not in self.request.POST
+        try:
+            result = catalog_import.import_parts(
+                catalog_import.read_rows(upload.file, upload.name),
+                dry_run=dry_run,
+                source_name=upload.name,
+            )
+        except ValueError as e:
+            form.add_error("file", str(e))
+            return self.form_invalid(form)
+
+        if not dry_run:
+            messages.success(
+                self.request,
+                f"Catálogo importado: {result.created} nuevas, {result.updated} actualizadas, "
+                f"{result.movements} existencias iniciales.",
+            )
+            if result.errors:
+                messages.warning(self.request, f"{len(result.errors)} renglón(es) con error no se importaron.")
+
+        return self.render_to_response(self.get_context_data(
+            form=form,
+            result=result,
+            changes=result.changes[:self.preview_limit],
+        ))
+
+
 class SparePartUpdateView(AlmacenRequiredMixin, UpdateView):
     model = SparePart
     form_class = SparePartForm
@@ -277,16 +550,7 @@ class SparePartPurchaseCreateView(AlmacenRequiredMixin, CreateView):
 
         # === crear movimientos SOLO si quedó APPROVED ===
         if purchase.status == SparePartPurchase.Status.APPROVED:
-            supplier_name = purchase.supplier.nombre if purchase.supplier else "—"
-            for item in saved_items:
-                SparePartMovement.objects.create(
-                    spare_part=item.spare_part,
-                    movement_type="PURCHASE",
-                    quantity=item.quantity,   # positiva
-                    unit_cost=item.unit_price,
-                    purchase_item=item,
-                    description=f"Compra #{purchase.id} - {supplier_name}",
-                )
+            post_purchase_movements(purchase)
             messages.success(self.request, "Compra registrada y aprobada (inventario actualizado).")
         else:
             messages.success(self.request, "Compra registrada y enviada a aprobación (inventario pendiente).")
@@ -306,7 +570,7 @@ class SparePartPurchaseDetailView(AlmacenRequiredMixin, DetailView):
     context_object_name = "purchase"
 
     def get_queryset(self):
-        return SparePartPurchase.objects.filter(deleted=False)
+        return SparePartPurchase.objects.filter(deleted=False).with_totals()
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -341,30 +605,7 @@ class SparePartPurchaseUpdateStatusView(AlmacenRequiredMixin, UpdateView):
 
         # ✅ Si está APPROVED, aseguramos movimientos (sin duplicar)
         if purchase.status == SparePartPurchase.Status.APPROVED:
-            supplier_name = purchase.supplier.nombre if purchase.supplier else "—"
-
-            # Solo items sin movimiento
-            items_qs = purchase.items.filter(deleted=False).annotate(
-                has_move=Exists(
-                    SparePartMovement.objects.filter(
-                        deleted=False,
-                        movement_type="PURCHASE",
-                        purchase_item=OuterRef("pk"),
-                    )
-                )
-            ).filter(has_move=False)
-
-            created = 0
-            for item in items_qs:
-                SparePartMovement.objects.create(
-                    spare_part=item.spare_part,
-                    movement_type="PURCHASE",
-                    quantity=item.quantity,
-                    unit_cost=item.unit_price,
-                    purchase_item=item,
-                    description=f"Compra #{purchase.id} - {supplier_name}",
-                )
-                created += 1
+            created = len(post_purchase_movements(purchase))
 
             if created:
                 messages.success(self.request, f"Estatus actualizado. Inventario aplicado ({created} movimiento(s)).")
@@ -448,6 +689,9 @@ class SupplierPaymentCreateView(AlmacenRequiredMixin, CreateView):
             form_kwargs={"supplier_id": supplier_id},
         )
 
+        if form.is_valid() and form.cleaned_data.get("auto_allocate"):
+            return self._auto_allocate(form, alloc_formset, supplier_id)
+
         if not (form.is_valid() and alloc_formset.is_valid()):
             messages.error(self.request, "Por favor corrige los errores del pago.")
             return self.render_to_response(self.get_context_data(form=form, alloc_formset=alloc_formset))
@@ -494,6 +738,26 @@ class SupplierPaymentCreateView(AlmacenRequiredMixin, CreateView):
         messages.success(self.request, "Pago registrado correctamente.")
         return HttpResponseRedirect(self.get_success_url())
 
+    def _auto_allocate(self, form, alloc_formset, supplier_id):
+        """Modo automático: se ignora el formset y se reparte el monto capturado."""
+        payment = form.save(commit=False)
+        if supplier_id:
+            payment.supplier_id = supplier_id
+
+        try:
+            allocations = payments.allocate_oldest_first(payment)
+        except ValidationError as e:
+            form.add_error(None, e)
+            messages.error(self.request, "No se pudo aplicar el pago automáticamente.")
+            return self.render_to_response(self.get_context_data(form=form, alloc_formset=alloc_formset))
+
+        self.object = payment
+        messages.success(
+            self.request,
+            f"Pago registrado y aplicado a {len(allocations)} compra(s), la más antigua primero.",
+        )
+        return HttpResponseRedirect(self.get_success_url())
+
 
 class SupplierPaymentDetailView(AlmacenRequiredMixin, DetailView):
     model = SupplierPayment
@@ -508,9 +772,10 @@ class SupplierPaymentDetailView(AlmacenRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        purchases = SparePartPurchase.all_objects.with_totals().select_related("supplier")
         ctx["allocations"] = (
             SupplierPaymentAllocation.objects.filter(deleted=False, payment=self.object)
-            .select_related("purchase", "purchase__supplier")
+            .prefetch_related(Prefetch("purchase", queryset=purchases))
             .order_by("id")
         )
         return ctx
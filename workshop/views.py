@@ -13,6 +13,7 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .models import WorkshopOrder, MaintenanceRequest
 from .forms import WorkshopOrderForm, WorkshopOrderSearchForm, SparePartUsageFormSet
 from warehouse.models import SparePartMovement
+from warehouse.services.stock import InsufficientStock, post_workshop_usage
 
 from common.mixins import TallerRequiredMixin
 
@@ -119,7 +120,9 @@ class WorkshopOrderUpdateView(TallerRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        if self.request.method == "POST":
+        if "formset" in kwargs:
+            pass  # POST rechazado (p.ej. sin stock): conserva captura y errores
+        elif self.request.method == "POST":
             ctx["formset"] = SparePartUsageFormSet(
                 self.request.POST,
                 instance=self.object,
@@ -144,32 +147,34 @@ class WorkshopOrderUpdateView(TallerRequiredMixin, UpdateView):
     def form_valid_with_items(self, form, formset):
         """
         Guarda la OT + refacciones usadas.
-        Convierte cantidad positiva en movimiento negativo (salida de inventario).
+        Convierte cantidad positiva en movimiento negativo (salida de inventario)
+        y rechaza el consumo si alguna refacción no tiene stock suficiente
+        (ver warehouse.services.stock.post_workshop_usage).
         """
-        ot = form.save()
-
         instances = formset.save(commit=False)
+        deleted = [obj for obj in formset.deleted_objects if isinstance(obj, SparePartMovement)]
 
-        for obj in formset.deleted_objects:
-            if isinstance(obj, SparePartMovement):
-                obj.deleted = True
-                obj.save(update_fields=["deleted"])
-
-        for mv in instances:
-            mv.movement_type = "WORKSHOP_USAGE"
-            mv.workshop_order = ot
-
-            if mv.quantity is None:
-                continue
-
-            if mv.quantity > 0:
-                mv.quantity = -mv.quantity
-
-            mv.save()
+        try:
+            with transaction.atomic():
+                ot = form.save()
+                post_workshop_usage(ot, instances, deleted)
+        except InsufficientStock as e:
+            self._attach_shortages(formset, e.shortages)
+            messages.error(self.request, "No hay stock suficiente para las refacciones marcadas.")
+            return self.render_to_response(self.get_context_data(form=form, formset=formset))
 
         messages.success(self.request, "Orden de taller actualizada correctamente.")
         return HttpResponseRedirect(self.success_url)
 
+    @staticmethod
+    def _attach_shortages(formset, shortages):
+        by_part = {s.part_id: s for s in shortages}
+        for f in formset.forms:
+            part = f.cleaned_data.get("spare_part") if hasattr(f, "cleaned_data") else None
+            shortage = by_part.get(getattr(part, "pk", None))
+            if shortage and not f.cleaned_data.get("DELETE"):
+                f.add_error("quantity", str(shortage))
+
 
 class WorkshopOrderDetailView(TallerRequiredMixin, DetailView):
     model = WorkshopOrder